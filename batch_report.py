@@ -0,0 +1,56 @@
+"""
+批量报表 CLI（不启动 Streamlit）：对多天 × 多 shift × 多劳务组跑 Dashboard 同款计算，
+输出 KPI 表、员工汇总表、各组效率最低 3 人，Parquet 或 CSV
+
+    python batch_report.py data/scanRecord_*.xlsx --out reports/2025-12 \\
+        --start 2025-12-01 --end 2025-12-31 --workers 8 --format parquet
+"""
+import argparse
+import os
+import time
+from datetime import date
+
+from report_engine import (
+    CUBE_MODE, DEFAULT_BIN_MINUTES, LABOR_GROUPS, SHIFT_OPTIONS, TIME_BIN_OPTIONS,
+    load_exports, run_batch_report, write_report,
+)
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Headless Operational Excellence batch report")
+    ap.add_argument("exports", nargs="+", help="scan export files (.xlsx / .csv)")
+    ap.add_argument("--out", default="reports", help="output directory")
+    ap.add_argument("--start", type=date.fromisoformat, help="first shift date (YYYY-MM-DD), default: first day in data")
+    ap.add_argument("--end", type=date.fromisoformat, help="last shift date (YYYY-MM-DD), default: last day in data")
+    ap.add_argument("--shifts", nargs="+", choices=SHIFT_OPTIONS, help="shifts to report, default: all")
+    ap.add_argument("--groups", nargs="+", choices=list(LABOR_GROUPS), help="labor groups to report, default: all")
+    ap.add_argument("--bin-minutes", type=int, choices=TIME_BIN_OPTIONS, default=DEFAULT_BIN_MINUTES,
+                    help="time bin size in minutes")
+    ap.add_argument("--format", choices=["parquet", "csv"], default="parquet")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    ap.add_argument("--mode", choices=["exact", "hll"], default=CUBE_MODE, help="distinct-count mode")
+    ap.add_argument("--streaming", action="store_true", help="stream large exports in chunks")
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    t0 = time.perf_counter()
+    ds = load_exports(args.exports, mode=args.mode, streaming=args.streaming)
+    t1 = time.perf_counter()
+    tables = run_batch_report(
+        ds, args.start, args.end, shifts=args.shifts, groups=args.groups, workers=args.workers,
+        bin_minutes=args.bin_minutes,
+    )
+    t2 = time.perf_counter()
+    paths = write_report(tables, args.out, args.format)
+
+    print(f"loaded {len(args.exports)} export(s) in {t1 - t0:.1f}s; "
+          f"{len(tables['kpi'])} day×shift reports in {t2 - t1:.1f}s")
+    for path in paths:
+        print(f"  wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
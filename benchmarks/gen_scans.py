@@ -0,0 +1,116 @@
+"""
+合成扫描导出（Operation time / Operator / Waybill No. / Site），用于 benchmark：
+- 劳务组 JOU / RD / pr + sorter，人数随行数增长；JOU 主要在 Early / Mid，RD 主要在 Night
+- 每小时货量有早晚高峰，Night 班跨午夜（23:00 - 次日 07:00）
+- 员工效率不均（lognormal），同一运单会被扫多次，少量脏数据（坏时间、空 Operator）
+
+    python benchmarks/gen_scans.py 1000000 benchmarks/data/scans_1000000.csv
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+SHIFT_HOURS = {  # shift -> 覆盖的小时
+    "Early": range(7, 15),
+    "Mid": range(15, 23),
+    "Night": [23, 0, 1, 2, 3, 4, 5, 6],
+}
+HOME_SHIFT_MIX = {  # 劳务组 -> 各 shift 的人员占比
+    "JOU": {"Early": 0.5, "Mid": 0.4, "Night": 0.1},
+    "RD": {"Early": 0.1, "Mid": 0.2, "Night": 0.7},
+    "pr": {"Early": 0.4, "Mid": 0.3, "Night": 0.3},
+}
+HOURLY_VOLUME = np.array([  # 0 点 .. 23 点的相对货量
+    5, 5, 4, 4, 3, 3, 4, 6, 9, 10, 10, 9, 8, 8, 9, 10, 11, 12, 11, 9, 8, 7, 6, 5,
+], dtype=float)
+SORTER_SHARE = 0.3
+TIME_FORMAT = "%H:%M:%S %d/%m/%Y"
+
+
+def team_sizes(n_rows: int) -> dict:
+    scale = int(np.clip(n_rows // 5000, 1, 6))
+    return {"JOU": 40 * scale, "RD": 20 * scale, "pr": 10 * scale}
+
+
+def make_operators(n_rows: int, rng: np.random.Generator) -> pd.DataFrame:
+    rows = []
+    for group, size in team_sizes(n_rows).items():
+        shifts = rng.choice(list(HOME_SHIFT_MIX[group]), size, p=list(HOME_SHIFT_MIX[group].values()))
+        for i, shift in enumerate(shifts):
+            rows.append((f"{group}{i:03d}", shift))
+    ops = pd.DataFrame(rows, columns=["Operator", "shift"])
+    ops["skill"] = rng.lognormal(0.0, 0.35, len(ops))
+    return ops
+
+
+def generate_scans(n_rows: int, n_days: int = 7, start: str = "2025-12-01", seed: int = 0,
+                   dirty_fraction: float = 0.001) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    ops = make_operators(n_rows, rng)
+
+    # 时间：天 × 小时（按货量曲线）× 秒
+    hour = rng.choice(24, n_rows, p=HOURLY_VOLUME / HOURLY_VOLUME.sum())
+    day = rng.integers(0, n_days, n_rows)
+    sec = rng.integers(0, 3600, n_rows)
+    t = np.datetime64(start, "s") + (day * 86400 + hour * 3600 + sec).astype("timedelta64[s]")
+
+    # Operator：30% 是 sorter，其余从该小时所属 shift 的员工里按效率加权抽
+    operator = np.full(n_rows, "sorter", dtype=object)
+    is_labor = rng.random(n_rows) >= SORTER_SHARE
+    for shift, hours in SHIFT_HOURS.items():
+        rows = np.flatnonzero(is_labor & np.isin(hour, list(hours)))
+        pool = ops[ops["shift"] == shift]
+        if len(pool) == 0 or len(rows) == 0:
+            continue
+        p = pool["skill"].to_numpy() / pool["skill"].sum()
+        operator[rows] = pool["Operator"].to_numpy()[rng.choice(len(pool), len(rows), p=p)]
+
+    # 运单：平均每单被扫约 1.6 次
+    waybill = (100_000_000_000 + rng.integers(0, max(1, int(n_rows / 1.6)), n_rows)).astype(str)
+
+    time_str = pc.strftime(pa.array(t), format=TIME_FORMAT).to_numpy(zero_copy_only=False).astype(object)
+    dirty = rng.random(n_rows) < dirty_fraction
+    time_str[dirty & (rng.random(n_rows) < 0.5)] = "garbage"
+    operator[dirty & (rng.random(n_rows) < 0.5)] = ""
+
+    return pd.DataFrame({
+        "Operation time": time_str,
+        "Operator": operator,
+        "Waybill No.": waybill,
+        "Site": "MIA.H",
+    })
+
+
+def write_scans(df: pd.DataFrame, path) -> Path:
+    """
+    .csv 任意行数；.xlsx 受 Excel 单表 1,048,576 行限制
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix.lower() == ".csv":
+        df.to_csv(path, index=False)
+    elif path.suffix.lower() == ".xlsx":
+        if len(df) >= 1_048_576:
+            raise ValueError("xlsx exports are limited to 1,048,575 data rows; use .csv")
+        df.to_excel(path, index=False)
+    else:
+        raise ValueError(f"unsupported export type: {path.suffix}")
+    return path
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Generate a synthetic scan export")
+    ap.add_argument("rows", type=int)
+    ap.add_argument("out", help=".csv or .xlsx")
+    ap.add_argument("--days", type=int, default=7)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+    write_scans(generate_scans(args.rows, n_days=args.days, seed=args.seed), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+分阶段 benchmark：每个数据规模生成一份合成导出，逐个阶段计时 + 记录内存峰值，
+结果逐行追加到 benchmarks/results.jsonl，跑完和上一次同规模的结果对比
+
+    python benchmarks/run_benchmarks.py --rows 10000 100000 1000000 --label my-change
+    python benchmarks/run_benchmarks.py --rows 10000 100000 1000000 10000000   # 完整规模梯度
+
+默认只跑到 100 万行；1000 万行的合成原始导出本身约 2.6 GB（object 文本列），需要内存足够的机器
+立方体固定用精确模式（mode="exact"，不受 OEA_CUBE_MODE 影响），各次结果可比；
+cube_build[hll] 另建一份 hll 立方体，记录大小（cube_mb）和各 shift 去重计数相对 exact 的误差（count_rel_err）
+
+阶段：excel_load / csv_load（冷启动，含列式缓存写入）、columnar_load（命中缓存）、preprocess、
+preprocess[polars] / shift_pivot[Night, pandas|polars]（装了 polars 时）、
+filter_by_shift（整表掩码 / 按时间排序后二分）、scan_gaps、build_pivot、cube_build / cube_build[hll]、run_pipeline、daily_rollup / daily_trend、
+archive_write / archive_read、relative_efficiency、
+各图表构建 + 序列化
+"""
+import argparse
+import importlib.util
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import psutil
+import plotly.io as pio
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.gen_scans import generate_scans, write_scans  # noqa: E402
+from charts import (  # noqa: E402
+    fig_sorter_vs_total, fig_labor_group_lines, make_employee_curve_fig, make_quadrant_fig, make_trend_fig,
+)
+from daily_rollup import RollupTable, daily_trend  # noqa: E402
+from idle_gaps import scan_gaps  # noqa: E402
+from labor_groups import group_relative_efficiency  # noqa: E402
+from report_engine import (  # noqa: E402
+    DEFAULT_BIN_MINUTES, DEFAULT_SORTER_NAME, LABOR_GROUPS, SHIFT_OPTIONS, SHIFT_WINDOWS, TIME_BIN_OPTIONS,
+    build_pivot, day_to_date, file_md5, filter_by_shift, run_pipeline, run_group, shift_pivot,
+)
+from scan_archive import archive_frame, read_archive  # noqa: E402
+from scan_cube import ScanCube  # noqa: E402
+from scan_ingest import ScanDataset, preprocess, read_export_cached, sort_by_time  # noqa: E402
+
+DATA_DIR = ROOT / "benchmarks" / "data"
+HAVE_POLARS = importlib.util.find_spec("polars") is not None  # 装了 polars 才测 polars 后端
+RESULTS_PATH = ROOT / "benchmarks" / "results.jsonl"
+EXCEL_MAX_ROWS = 200_000  # 更大的规模只测 CSV（写 / 读大 xlsx 本身要几分钟）
+
+
+# ======================
+# 计时 + 内存
+# ======================
+class RssSampler:
+    """
+    后台线程每隔几毫秒采样一次进程 RSS，记录阶段内的峰值（含 Arrow / C 扩展的分配）
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self._proc = psutil.Process()
+        self._interval = interval
+        self._stop = threading.Event()
+        self.start_rss = self.peak_rss = self._proc.memory_info().rss
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self.peak_rss = max(self.peak_rss, self._proc.memory_info().rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, self._proc.memory_info().rss)
+
+
+class Bench:
+    def __init__(self, run_id: str, label: str, rows: int, use_tracemalloc: bool):
+        self.base = {
+            "run": run_id,
+            "label": label,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_rev": git_rev(),
+            "python": platform.python_version(),
+            "rows": rows,
+        }
+        self.use_tracemalloc = use_tracemalloc
+        self.records = []
+
+    def measure(self, stage: str, fn, *args, **extra):
+        """
+        跑一个阶段：wall time、RSS 峰值 / 增量，可选 tracemalloc 分配峰值（会拖慢 Python 层代码）
+        """
+        if self.use_tracemalloc:
+            tracemalloc.start()
+        with RssSampler() as rss:
+            t0 = time.perf_counter()
+            out = fn(*args)
+            seconds = time.perf_counter() - t0
+        rec = {
+            **self.base,
+            "stage": stage,
+            "seconds": round(seconds, 6),
+            "peak_rss_mb": round(rss.peak_rss / 2**20, 1),
+            "rss_delta_mb": round((rss.peak_rss - rss.start_rss) / 2**20, 1),
+        }
+        if self.use_tracemalloc:
+            rec["peak_alloc_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            tracemalloc.stop()
+        if hasattr(out, "__len__"):
+            rec["out_len"] = len(out)
+        rec.update(extra)
+        self.records.append(rec)
+        print(f"  {stage:<34} {seconds:9.3f}s  peak RSS {rec['peak_rss_mb']:8.1f} MB  (+{rec['rss_delta_mb']:.1f})")
+        return out
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ======================
+# 各阶段
+# ======================
+def ensure_export(rows: int, suffix: str, seed: int) -> Path:
+    path = DATA_DIR / f"scans_{rows}_s{seed}{suffix}"
+    if not path.exists():
+        print(f"  generating {path.name} …")
+        write_scans(generate_scans(rows, seed=seed), path)
+    return path
+
+
+def figure_stage(bench: Bench, stage: str, build, *args):
+    """
+    图表构建 + JSON 序列化（= 发给浏览器的 payload）一起算
+    """
+    def run():
+        fig = build(*args)
+        return pio.to_json(fig, validate=False)
+    payload = bench.measure(stage, run)
+    bench.records[-1]["payload_bytes"] = len(payload)
+
+
+def hll_count_error(exact: ScanCube, hll: ScanCube, bin_minutes: int = DEFAULT_BIN_MINUTES) -> float:
+    """
+    hll 立方体相对 exact 的去重计数误差：各 shift 整段日期的 pivot 上 Σ|hll - exact| / Σexact，取最大
+    """
+    day_lo, day_hi = exact.day_range()
+    worst = 0.0
+    for start, end in SHIFT_WINDOWS.values():
+        a, b = (c.query(day_lo, day_hi, start, end, bin_minutes)["pivot"] for c in (hll, exact))
+        a, b = a.align(b, fill_value=0)
+        worst = max(worst, float(np.abs(a.to_numpy() - b.to_numpy()).sum() / max(b.to_numpy().sum(), 1)))
+    return worst
+
+
+def bench_size(bench: Bench, rows: int, seed: int, excel_max_rows: int):
+    csv_path = ensure_export(rows, ".csv", seed)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache_dir = Path(cache_dir)
+        if rows <= excel_max_rows:
+            xlsx_path = ensure_export(rows, ".xlsx", seed)
+            bench.measure("excel_load", read_export_cached, xlsx_path, file_md5(xlsx_path), cache_dir)
+        digest = file_md5(csv_path)
+        bench.measure("csv_load", read_export_cached, csv_path, digest, cache_dir)
+        raw = bench.measure("columnar_load", read_export_cached, csv_path, digest, cache_dir)
+
+        df = bench.measure("preprocess", preprocess, raw, "pandas")
+        if HAVE_POLARS:
+            bench.measure("preprocess[polars]", preprocess, raw, "polars")
+            d0, d1 = day_to_date(df["op_day"].min()), day_to_date(df["op_day"].max())
+            for backend in ("pandas", "polars"):
+                bench.measure(f"shift_pivot[Night, {backend}]", shift_pivot, raw, d0, d1, SHIFT_OPTIONS[-1],
+                              DEFAULT_BIN_MINUTES, backend)
+        del raw
+
+    d0, d1 = day_to_date(df["op_day"].min()), day_to_date(df["op_day"].max())
+    filtered = {}
+    for shift in SHIFT_OPTIONS:
+        filtered[shift] = bench.measure(f"filter_by_shift[{shift}]", filter_by_shift, df, d0, d1, shift)
+    bench.measure("build_pivot[Night]", build_pivot, filtered[SHIFT_OPTIONS[-1]])
+    del filtered
+    rows = bench.measure("sort_by_time", sort_by_time, df)
+    for shift in SHIFT_OPTIONS:
+        bench.measure(f"filter_by_shift[{shift}, sorted]", filter_by_shift, rows, d0, d1, shift, True)
+        bench.measure(f"filter_by_shift[{shift}, sorted, 1 day]", filter_by_shift, rows, d0, d0, shift, True)
+    for shift in SHIFT_OPTIONS:
+        bench.measure(f"scan_gaps[{shift}]", scan_gaps, filter_by_shift(rows, d0, d1, shift, True))
+    del rows
+
+    cube = bench.measure("cube_build", ScanCube.from_frame, df, "exact")
+    bench.records[-1]["cube_mb"] = round(cube.nbytes() / 2**20, 1)
+    hll = bench.measure("cube_build[hll]", ScanCube.from_frame, df, "hll")
+    bench.records[-1].update(cube_mb=round(hll.nbytes() / 2**20, 1), count_rel_err=round(hll_count_error(cube, hll), 5))
+    del hll
+    ds = ScanDataset("bench", cube)
+    ds.operator_groups(LABOR_GROUPS)
+    res = None
+    for shift in SHIFT_OPTIONS:
+        res = bench.measure(f"run_pipeline[{shift}]", run_pipeline, ds, d0, d1, shift)
+    night = SHIFT_OPTIONS[-1]
+    for bm in TIME_BIN_OPTIONS:
+        if bm != DEFAULT_BIN_MINUTES:
+            bench.measure(f"run_pipeline[{night}, {bm}min]", run_pipeline, ds, d0, d1, night, bm)
+
+    # 每日汇总：整段日期一次物化，之后趋势视图只读汇总
+    day_lo, day_hi = ds.cube.day_range()
+    rollup = bench.measure("daily_rollup[all shifts]", RollupTable().ensure, ds, day_lo, day_hi)
+    trend = bench.measure(f"daily_trend[{night}]", daily_trend, rollup.table, day_lo, day_hi, night, "JOU")
+    figure_stage(bench, "make_trend_fig[JOU]", make_trend_fig, trend, "JOU", "Avg relative efficiency")
+
+    # 归档：读取成本应只与所选日期范围有关
+    with tempfile.TemporaryDirectory() as archive_dir:
+        archive_dir = Path(archive_dir)
+        bench.measure("archive_write", archive_frame, df, "bench", archive_dir)
+        bench.measure("archive_read[Night, 1 day]", read_archive, d0, d0, night, archive_dir)
+        bench.measure("archive_read[Night, all days]", read_archive, d0, d1, night, archive_dir)
+
+    pivot, time_bins = res["pivot"], res["time_bins"]
+    bench.measure("relative_efficiency[all groups]", group_relative_efficiency, pivot, res["row_groups"])
+
+    figure_stage(bench, "fig_sorter_vs_total", fig_sorter_vs_total, pivot, time_bins, DEFAULT_SORTER_NAME)
+    figure_stage(bench, "fig_labor_group_lines", fig_labor_group_lines, pivot, time_bins, res["row_groups"])
+    for code in LABOR_GROUPS:
+        g = run_group(res, code)
+        if g["emp"].empty:
+            continue
+        figure_stage(bench, f"make_employee_curve_fig[{code}]", make_employee_curve_fig, g["emp"], code)
+        figure_stage(bench, f"make_quadrant_fig[{code}]", make_quadrant_fig, g["sum"], code)
+
+
+# ======================
+# 结果文件
+# ======================
+def load_results(path: Path) -> list:
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_with_previous(records: list, history: list):
+    """
+    和结果文件里上一次同规模的 run 逐阶段对比
+    """
+    if not records:
+        return
+    rows = records[0]["rows"]
+    previous = [r for r in history if r["rows"] == rows]
+    if not previous:
+        return
+    prev_run = previous[-1]["run"]
+    prev = {r["stage"]: r for r in previous if r["run"] == prev_run}
+    print(f"  vs previous run {prev_run} ({prev[next(iter(prev))]['label'] or prev[next(iter(prev))]['git_rev']}):")
+    for r in records:
+        p = prev.get(r["stage"])
+        if p and p["seconds"] > 0:
+            print(f"    {r['stage']:<32} {r['seconds'] / p['seconds']:6.2f}x time  "
+                  f"{r['peak_rss_mb'] - p['peak_rss_mb']:+8.1f} MB peak RSS")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Per-stage dashboard benchmarks on synthetic scan exports")
+    ap.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--label", default="", help="free-form tag stored with the results")
+    ap.add_argument("--out", type=Path, default=RESULTS_PATH)
+    ap.add_argument("--excel-max-rows", type=int, default=EXCEL_MAX_ROWS)
+    ap.add_argument("--tracemalloc", action="store_true", help="also record Python allocation peaks (slower)")
+    args = ap.parse_args(argv)
+
+    run_id = f"{date.today():%Y%m%d}-{uuid.uuid4().hex[:6]}"
+    history = load_results(args.out)
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    for rows in args.rows:
+        print(f"[{rows:,} rows]")
+        bench = Bench(run_id, args.label, rows, args.tracemalloc)
+        bench_size(bench, rows, args.seed, args.excel_max_rows)
+        with open(args.out, "a") as f:
+            for rec in bench.records:
+                f.write(json.dumps(rec) + "\n")
+        compare_with_previous(bench.records, history)
+    print(f"results appended to {args.out} (run {run_id})")
+
+
+if __name__ == "__main__":
+    main()
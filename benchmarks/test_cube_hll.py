@@ -0,0 +1,61 @@
+"""
+hll 立方体（scan_cube.py，mode="hll"）相对 exact 的大小和精度（pytest）：
+- 合成导出上 hll 立方体必须比 exact 小，否则这个模式没有存在的意义
+- 各 shift × 时间粒度的去重计数误差 Σ|hll - exact| / Σexact 不超过 HLL_MAX_REL_ERR
+- 流式逐块构建 / 合并两份立方体与一次性构建结果相同
+
+    python -m pytest benchmarks/test_cube_hll.py -q
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.gen_scans import generate_scans  # noqa: E402
+from benchmarks.run_benchmarks import hll_count_error  # noqa: E402
+from report_engine import SHIFT_WINDOWS, TIME_BIN_OPTIONS  # noqa: E402
+from scan_cube import ScanCube  # noqa: E402
+from scan_ingest import preprocess  # noqa: E402
+
+HLL_TEST_ROWS = int(os.environ.get("OEA_HLL_TEST_ROWS", "200000"))  # 合成扫描行数
+HLL_MAX_REL_ERR = 0.01
+CHUNK_ROWS = 30_000
+SEED = 0
+
+
+@pytest.fixture(scope="module")
+def scans():
+    return preprocess(generate_scans(HLL_TEST_ROWS, seed=SEED), "pandas")
+
+
+@pytest.fixture(scope="module")
+def cubes(scans) -> dict:
+    return {mode: ScanCube.from_frame(scans, mode) for mode in ("exact", "hll")}
+
+
+def test_hll_cube_is_smaller_than_exact(cubes):
+    assert cubes["hll"].nbytes() < cubes["exact"].nbytes()
+
+
+@pytest.mark.parametrize("bin_minutes", TIME_BIN_OPTIONS)
+def test_hll_counts_close_to_exact(cubes, bin_minutes):
+    assert hll_count_error(cubes["exact"], cubes["hll"], bin_minutes) <= HLL_MAX_REL_ERR
+
+
+def test_incremental_build_matches_one_shot(scans, cubes):
+    streamed = ScanCube("hll")
+    for i in range(0, len(scans), CHUNK_ROWS):
+        streamed.add_frame(scans.iloc[i: i + CHUNK_ROWS])
+    merged = ScanCube.from_frame(scans.iloc[::2], "hll")
+    merged.merge(ScanCube.from_frame(scans.iloc[1::2], "hll"))
+
+    day_lo, day_hi = cubes["hll"].day_range()
+    start, end = next(iter(SHIFT_WINDOWS.values()))
+    expected = cubes["hll"].query(day_lo, day_hi, start, end)["pivot"]
+    for cube in (streamed, merged):
+        assert cube.nbytes() == cubes["hll"].nbytes()
+        assert cube.query(day_lo, day_hi, start, end)["pivot"].reindex_like(expected).equals(expected)
@@ -0,0 +1,172 @@
+"""
+内存回归测试（pytest）：每个阶段在 tracemalloc 下单独跑一遍，分配峰值不能超过
+    MEMORY_CEILINGS[阶段] × 输入大小 + MEMORY_SLACK_MB
+防止防御性 .copy() / 整表中间结果悄悄回到流水线里
+
+    python -m pytest benchmarks/test_memory.py -q
+    OEA_MEMORY_TEST_ROWS=1000000 OEA_MEMORY_TEST_OPERATORS=100000 python -m pytest benchmarks/test_memory.py -q
+
+- 明细阶段（preprocess -> 立方体 -> run_pipeline）用 MEMORY_TEST_ROWS 行合成导出；
+  pivot / 效率表 / 图表阶段用 MEMORY_TEST_OPERATORS 名员工 × 一个班的 5 分钟时间段的合成 pivot，
+  真实数据的 pivot 只有几十人，输入比固定开销还小，多复制一份也看不出来
+- 输入大小 = 该阶段主要输入的大小：preprocess 是原始导出的列缓冲区（不含文本对象本身，
+  复制 object 列只复制指针），之后各阶段是明细 / pivot，run_pipeline 是立方体
+- 上限是默认规模下实测比值加约 10% 余量，阶段里多复制一份输入就会超限；规模调大时比值不变或变小
+- tracemalloc 记录 numpy / pandas 缓冲区的全部分配；这里的阶段都不经过 Arrow
+- MEMORY_SLACK_MB 只吸收与数据量无关的固定开销，远小于任何一个阶段的输入
+"""
+import os
+import sys
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.gen_scans import generate_scans  # noqa: E402
+from charts import make_employee_curve_fig, make_quadrant_fig  # noqa: E402
+from idle_gaps import scan_gaps  # noqa: E402
+from labor_groups import classify_operators  # noqa: E402
+from report_engine import (  # noqa: E402
+    LABOR_GROUPS, SHIFT_OPTIONS, SHIFT_WINDOWS, build_company_relative_efficiency_dfs, build_employee_efficiency_df,
+    build_pivot, day_to_date, filter_by_shift, finish_pivot, run_group, run_pipeline,
+)
+from scan_cube import ScanCube  # noqa: E402
+from scan_ingest import ScanDataset, concat_scans, preprocess, sort_by_time  # noqa: E402
+
+MEMORY_TEST_ROWS = int(os.environ.get("OEA_MEMORY_TEST_ROWS", "300000"))  # 明细阶段的合成扫描行数
+MEMORY_TEST_OPERATORS = int(os.environ.get("OEA_MEMORY_TEST_OPERATORS", "30000"))  # pivot 阶段的合成员工数
+MEMORY_SLACK_MB = 0.25
+WARMUP_ROWS = 5_000  # 先用小数据跑一遍，把各库首次调用时的延迟导入 / 初始化排除在测量之外
+WARMUP_OPERATORS = 1_000
+PIVOT_BIN_MINUTES = 5
+SEED = 0
+MEMORY_CEILINGS = {  # 阶段 -> 分配峰值 / 输入大小 的上限（括号里是默认规模实测）
+    "preprocess": 3.3,            # (2.98) 相对原始导出的列缓冲区
+    "sort_by_time": 1.85,         # (1.68) 输出一份 + 排序下标
+    "concat_scans[by_time]": 1.65,  # (1.51)
+    "filter_by_shift": 0.62,      # (0.55) 只复制选中的行
+    "filter_by_shift[sorted]": 0.48,  # (0.43)
+    "build_pivot": 2.1,           # (1.87)
+    "scan_gaps": 2.25,            # (2.04)
+    "cube_build": 2.8,            # (2.54) 排序键 + 重排后的 waybill / 时间 + 立方体本身
+    "run_pipeline": 0.55,         # (0.47) 相对立方体：只合并选中的 cell，不碰明细
+    "run_group": 1.8,             # (1.65)
+    "build_employee_efficiency_df": 0.3,  # (0.26) 只取出选中的行
+    "build_company_relative_efficiency_dfs": 1.85,  # (1.67)
+    "make_employee_curve_fig": 6.1,  # (5.59) 分位数带 + 前后 N 名
+    "make_quadrant_fig": 1.4,     # (1.23)
+}
+
+
+def nbytes(obj, deep: bool = True) -> int:
+    if isinstance(obj, (list, tuple)):
+        return sum(nbytes(o, deep) for o in obj)
+    if isinstance(obj, ScanCube):
+        return obj.nbytes()
+    return int(obj.memory_usage(deep=deep).sum())
+
+
+def measure(name: str, base, fn, *args, results: list, deep: bool = True):
+    """
+    跑一个阶段，记录 (阶段, 分配峰值, 输入大小, 上限)；base 是计算输入大小的对象
+    """
+    tracemalloc.start()
+    try:
+        out = fn(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    size = nbytes(base, deep)
+    limit = MEMORY_CEILINGS[name] * size + MEMORY_SLACK_MB * 2**20
+    results.append((name, peak, size, limit))
+    return out
+
+
+def scan_stages(rows: int, seed: int) -> list:
+    """
+    明细阶段：合成导出 -> preprocess -> 排序 / 过滤 / pivot / 间隔 -> 立方体 -> run_pipeline
+    """
+    results = []
+    raw = generate_scans(rows, seed=seed)
+    df = measure("preprocess", raw, preprocess, raw, "pandas", results=results, deep=False)
+    del raw
+
+    shuffled = df.take(np.random.default_rng(seed).permutation(len(df)))
+    shuffled.index = pd.RangeIndex(len(shuffled))
+    rows_sorted = measure("sort_by_time", shuffled, sort_by_time, shuffled, results=results)
+    halves = [shuffled.iloc[: len(df) // 2], shuffled.iloc[len(df) // 2:]]
+    measure("concat_scans[by_time]", halves, concat_scans, halves, True, results=results)
+    del shuffled, halves
+
+    d0, d1 = day_to_date(df["op_day"].min()), day_to_date(df["op_day"].max())
+    night = SHIFT_OPTIONS[-1]
+    filtered = measure("filter_by_shift", df, filter_by_shift, df, d0, d1, night, results=results)
+    measure("build_pivot", filtered, build_pivot, filtered, results=results)
+    del filtered
+    filtered = measure("filter_by_shift[sorted]", rows_sorted, filter_by_shift, rows_sorted, d0, d1, night, True,
+                       results=results)
+    measure("scan_gaps", filtered, scan_gaps, filtered, results=results)
+    del filtered
+
+    cube = measure("cube_build", df, ScanCube.from_frame, df, results=results)
+    ds = ScanDataset("memory", cube, rows_sorted)
+    ds.operator_groups(LABOR_GROUPS)
+    measure("run_pipeline", cube, run_pipeline, ds, d0, d1, night, 5, results=results)
+    return results
+
+
+def wide_pivot(n_operators: int, seed: int) -> dict:
+    """
+    n_operators 名员工（四种名称前缀轮流，三种属于劳务组）× 一个班的 5 分钟时间段的合成 pivot，
+    打包成 run_pipeline 结果的样子
+    """
+    rng = np.random.default_rng(seed)
+    prefixes = ["JOU", "RD", "pr", "sorter"]
+    names = pd.Index([f"{prefixes[i % 4]}{i:06d}" for i in range(n_operators)])
+    start, end = SHIFT_WINDOWS[SHIFT_OPTIONS[0]]
+    codes = np.arange(start * 60 // PIVOT_BIN_MINUTES, end * 60 // PIVOT_BIN_MINUTES, dtype=np.int16)
+    counts = rng.poisson(3.0, (n_operators, len(codes)))
+    counts[rng.random(counts.shape) < 0.1] = 0
+    pivot, time_bins = finish_pivot(pd.DataFrame(counts, index=names, columns=codes), PIVOT_BIN_MINUTES)
+    return {"pivot": pivot, "time_bins": time_bins, "row_groups": classify_operators(pivot.index, LABOR_GROUPS)}
+
+
+def pivot_stages(n_operators: int, seed: int) -> list:
+    """
+    pivot 阶段：劳务组拆分 -> 效率表 -> 图表
+    """
+    results = []
+    res = wide_pivot(n_operators, seed)
+    pivot = res["pivot"]
+    group = next(iter(LABOR_GROUPS))
+    g = measure("run_group", pivot, run_group, res, group, results=results)
+    measure("build_employee_efficiency_df", pivot, build_employee_efficiency_df, pivot, LABOR_GROUPS[group],
+            results=results)
+    measure("build_company_relative_efficiency_dfs", pivot, build_company_relative_efficiency_dfs, pivot,
+            LABOR_GROUPS[group], results=results)
+    measure("make_employee_curve_fig", g["emp"], make_employee_curve_fig, g["emp"], group, PIVOT_BIN_MINUTES,
+            results=results)
+    measure("make_quadrant_fig", g["sum"], make_quadrant_fig, g["sum"], group, results=results)
+    return results
+
+
+@pytest.fixture(scope="module")
+def measured() -> dict:
+    scan_stages(WARMUP_ROWS, SEED)
+    pivot_stages(WARMUP_OPERATORS, SEED)
+    results = scan_stages(MEMORY_TEST_ROWS, SEED) + pivot_stages(MEMORY_TEST_OPERATORS, SEED)
+    return {name: (peak, size, limit) for name, peak, size, limit in results}
+
+
+@pytest.mark.parametrize("name", list(MEMORY_CEILINGS))
+def test_stage_within_memory_ceiling(measured: dict, name: str):
+    peak, size, limit = measured[name]
+    assert peak <= limit, (
+        f"{name}: peak {peak / 2**20:.2f} MB > limit {limit / 2**20:.2f} MB "
+        f"(input {size / 2**20:.2f} MB, ratio {peak / max(size, 1):.2f}, ceiling {MEMORY_CEILINGS[name]})"
+    )
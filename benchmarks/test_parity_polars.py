@@ -0,0 +1,143 @@
+"""
+Polars 后端一致性测试（pytest；没装 polars 时整个文件跳过）：pandas 与 polars 两条路径的
+preprocess 输出、各 shift × 时间粒度 × 日期范围的 pivot 必须逐位相同
+
+    python -m pytest benchmarks/test_parity_polars.py -q
+    OEA_PARITY_ROWS=100000 OEA_PARITY_EXPORTS=data/scanRecord_1766632272775.xlsx python -m pytest benchmarks/test_parity_polars.py -q
+
+数据：合成导出（较高脏数据比例）+ 人为构造的边界情况（Operator 前后空格 / "nan"、float 单号、
+混合类型单号、已是时间类型的时间列、需要 dayfirst 兜底解析的时间写法）；CSV 路径走 scan_csv，
+另有一份每种缺失值写法都出现的 CSV；OEA_PARITY_EXPORTS 可以带上真实导出（os.pathsep 分隔）
+"""
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("polars")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.gen_scans import generate_scans  # noqa: E402
+from report_engine import SHIFT_OPTIONS, TIME_BIN_OPTIONS, day_to_date, file_md5, shift_pivot  # noqa: E402
+from scan_ingest import preprocess, read_export_cached  # noqa: E402
+
+PARITY_ROWS = int(os.environ.get("OEA_PARITY_ROWS", "5000"))  # 合成导出行数
+PARITY_EXPORTS = [p for p in os.environ.get("OEA_PARITY_EXPORTS", "").split(os.pathsep) if p]  # 额外的真实导出
+SEED = 0
+RANGES = ["all", "first", "last"]  # 全范围 / 首日 / 末日
+PANDAS_NA_TOKENS = [  # pd.read_csv 默认当作缺失的写法（pandas 文档 na_values），独立于 polars_backend 里的列表
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+CASES = ["synthetic", "messy", "float_waybill", "mixed_waybill", "datetime_column", "csv", "csv_null_tokens"]
+CASES += [Path(p).name for p in PARITY_EXPORTS]
+
+
+def edge_cases(raw: pd.DataFrame, seed: int) -> dict:
+    """
+    在合成导出的基础上构造各类边界输入：名称 -> 原始 DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    n = len(raw)
+    pick = rng.random(n)
+
+    messy = raw.copy()
+    ops = messy["Operator"].astype(object)
+    ops[pick < 0.02] = " " + ops[pick < 0.02]
+    ops[(pick >= 0.02) & (pick < 0.03)] = ops[(pick >= 0.02) & (pick < 0.03)] + "  "
+    ops[(pick >= 0.03) & (pick < 0.035)] = "NaN"
+    ops[(pick >= 0.035) & (pick < 0.04)] = None
+    messy["Operator"] = ops
+    times = messy["Operation time"].astype(object)
+    t = pd.to_datetime(times, format="%H:%M:%S %d/%m/%Y", errors="coerce")
+    alt = (pick >= 0.04) & (pick < 0.05) & t.notna().to_numpy()
+    times[alt] = t[alt].dt.strftime("%Y-%m-%d %H:%M:%S")  # 固定格式解析失败、dayfirst 兜底能解析
+    messy["Operation time"] = times
+    wb = messy["Waybill No."].astype(object)
+    wb[(pick >= 0.05) & (pick < 0.055)] = None
+    messy["Waybill No."] = wb
+
+    float_wb = raw.copy()
+    float_wb["Waybill No."] = pd.to_numeric(float_wb["Waybill No."]).astype(float)
+    float_wb.loc[pick < 0.01, "Waybill No."] = np.nan
+
+    mixed_wb = raw.copy()
+    mixed = mixed_wb["Waybill No."].astype(object)
+    as_int = pick < 0.5
+    mixed[as_int] = pd.to_numeric(mixed[as_int]).astype(np.int64).astype(object)  # 与文本单号同值
+    mixed_wb["Waybill No."] = mixed
+
+    dt_col = raw.copy()
+    dt_col["Operation time"] = pd.to_datetime(dt_col["Operation time"], format="%H:%M:%S %d/%m/%Y", errors="coerce")
+
+    return {"synthetic": raw, "messy": messy, "float_waybill": float_wb, "mixed_waybill": mixed_wb,
+            "datetime_column": dt_col}
+
+
+def null_token_csv(raw: pd.DataFrame, path: Path) -> Path:
+    """
+    每种缺失值写法轮流出现在 Operator / Waybill No. 列里的 CSV（pd.read_csv 把它们都读成缺失）
+    """
+    out = raw.astype(str)
+    n = len(PANDAS_NA_TOKENS)
+    step = max(len(out) // (4 * n), 1)
+    for i, token in enumerate(PANDAS_NA_TOKENS):
+        out.iloc[i * step, out.columns.get_loc("Operator")] = token
+        out.iloc[(n + i) * step, out.columns.get_loc("Waybill No.")] = token
+    out.to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture(scope="module")
+def inputs(tmp_path_factory) -> dict:
+    """
+    用例名 -> (交给 shift_pivot 的数据源, pandas 路径读到的原始 DataFrame)
+    """
+    tmp = tmp_path_factory.mktemp("parity")
+    raw = generate_scans(PARITY_ROWS, n_days=3, seed=SEED, dirty_fraction=0.01).drop(columns="Site")
+    out = {name: (case, case) for name, case in edge_cases(raw, SEED).items()}
+    csv_path = tmp / "scans.csv"
+    raw.to_csv(csv_path, index=False)
+    out["csv"] = (csv_path, pd.read_csv(csv_path, dtype=str))
+    null_path = null_token_csv(raw, tmp / "null_tokens.csv")
+    out["csv_null_tokens"] = (null_path, pd.read_csv(null_path, dtype=str))
+    for path in PARITY_EXPORTS:
+        export = read_export_cached(path, file_md5(path), tmp)
+        out[Path(path).name] = (export, export)
+    return out
+
+
+@pytest.fixture(scope="module")
+def expected(inputs) -> dict:
+    return {name: preprocess(raw, backend="pandas") for name, (_, raw) in inputs.items()}
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_preprocess_matches(inputs, expected, case):
+    _, raw = inputs[case]
+    pd.testing.assert_frame_equal(expected[case], preprocess(raw, backend="polars"))
+
+
+def test_csv_null_tokens_are_missing(inputs, expected):
+    # 缺失值写法的行在两条路径里都被当作无效行丢掉
+    assert len(expected["csv_null_tokens"]) < len(expected["csv"])
+
+
+@pytest.mark.parametrize("date_range", RANGES)
+@pytest.mark.parametrize("bin_minutes", TIME_BIN_OPTIONS)
+@pytest.mark.parametrize("shift", SHIFT_OPTIONS)
+@pytest.mark.parametrize("case", CASES)
+def test_shift_pivot_matches(inputs, expected, case, shift, bin_minutes, date_range):
+    source, raw = inputs[case]
+    days = expected[case]["op_day"]
+    first, last = day_to_date(days.min()), day_to_date(days.max())
+    d0, d1 = {"all": (first, last), "first": (first, first), "last": (last, last)}[date_range]
+    want, want_bins = shift_pivot(raw, d0, d1, shift, bin_minutes, backend="pandas")
+    got, got_bins = shift_pivot(source, d0, d1, shift, bin_minutes, backend="polars")
+    pd.testing.assert_frame_equal(want, got)
+    assert want_bins == got_bins
@@ -0,0 +1,457 @@
+"""
+Dashboard 图表（只依赖 Plotly，不依赖 Streamlit）：输入 pivot / 各组效率表，输出 go.Figure
+"""
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# ======================
+# Config
+# ======================
+LARGE_TEAM_THRESHOLD = int(os.environ.get("OEA_LARGE_TEAM_THRESHOLD", "40"))  # 员工数超过它，曲线图切换成聚合视图
+LARGE_TEAM_TOP_N = int(os.environ.get("OEA_LARGE_TEAM_TOP_N", "5"))  # 聚合视图里单独画出的 top / bottom 员工数
+MAX_LABELED_BINS = 24  # 时间段多于它时（细粒度）不在每个点上写数字，避免挤在一起
+
+# ======================
+# 公共样式
+# ======================
+def style_layout_common(fig, time_bins, y_title):
+    fig.update_layout(
+        height=520,
+        plot_bgcolor="white",
+        paper_bgcolor="white",
+        margin=dict(l=62, r=26, t=24, b=54),
+        legend=dict(
+            orientation="h",
+            yanchor="top",
+            y=1.14,
+            xanchor="left",
+            x=0,
+            font=dict(size=12),
+            title=""
+        ),
+        xaxis=dict(
+            title="Time Bin",
+            type="category",
+            categoryorder="array",
+            categoryarray=time_bins,
+            showline=True,
+            linecolor="rgba(0,0,0,0.55)",
+            linewidth=1,
+            ticks="outside",
+            tickfont=dict(size=12),
+            gridcolor="rgba(0,0,0,0.05)",
+        ),
+        yaxis=dict(
+            title=y_title,
+            showline=True,
+            linecolor="rgba(0,0,0,0.55)",
+            linewidth=1,
+            ticks="outside",
+            tickfont=dict(size=12),
+            gridcolor="rgba(0,0,0,0.07)",
+            zeroline=False,
+            rangemode="tozero"
+        ),
+        hovermode="x unified",
+    )
+    return fig
+
+# ===== 图1：柱顶 total + sorter% =====
+def fig_sorter_vs_total(pivot: pd.DataFrame, time_bins: list, sorter_name: str):
+    p = pivot.reindex(columns=time_bins).apply(pd.to_numeric, errors="coerce").fillna(0)
+
+    total_series = p.sum(axis=0)
+    sorter_series = p.loc[sorter_name] if sorter_name in p.index else pd.Series(0, index=time_bins)
+    sorter_series = sorter_series.reindex(time_bins).fillna(0)
+    others_series = total_series - sorter_series
+
+    total_safe = total_series.replace(0, np.nan)
+    share_pct = (sorter_series / total_safe * 100).round(1)
+    share_text = ["" if pd.isna(v) else f"{v:.1f}%" for v in share_pct.values]
+
+    fig = go.Figure()
+
+    fig.add_bar(
+        x=time_bins,
+        y=others_series.to_numpy(np.int32),
+        name="Others (All non-sorter)",
+        hovertemplate="Time Bin: %{x}<br>Others: %{y}<extra></extra>",
+        marker=dict(opacity=0.85),
+    )
+
+    fig.add_bar(
+        x=time_bins,
+        y=sorter_series.to_numpy(np.int32),
+        name="Sorter",
+        hovertemplate=(
+            "Time Bin: %{x}<br>"
+            "Sorter: %{y}<br>"
+            "Sorter Share: %{customdata}%<extra></extra>"
+        ),
+        customdata=share_pct.values,
+        marker=dict(opacity=0.95),
+    )
+
+    labeled = len(time_bins) <= MAX_LABELED_BINS
+    fig.add_scatter(
+        x=time_bins,
+        y=total_series.to_numpy(np.int32),
+        mode="text",
+        visible=labeled,
+        text=[f"{int(v)}" for v in total_series.values],
+        textposition="top center",
+        textfont=dict(size=14),
+        showlegend=False,
+        hoverinfo="skip",
+    )
+
+    y_mid = (others_series + sorter_series / 2).to_numpy(np.float32)
+    fig.add_scatter(
+        x=time_bins,
+        y=y_mid,
+        mode="text",
+        visible=labeled,
+        text=share_text,
+        textposition="middle center",
+        textfont=dict(size=14),
+        showlegend=False,
+        hoverinfo="skip",
+    )
+
+    fig.update_layout(barmode="stack", bargap=0.28)
+    fig = style_layout_common(fig, time_bins, y_title="Scan Count")
+    return fig
+
+# ===== 图2：每个点显示数值 =====
+def fig_labor_group_lines(pivot: pd.DataFrame, time_bins: list, row_groups: pd.Series):
+    p = pivot.reindex(columns=time_bins).apply(pd.to_numeric, errors="coerce").fillna(0)
+
+    # row_groups：pivot 每行的劳务组代码，一次 groupby 得到所有组的每小时合计
+    group_sums = p.groupby(row_groups.reindex(p.index), observed=False).sum()
+
+    mode = "lines+markers+text" if len(time_bins) <= MAX_LABELED_BINS else "lines+markers"
+
+    def add_line(fig, name, y):
+        fig.add_scatter(
+            x=time_bins,
+            y=y.to_numpy(np.int32),
+            mode=mode,
+            name=name,
+            text=[int(v) for v in y.values],
+            textposition="top center",
+            textfont=dict(size=12),
+            hovertemplate=f"Time Bin: %{{x}}<br>{name}: %{{y}}<extra></extra>",
+        )
+
+    fig = go.Figure()
+    for code, y in group_sums.iterrows():
+        add_line(fig, code, y)
+
+    fig = style_layout_common(fig, time_bins, y_title="Total Volume")
+    return fig
+
+# ***************************** 各组数据可视化 *******************************************
+
+
+def packed_y(values: np.ndarray) -> np.ndarray:
+    """
+    员工 × 时间点 -> 打包成一条 trace 的 y（每个员工一段，段尾 NaN 断开），直接写进一块 float32 数组
+    """
+    y = np.full((values.shape[0], values.shape[1] + 1), np.nan, dtype=np.float32)
+    y[:, :-1] = values
+    return y.ravel()
+
+
+def add_large_team_traces(fig, plot_df: pd.DataFrame, time_bins: list, top_n: int):
+    """
+    大团队视图（全部 WebGL）：
+    - 所有员工打包成一条浅灰 trace，员工之间用 None 断开
+    - 每个 time bin 的中位数 + P25–P75 / P10–P90 分位带
+    - 只单独画平均产出 top / bottom N 的员工
+    """
+    values = plot_df.to_numpy(dtype=float)
+    n_emp, n_bins = values.shape
+
+    # 1) 背景：一条 trace 装下所有员工
+    x_packed = np.tile(np.append(np.array(time_bins, dtype=object), None), n_emp)
+    y_packed = packed_y(values)
+    fig.add_trace(go.Scattergl(
+        x=x_packed,
+        y=y_packed,
+        mode="lines",
+        name=f"All employees ({n_emp})",
+        line=dict(width=1, color="rgba(120,120,120,0.18)"),
+        hoverinfo="skip",
+    ))
+
+    # 2) 分位带（先画下沿，再画上沿 fill 到下沿）
+    q = np.percentile(values, [10, 25, 50, 75, 90], axis=0).astype(np.float32)
+    for lo, hi, name, alpha in ((0, 4, "P10–P90", 0.12), (1, 3, "P25–P75", 0.22)):
+        fig.add_trace(go.Scattergl(
+            x=time_bins, y=q[lo], mode="lines", line=dict(width=0),
+            showlegend=False, hoverinfo="skip",
+        ))
+        fig.add_trace(go.Scattergl(
+            x=time_bins, y=q[hi], mode="lines", line=dict(width=0),
+            fill="tonexty", fillcolor=f"rgba(31,119,180,{alpha})",
+            name=name, hoverinfo="skip",
+        ))
+    fig.add_trace(go.Scattergl(
+        x=time_bins,
+        y=q[2],
+        mode="lines+markers",
+        name="Median",
+        line=dict(width=2.5, color="rgb(31,119,180)"),
+        hovertemplate="Time Bin: %{x}<br>Median: %{y:.1f}<extra></extra>",
+    ))
+
+    # 3) top / bottom N 单独画
+    order = np.argsort(-values.mean(axis=1), kind="stable")
+    n = min(top_n, n_emp // 2)
+    picks = [(i, "Top") for i in order[:n]] + [(i, "Bottom") for i in order[n_emp - n:]]
+    for i, tag in picks:
+        emp = plot_df.index[i]
+        fig.add_trace(go.Scattergl(
+            x=time_bins,
+            y=values[i].astype(np.int32),
+            mode="lines+markers",
+            name=f"{tag}: {emp}",
+            line=dict(width=1.5, dash="solid" if tag == "Top" else "dot"),
+            hovertemplate=f"Time Bin: %{{x}}<br>{emp}: %{{y}}<extra></extra>",
+        ))
+
+
+def make_employee_curve_fig(
+    df_emp: pd.DataFrame,
+    title: str,
+    bin_minutes: int = 60,
+    large_team_threshold: int = LARGE_TEAM_THRESHOLD,
+    top_n: int = LARGE_TEAM_TOP_N,
+):
+    plot_df = df_emp  # 只读：下面只取值画图，不需要防御性复制
+
+    # time_bins：确保按列顺序显示
+    time_bins = [str(c).strip() for c in plot_df.columns]
+    n_emp = plot_df.shape[0]
+    large_team = n_emp > large_team_threshold
+
+    fig = go.Figure()
+
+    # 1) 员工曲线（人数多时改成聚合视图，避免几百条 SVG trace）
+    if large_team:
+        add_large_team_traces(fig, plot_df, time_bins, top_n)
+    else:
+        for emp in plot_df.index:
+            y = plot_df.loc[emp].to_numpy(np.int32)
+            fig.add_scatter(
+                x=time_bins,
+                y=y,
+                mode="lines+markers",
+                name=str(emp),
+                hovertemplate=f"Time Bin: %{{x}}<br>{emp}: %{{y}}<extra></extra>",
+            )
+
+    # 2) 全局平均值（所有员工 × 所有 time-bin）
+    if not plot_df.empty:
+        global_avg = float(np.nanmean(plot_df.to_numpy()))
+    else:
+        global_avg = 0.0
+
+    benchmark = 600 * bin_minutes / 60  # 写死：每小时 600，分钟粒度按比例换算
+
+    # 3) benchmark 横线（细线 + 无文字）
+    fig.add_hline(
+        y=benchmark,
+        line_width=1,
+        line_dash="solid",
+        line_color="rgba(0,0,0,0.55)"
+    )
+
+    # 4) 全局平均横线（细虚线 + 有文字）
+    fig.add_hline(
+        y=global_avg,
+        line_width=1,
+        line_dash="dash",
+        line_color="rgba(0,0,0,0.55)",
+        annotation_text=f"Overall Avg = {global_avg:.1f}",
+        annotation_position="bottom right",
+    )
+
+    # 5) legend 位置保持不变
+    fig.update_layout(
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.14,
+            xanchor="left",
+            x=0.02,
+        ),
+    )
+
+    # 6) 统一风格
+    fig = style_layout_common(fig, time_bins, y_title="Scan Count")
+    if large_team:
+        fig.update_layout(hovermode="closest")
+    return fig
+
+
+
+
+
+def make_quadrant_fig(df_summary: pd.DataFrame, title: str, y_ref: str = "median"):
+    # 两个坐标都是有限值的员工；只取一次行，不再 replace / dropna / copy 逐步复制
+    xy = df_summary[["Avg_Relative_Efficiency", "DeTrended_CV"]].to_numpy(dtype=float)
+    dfp = df_summary.loc[np.isfinite(xy).all(axis=1)]
+    n_emp = dfp.shape[0]
+
+    x_ref = 1.0
+    y_ref_val = dfp["DeTrended_CV"].median() if y_ref == "median" else dfp["DeTrended_CV"].mean()
+
+    x_min, x_max = float(dfp["Avg_Relative_Efficiency"].min()), float(dfp["Avg_Relative_Efficiency"].max())
+    y_min, y_max = float(dfp["DeTrended_CV"].min()), float(dfp["DeTrended_CV"].max())
+
+    x_pad = (x_max - x_min) * 0.08 if x_max > x_min else 0.2
+    y_pad = (y_max - y_min) * 0.10 if y_max > y_min else 0.2
+    x_min -= x_pad; x_max += x_pad
+    y_min = max(0, y_min - y_pad); y_max += y_pad
+
+    fig = go.Figure()
+
+    fig.add_trace(go.Scatter(
+        x=dfp["Avg_Relative_Efficiency"].to_numpy(np.float32),
+        y=dfp["DeTrended_CV"].to_numpy(np.float32),
+        mode="markers+text",
+        text=[str(i) for i in dfp.index],
+        textposition="top center",
+        hovertemplate="Employee=%{text}<br>AvgRel=%{x:.2f}<br>DeTrendedCV=%{y:.2f}<extra></extra>",
+        showlegend=False,
+    ))
+
+    # 四象限背景
+    fig.add_shape(type="rect", x0=x_min, x1=x_ref, y0=y_min, y1=y_ref_val, layer="below",
+                  line_width=0, fillcolor="rgba(0,0,0,0.03)")
+    fig.add_shape(type="rect", x0=x_ref, x1=x_max, y0=y_min, y1=y_ref_val, layer="below",
+                  line_width=0, fillcolor="rgba(0,0,0,0.03)")
+    fig.add_shape(type="rect", x0=x_min, x1=x_ref, y0=y_ref_val, y1=y_max, layer="below",
+                  line_width=0, fillcolor="rgba(220, 53, 69, 0.18)")
+    fig.add_shape(type="rect", x0=x_ref, x1=x_max, y0=y_ref_val, y1=y_max, layer="below",
+                  line_width=0, fillcolor="rgba(0,0,0,0.03)")
+
+    fig.add_vline(x=x_ref, line_width=1, line_dash="dash")
+    fig.add_hline(y=y_ref_val, line_width=1, line_dash="dash")
+
+    # 象限标签
+    x_left  = x_min + 0.5 * (x_ref - x_min)
+    x_right = x_ref + 0.5 * (x_max - x_ref)
+    y_low   = y_min + 0.5 * (y_ref_val - y_min)
+    y_high  = y_ref_val + 0.5 * (y_max - y_ref_val)
+    label_style = dict(showarrow=False, align="center",
+                       bordercolor="rgba(0,0,0,0.15)", borderwidth=1,
+                       bgcolor="rgba(255,255,255,0.9)", font=dict(size=12))
+    fig.add_annotation(x=x_left,  y=y_high, text="Low & Unstable",  **label_style)
+    fig.add_annotation(x=x_right, y=y_high, text="High & Unstable", **label_style)
+    fig.add_annotation(x=x_left,  y=y_low,  text="Low & Stable",    **label_style)
+    fig.add_annotation(x=x_right, y=y_low,  text="High & Stable",   **label_style)
+
+    fig.update_layout(
+        #title=dict(text=f"{title} (n={n_emp})", x=0.02, xanchor="left"),
+        height=520,
+        plot_bgcolor="white",
+        paper_bgcolor="white",
+        margin=dict(l=60, r=40, t=70, b=60),
+    )
+    fig.update_xaxes(
+        title="Avg Relative Efficiency (within company)",
+        range=[x_min, x_max],
+        showline=True, linecolor="rgba(0,0,0,0.55)", linewidth=1,
+        ticks="outside",
+        gridcolor="rgba(0,0,0,0.07)",
+        zeroline=False,
+    )
+    fig.update_yaxes(
+        title="De-trended CV (within company)",
+        range=[y_min, y_max],
+        showline=True, linecolor="rgba(0,0,0,0.55)", linewidth=1,
+        ticks="outside",
+        gridcolor="rgba(0,0,0,0.07)",
+        zeroline=False,
+    )
+    return fig
+
+
+# ===== 每日趋势：员工 × 日期 的汇总指标（来自 daily_rollup）=====
+def make_trend_fig(trend: pd.DataFrame, title: str, y_title: str, top_n: int = LARGE_TEAM_TOP_N):
+    """
+    trend：Operator × shift_date 指标矩阵（某天没上班为 NaN）
+    - 所有员工打包成一条浅灰 trace（WebGL）
+    - 每天的团队中位数 + P25–P75 分位带
+    - 区间均值 top / bottom N 的员工单独画
+    """
+    dates = [pd.Timestamp(d).strftime("%Y-%m-%d") for d in trend.columns]
+    values = trend.to_numpy(dtype=float)
+    n_emp = values.shape[0]
+    fig = go.Figure()
+    if n_emp == 0:
+        return style_layout_common(fig, dates, y_title=y_title)
+
+    x_packed = np.tile(np.append(np.array(dates, dtype=object), None), n_emp)
+    y_packed = packed_y(values)
+    fig.add_trace(go.Scattergl(
+        x=x_packed, y=y_packed, mode="lines", connectgaps=False,
+        name=f"All employees ({n_emp})",
+        line=dict(width=1, color="rgba(120,120,120,0.18)"),
+        hoverinfo="skip",
+    ))
+
+    with np.errstate(all="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # 某天整组没人上班：该天分位数为 NaN
+        q = np.nanpercentile(values, [25, 50, 75], axis=0).astype(np.float32)
+        mean = np.nanmean(values, axis=1)
+    fig.add_trace(go.Scattergl(x=dates, y=q[0], mode="lines", line=dict(width=0), showlegend=False, hoverinfo="skip"))
+    fig.add_trace(go.Scattergl(
+        x=dates, y=q[2], mode="lines", line=dict(width=0),
+        fill="tonexty", fillcolor="rgba(31,119,180,0.18)", name="P25–P75", hoverinfo="skip",
+    ))
+    fig.add_trace(go.Scattergl(
+        x=dates, y=q[1], mode="lines+markers", name="Team median",
+        line=dict(width=2.5, color="rgb(31,119,180)"),
+        hovertemplate="Date: %{x}<br>Median: %{y:.2f}<extra></extra>",
+    ))
+
+    ranked = np.flatnonzero(~np.isnan(mean))
+    ranked = ranked[np.argsort(-mean[ranked], kind="stable")]
+    n = min(top_n, len(ranked) // 2)
+    for i, tag in [(i, "Top") for i in ranked[:n]] + [(i, "Bottom") for i in ranked[len(ranked) - n:]]:
+        emp = trend.index[i]
+        fig.add_trace(go.Scattergl(
+            x=dates, y=values[i].astype(np.float32), mode="lines+markers",
+            name=f"{tag}: {emp}",
+            line=dict(width=1.5, dash="solid" if tag == "Top" else "dot"),
+            hovertemplate=f"Date: %{{x}}<br>{emp}: %{{y:.2f}}<extra></extra>",
+        ))
+
+    fig = style_layout_common(fig, dates, y_title=y_title)
+    fig.update_layout(hovermode="closest", xaxis_title="Shift Date")
+    return fig
+
+
+# ===== 空闲间隔直方图：一组员工的扫描间隔超过阈值的次数（来自 idle_gaps）=====
+def make_idle_hist_fig(hist: pd.Series, y_title: str = "Idle Gaps"):
+    labels = [str(b) for b in hist.index]
+    fig = go.Figure()
+    fig.add_bar(
+        x=labels,
+        y=hist.to_numpy(np.int64),
+        text=[f"{int(v):,}" for v in hist.to_numpy()],
+        textposition="outside",
+        marker_color="rgba(31,119,180,0.75)",
+        hovertemplate="Gap: %{x}<br>Count: %{y:,}<extra></extra>",
+        showlegend=False,
+    )
+    fig = style_layout_common(fig, labels, y_title=y_title)
+    fig.update_layout(height=360, xaxis_title="Gap Between Consecutive Scans")
+    return fig
@@ -0,0 +1,286 @@
+"""
+每日物化汇总：每个 (shift_date, shift, Operator) 一行——去重扫描量、有扫描的小时数、
+组内 Relative Efficiency、去趋势 Std / CV（与 Deep Dive 单日结果相同）
+- 由立方体整段日期一次算出（每个 shift 一次 cell 查询 + 一次分组归约），之后只补算缺的 / 变化了的日期
+- 多周趋势视图只读这张表，不回看逐行扫描
+- 归档的汇总落盘在 <归档>/_rollups，按每个归属日读到的分区文件判断是否过期
+
+    python daily_rollup.py            # 补算归档里新增 / 变化日期的汇总
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+
+from instrument import timed
+from labor_groups import group_relative_efficiency
+from report_engine import CUBE_MODE, LABOR_GROUPS, SHIFT_OPTIONS, SHIFT_WINDOWS
+from scan_archive import ARCHIVE_DIR, archive_days, partition_dir, read_days
+from scan_cube import ScanCube, split_keys
+from scan_ingest import ScanDataset
+
+# ======================
+# Config
+# ======================
+ROLLUP_COLUMNS = [
+    "shift_date", "shift", "group", "Operator", "scans", "active_hours",
+    "Avg_Relative_Efficiency", "DeTrended_Std", "DeTrended_CV",
+]
+TREND_METRICS = {  # 趋势视图可选指标 -> 显示名
+    "Avg_Relative_Efficiency": "Avg relative efficiency",
+    "DeTrended_CV": "De-trended CV",
+    "scans": "Distinct scans",
+    "scans_per_active_hour": "Scans per active hour",
+}
+ROLLUP_DIRNAME = "_rollups"  # 归档汇总目录：rollups.parquet + versions.json
+ROLLUP_MAX_TABLES = int(os.environ.get("OEA_ROLLUP_MAX_TABLES", "8"))  # 进程内最多保留几个数据集的汇总表
+
+
+def empty_rollup() -> pd.DataFrame:
+    return pd.DataFrame({
+        "shift_date": pd.Series(dtype="datetime64[ns]"),
+        "shift": pd.Series(dtype=str),
+        "group": pd.Series(dtype=str),
+        "Operator": pd.Series(dtype=str),
+        "scans": pd.Series(dtype=np.int64),
+        "active_hours": pd.Series(dtype=np.int64),
+        "Avg_Relative_Efficiency": pd.Series(dtype=float),
+        "DeTrended_Std": pd.Series(dtype=float),
+        "DeTrended_CV": pd.Series(dtype=float),
+    })
+
+
+# ======================
+# 立方体 -> 一段日期的汇总
+# ======================
+@timed("rollup_days")
+def rollup_days(cube: ScanCube, day_lo: int, day_hi: int, shift_label: str,
+                operator_groups: pd.Series) -> pd.DataFrame:
+    """
+    [day_lo, day_hi] 每个归属日 × Operator 一行（只含当天该 shift 有扫描的 Operator）
+    operator_groups：立方体每个 Operator -> 劳务组代码（ScanDataset.operator_groups）
+    每天的 Operator × 小时 计数表摞成一张大表，(归属日, 劳务组) 当作一个组交给 group_relative_efficiency，
+    所有日期一次归约，结果与逐天 run_pipeline + run_group 相同
+    """
+    cells, shift_day = cube.select_cells(day_lo, day_hi, *SHIFT_WINDOWS[shift_label])
+    if len(cells) == 0:
+        return empty_rollup()
+    _, tbin, op = split_keys(cube.keys[cells])
+    hour = tbin * cube.bin_minutes // 60
+    n_ops = len(cube.operators)
+
+    # (归属日, Operator, 小时) 去重计数 -> 行 = (归属日, Operator)，列 = 24 个小时
+    row = (shift_day - day_lo).astype(np.int64) * n_ops + op
+    groups, group_idx = np.unique(row * 24 + hour, return_inverse=True)
+    counts = cube.distinct_counts(cells, group_idx, len(groups))
+    rows, row_idx = np.unique(groups // 24, return_inverse=True)
+    x = np.zeros((len(rows), 24))
+    x[row_idx, groups % 24] = counts
+
+    day_off, row_op = rows // n_ops, rows % n_ops
+    labor = operator_groups.reindex(cube.operators.astype(str))
+    n_groups = len(labor.cat.categories)
+    g = labor.cat.codes.to_numpy()[row_op].astype(np.int64)
+    day_group = np.where(g >= 0, day_off * n_groups + g, -1)
+    row_groups = pd.Series(pd.Categorical.from_codes(day_group, categories=range((day_hi - day_lo + 1) * n_groups)))
+
+    eff = np.full((len(rows), 3), np.nan)
+    for res in group_relative_efficiency(pd.DataFrame(x), row_groups).values():
+        summary = res["sum"]
+        eff[summary.index.to_numpy()] = summary.to_numpy()
+
+    return pd.DataFrame({
+        "shift_date": pd.to_datetime(day_lo + day_off, unit="D"),
+        "shift": shift_label,
+        "group": labor.to_numpy()[row_op],
+        "Operator": cube.operators.astype(str).to_numpy()[row_op],
+        "scans": x.sum(axis=1).astype(np.int64),
+        "active_hours": (x > 0).sum(axis=1),
+        "Avg_Relative_Efficiency": eff[:, 0],
+        "DeTrended_Std": eff[:, 1],
+        "DeTrended_CV": eff[:, 2],
+    })
+
+
+def day_runs(days) -> list:
+    """
+    日序号集合 -> 连续区间 [(开始, 结束)]
+    """
+    days = np.unique(np.asarray(list(days), dtype=np.int64))
+    if len(days) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(days) != 1)
+    return list(zip(days[np.r_[0, breaks + 1]], days[np.r_[breaks, len(days) - 1]]))
+
+
+def touched_shift_days(op_days, shift_label: str) -> set:
+    """
+    新到扫描的日期 -> 可能受影响的 shift 归属日（跨午夜的 shift 午夜后的扫描归属前一天）
+    """
+    start, end = SHIFT_WINDOWS[shift_label]
+    days = {int(d) for d in op_days}
+    return days | {d - 1 for d in days} if start >= end else days
+
+
+# ======================
+# 一个数据集的汇总表：按需补算，追加后增量维护
+# ======================
+class RollupTable:
+    """
+    已物化的 (shift, 归属日) 记在 covered 里；ensure 只对缺的日期查立方体
+    同一数据集可能被多个 session 同时使用，内部加锁
+    """
+
+    def __init__(self, table: pd.DataFrame = None, covered: dict = None):
+        self.table = empty_rollup() if table is None else table
+        self.covered = {s: set(days) for s, days in (covered or {}).items()}
+        self._lock = threading.Lock()
+
+    def ensure(self, ds: ScanDataset, day_lo: int, day_hi: int, shifts=None,
+               groups: dict = LABOR_GROUPS) -> "RollupTable":
+        with self._lock:
+            parts = []
+            for shift in shifts or SHIFT_OPTIONS:
+                done = self.covered.setdefault(shift, set())
+                missing = [d for d in range(day_lo, day_hi + 1) if d not in done]
+                for lo, hi in day_runs(missing):
+                    parts.append(rollup_days(ds.cube, int(lo), int(hi), shift, ds.operator_groups(groups)))
+                done.update(missing)
+            parts = [p for p in [self.table] + parts if len(p)]
+            if parts:
+                self.table = pd.concat(parts, ignore_index=True)
+        return self
+
+    def derived(self, op_days) -> "RollupTable":
+        """
+        追加新扫描之后的数据集沿用这张表：只丢掉新扫描可能影响到的归属日，其余日期不重算
+        """
+        with self._lock:
+            covered, stale = {}, np.zeros(len(self.table), dtype=bool)
+            day = (self.table["shift_date"].to_numpy().astype("datetime64[D]").astype(np.int64))
+            for shift, days in self.covered.items():
+                touched = touched_shift_days(op_days, shift)
+                covered[shift] = days - touched
+                stale |= (self.table["shift"].to_numpy() == shift) & np.isin(day, list(touched))
+            return RollupTable(self.table[~stale], covered)
+
+
+class RollupRegistry:
+    """
+    进程内每个数据集一份 RollupTable（LRU）；追加得到的数据集从父数据集的表派生
+    """
+
+    def __init__(self, max_tables: int = ROLLUP_MAX_TABLES):
+        self._tables = LRUCache(maxsize=max_tables)
+        self._lock = threading.Lock()
+
+    def for_dataset(self, ds: ScanDataset) -> RollupTable:
+        with self._lock:
+            rt = self._tables.get(ds.dataset_id)
+            if rt is None:
+                parent = self._tables.get(ds.parent_id) if ds.parent_id else None
+                rt = parent.derived(ds.appended_days) if parent is not None else RollupTable()
+                self._tables[ds.dataset_id] = rt
+            return rt
+
+
+# ======================
+# 归档的汇总：落盘，按分区文件版本增量维护
+# ======================
+def rollup_dir(root: Path = ARCHIVE_DIR) -> Path:
+    return root / ROLLUP_DIRNAME
+
+
+def source_versions(days, root: Path = ARCHIVE_DIR) -> dict:
+    """
+    每个归属日 -> 计算它需要读的分区文件（当天 + 次日，次日给跨午夜的 shift）的组合哈希
+    """
+    out = {}
+    for day in days:
+        names = [f"{p.parent.name}/{p.name}" for d in (day, day + 1)
+                 for p in sorted(partition_dir(root, d).glob("*.parquet"))]
+        out[int(day)] = hashlib.md5("|".join(names).encode()).hexdigest()
+    return out
+
+
+def load_archive_rollup(root: Path = ARCHIVE_DIR) -> tuple[pd.DataFrame, dict]:
+    path = rollup_dir(root)
+    if not (path / "rollups.parquet").exists():
+        return empty_rollup(), {}
+    versions = json.loads((path / "versions.json").read_text())
+    return pd.read_parquet(path / "rollups.parquet"), {int(d): v for d, v in versions.items()}
+
+
+@timed("refresh_archive_rollup")
+def refresh_archive_rollup(root: Path = ARCHIVE_DIR, groups: dict = LABOR_GROUPS,
+                           mode: str = CUBE_MODE) -> tuple[pd.DataFrame, list]:
+    """
+    补算归档里新增 / 分区变化了的归属日（连续的几天读一次分区、建一个立方体），写回汇总文件
+    返回 (整张汇总表, 这次重算的日期)
+    """
+    table, versions = load_archive_rollup(root)
+    days = archive_days(root)
+    # 第一天之前那一天：跨午夜的 shift 在第一天凌晨的扫描归属它
+    current = source_versions(sorted(set(days) | {d - 1 for d in days}), root)
+    stale = sorted(d for d, v in current.items() if versions.get(d) != v)
+    if not stale:
+        return table, []
+
+    keep = ~table["shift_date"].isin(pd.to_datetime(stale, unit="D"))
+    parts = [table[keep]] if keep.any() else []
+    for lo, hi in day_runs(stale):
+        # 连续几天的分区（含次日）只读一次、建一个立方体，各 shift 都从它查
+        ds = ScanDataset(f"rollup::{lo}-{hi}", ScanCube.from_frame(read_days(int(lo), int(hi) + 1, root), mode=mode))
+        for shift in SHIFT_OPTIONS:
+            parts.append(rollup_days(ds.cube, int(lo), int(hi), shift, ds.operator_groups(groups)))
+    parts = [p for p in parts if len(p)]
+    table = pd.concat(parts, ignore_index=True) if parts else empty_rollup()
+
+    path = rollup_dir(root)
+    path.mkdir(parents=True, exist_ok=True)
+    tmp = path / f".rollups.{os.getpid()}.tmp"
+    table.to_parquet(tmp, index=False)
+    os.replace(tmp, path / "rollups.parquet")
+    (path / "versions.json").write_text(json.dumps(current))
+    return table, stale
+
+
+# ======================
+# 趋势视图
+# ======================
+@timed("daily_trend")
+def daily_trend(table: pd.DataFrame, day_lo: int, day_hi: int, shift_label: str, group: str,
+                metric: str = "Avg_Relative_Efficiency") -> pd.DataFrame:
+    """
+    汇总表 -> Operator × shift_date 的指标矩阵（某天没上班为 NaN），只读汇总、不碰扫描
+    """
+    dates = table["shift_date"]
+    sel = table[
+        (table["shift"] == shift_label) & (table["group"] == group)
+        & (dates >= pd.to_datetime(day_lo, unit="D")) & (dates <= pd.to_datetime(day_hi, unit="D"))
+    ]
+    if metric == "scans_per_active_hour":
+        values = sel["scans"] / sel["active_hours"]
+    else:
+        values = sel[metric]
+    return pd.Series(values.to_numpy(), index=pd.MultiIndex.from_arrays([sel["Operator"], sel["shift_date"]])) \
+        .unstack("shift_date").sort_index()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Refresh the daily rollups of the scan archive")
+    ap.add_argument("--archive", type=Path, default=ARCHIVE_DIR, help="archive root directory")
+    args = ap.parse_args(argv)
+
+    table, stale = refresh_archive_rollup(args.archive)
+    print(f"rollups: {len(table):,} rows, {len(stale)} days recomputed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+进程内共享的数据集仓库：每个数据集（按内容寻址的 dataset_id）在服务器上只保存一份，
+session 只记 dataset_id 和自己的筛选状态，不再各自持有一份明细 / 立方体
+
+引用计数用“租约”表示：每个 session 同时只租用一个数据集，每次 rerun 续租；
+Streamlit 不通知 session 结束，所以租约带 TTL，过期即视为不再使用。没有有效租约的数据集立即释放。
+"""
+import os
+import threading
+import time
+
+from scan_ingest import ScanDataset
+
+DATASET_LEASE_SECONDS = float(os.environ.get("OEA_DATASET_LEASE_SECONDS", "1800"))  # session 无操作多久后释放租约
+
+
+class DatasetStore:
+    """
+    dataset_id -> ScanDataset（只读共享）；session -> (dataset_id, 租约到期时间)
+    """
+
+    def __init__(self, lease_seconds: float = DATASET_LEASE_SECONDS):
+        self.lease_seconds = lease_seconds
+        self._datasets = {}
+        self._leases = {}
+        self._loading = {}  # dataset_id -> 加载锁：多个 session 同时打开同一份数据只加载一次
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, dataset_id: str) -> ScanDataset:
+        with self._lock:
+            return self._datasets.get(dataset_id)
+
+    def acquire(self, session: str, dataset_id: str, load) -> ScanDataset:
+        """
+        session 租用 dataset_id（替换它之前租用的数据集）；仓库里没有时调用 load() 加载一次
+        """
+        with self._lock:
+            ds = self._datasets.get(dataset_id)
+            if ds is not None:
+                self._lease(session, dataset_id)
+                return ds
+            key_lock = self._loading.setdefault(dataset_id, threading.Lock())
+
+        with key_lock:  # 加载不持全局锁，其他数据集 / session 不被阻塞
+            ds = self.get(dataset_id)
+            if ds is None:
+                ds = load()
+                with self._lock:
+                    self._datasets[dataset_id] = ds
+                    self.loads += 1
+        with self._lock:
+            self._loading.pop(dataset_id, None)
+            self._lease(session, dataset_id)
+        return ds
+
+    def put(self, session: str, ds: ScanDataset) -> ScanDataset:
+        """
+        登记一份已经算好的数据集（例如追加后得到的新数据集）并由 session 租用；同 id 已存在时沿用已有的那份
+        """
+        with self._lock:
+            ds = self._datasets.setdefault(ds.dataset_id, ds)
+            self._lease(session, ds.dataset_id)
+            return ds
+
+    def release(self, session: str) -> None:
+        with self._lock:
+            self._leases.pop(session, None)
+            self._evict_unused()
+
+    def _lease(self, session: str, dataset_id: str) -> None:
+        # 调用方持有 self._lock
+        previous = self._leases.get(session, (None, 0))[0]
+        self._leases[session] = (dataset_id, time.monotonic() + self.lease_seconds)
+        if previous != dataset_id:
+            self._evict_unused()
+
+    def _evict_unused(self) -> None:
+        """
+        丢掉过期租约，再释放没有任何有效租约的数据集（调用方持有 self._lock）
+        """
+        now = time.monotonic()
+        self._leases = {s: lease for s, lease in self._leases.items() if lease[1] > now}
+        used = {dataset_id for dataset_id, _ in self._leases.values()}
+        for dataset_id in [d for d in self._datasets if d not in used and d not in self._loading]:
+            del self._datasets[dataset_id]
+            self.evictions += 1
+
+    def refcounts(self) -> dict:
+        with self._lock:
+            self._evict_unused()
+            counts = dict.fromkeys(self._datasets, 0)
+            for dataset_id, _ in self._leases.values():
+                counts[dataset_id] = counts.get(dataset_id, 0) + 1
+            return counts
+
+    def stats(self) -> dict:
+        refs = self.refcounts()
+        with self._lock:
+            mb = sum(ds.nbytes() for ds in self._datasets.values()) / 2**20
+            return {
+                "datasets": len(refs),
+                "sessions": sum(refs.values()),
+                "mb": mb,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
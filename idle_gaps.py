@@ -0,0 +1,94 @@
+"""
+扫描间隔 / 空闲时间分析：每个 Operator 相邻两次扫描的时间差
+- 按 (shift 归属日, Operator, 时间) 排一次序，整列做差；只在同一人、同一班内取差，全程没有按人循环
+- 间隔不超过 IDLE_GAP_MINUTES 计入有效工作分钟，超过的算一次空闲
+- 有效工作分钟可以代替墙钟小时做效率归一（Active minutes 口径）
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrument import timed
+from scan_cube import NS_PER_MINUTE
+
+# ======================
+# Config
+# ======================
+IDLE_GAP_MINUTES = float(os.environ.get("OEA_IDLE_GAP_MINUTES", "5"))  # 相邻两次扫描间隔超过它算空闲
+IDLE_HIST_EDGES = [10, 15, 30, 60, np.inf]  # 空闲时长直方图分箱上沿（分钟），第一格从 IDLE_GAP_MINUTES 起
+GAP_COLUMNS = ["scans", "shifts", "active_minutes", "idle_minutes", "idle_gaps", "longest_gap_minutes"]
+
+
+@timed("scan_gaps")
+def scan_gaps(df: pd.DataFrame, idle_minutes: float = IDLE_GAP_MINUTES) -> dict:
+    """
+    filter_by_shift 的输出（带 shift_day 列）-> {"operators": 每个 Operator 的间隔统计, "idle": 空闲间隔明细}
+    - operators：scans、shifts（上过几个班）、active_minutes、idle_minutes、idle_gaps、longest_gap_minutes
+    - idle：每次空闲一行 (Operator, minutes)，给各劳务组画直方图
+    """
+    ops = df["Operator"].cat
+    names = pd.Index(ops.categories.astype(str))
+    op = ops.codes.to_numpy().astype(np.int64)
+    t = df["op_time"].to_numpy().view(np.int64)
+    day = df["shift_day"].to_numpy().astype(np.int64)
+    if len(df) == 0:
+        return {
+            "operators": pd.DataFrame(columns=GAP_COLUMNS, index=pd.Index([], name="Operator"), dtype=float),
+            "idle": pd.DataFrame({"Operator": pd.Series(dtype=str), "minutes": pd.Series(dtype=float)}),
+        }
+
+    key = (day - day.min()) * len(names) + op
+    order = np.lexsort((t, key))
+    key, t, op = key[order], t[order], op[order]
+
+    same = key[1:] == key[:-1]  # 相邻两行是同一人同一班
+    gap = ((t[1:] - t[:-1]) / NS_PER_MINUTE)[same]
+    gap_op = op[1:][same]
+    idle = gap > idle_minutes
+
+    n = len(names)
+    longest = np.zeros(n)
+    np.maximum.at(longest, gap_op, gap)
+    first_of_shift = np.r_[True, ~same]
+    stats = pd.DataFrame({
+        "scans": np.bincount(op, minlength=n),
+        "shifts": np.bincount(op[first_of_shift], minlength=n),
+        "active_minutes": np.bincount(gap_op, weights=np.where(idle, 0.0, gap), minlength=n),
+        "idle_minutes": np.bincount(gap_op, weights=np.where(idle, gap, 0.0), minlength=n),
+        "idle_gaps": np.bincount(gap_op[idle], minlength=n),
+        "longest_gap_minutes": longest,
+    }, index=names.rename("Operator"))
+    return {
+        "operators": stats[stats["scans"] > 0],
+        "idle": pd.DataFrame({"Operator": names[gap_op[idle]], "minutes": gap[idle]}),
+    }
+
+
+def idle_histogram(idle: pd.DataFrame, operators, idle_minutes: float = IDLE_GAP_MINUTES) -> pd.Series:
+    """
+    一组 Operator 的空闲间隔 -> 各时长区间的次数（index 是 "5–10 min" 这样的标签）
+    idle_minutes 与 scan_gaps 用的阈值一致
+    """
+    edges = [idle_minutes] + [e for e in IDLE_HIST_EDGES if e > idle_minutes]
+    labels = [f"{lo:g}–{hi:g} min" for lo, hi in zip(edges[:-2], edges[1:-1])] + [f"{edges[-2]:g}+ min"]
+    minutes = idle.loc[idle["Operator"].isin(pd.Index(operators)), "minutes"].to_numpy()
+    counts, _ = np.histogram(minutes, bins=np.array(edges, dtype=float))
+    return pd.Series(counts, index=pd.Index(labels, name="idle_gap"))
+
+
+def active_relative_efficiency(df_emp: pd.DataFrame, df_sum: pd.DataFrame, gap_ops: pd.DataFrame) -> pd.DataFrame:
+    """
+    Active minutes 口径：Avg_Relative_Efficiency 换成 每有效工作小时扫描量 / 组内均值
+    （墙钟口径按时间段比较，站着不扫的时间也算在里面；这里只按真正在扫的时间归一）
+    DeTrended_Std 仍是按时间段的波动；DeTrended_CV 用新的 Avg_Relative_Efficiency 重算，
+    与墙钟口径一样满足 CV = Std / Avg_Relative_Efficiency，表里不混用两种口径
+    """
+    active_hours = gap_ops["active_minutes"].reindex(df_emp.index) / 60
+    rate = df_emp.sum(axis=1) / active_hours.where(active_hours > 0)
+    avg_rel = (rate / rate.mean()).reindex(df_sum.index)
+    return df_sum.assign(
+        Avg_Relative_Efficiency=avg_rel,
+        DeTrended_CV=df_sum["DeTrended_Std"] / avg_rel.where(avg_rel != 0),
+        Scans_per_Active_Hour=rate.reindex(df_sum.index),
+    )
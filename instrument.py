@@ -0,0 +1,122 @@
+"""
+分阶段计时 / 内存埋点：
+    with stage("preprocess") as s:
+        df = preprocess(raw)
+        s.rows = len(df)
+或者直接装饰整个函数：@timed("preprocess")（返回 DataFrame 时自动记录行数）
+只有当前线程开启了 StageLog（start_stage_log）时才真正计时；否则只多一次 ContextVar 读取
+"""
+import contextvars
+import functools
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+import psutil
+
+logger = logging.getLogger("oea.stages")
+
+_current_log = contextvars.ContextVar("oea_stage_log", default=None)
+_process = psutil.Process()
+
+
+class _NoopStage:
+    """关闭时 stage() 返回的占位对象：属性赋值直接丢弃"""
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NOOP = _NoopStage()
+
+
+class StageRecord:
+    __slots__ = ("name", "depth", "seconds", "rows", "rss_delta_mb", "rss_mb")
+
+    def __init__(self, name: str, depth: int):
+        self.name = name
+        self.depth = depth
+        self.seconds = 0.0
+        self.rows = None
+        self.rss_delta_mb = 0.0
+        self.rss_mb = 0.0
+
+    def as_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class StageLog:
+    """
+    一次 rerun 的阶段记录（按开始顺序，depth 表示嵌套层级）
+    """
+
+    def __init__(self, run_label: str = ""):
+        self.run_label = run_label
+        self.records = []
+        self._depth = 0
+        self.started = time.perf_counter()
+
+    def total_seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    def emit_json(self) -> None:
+        """每个阶段一行结构化 JSON 日志（logger "oea.stages"，未配置 logging 时输出到 stderr）"""
+        if not logger.handlers and not logging.getLogger().handlers:
+            logger.addHandler(logging.StreamHandler())
+            logger.setLevel(logging.INFO)
+        for rec in self.records:
+            logger.info(json.dumps({"run": self.run_label, **rec.as_dict()}))
+
+
+def start_stage_log(run_label: str = "") -> StageLog:
+    log = StageLog(run_label)
+    _current_log.set(log)
+    return log
+
+
+def stop_stage_log() -> None:
+    _current_log.set(None)
+
+
+@contextmanager
+def stage(name: str, rows: int = None):
+    log = _current_log.get()
+    if log is None:
+        yield _NOOP
+        return
+
+    rec = StageRecord(name, log._depth)
+    rec.rows = rows
+    log.records.append(rec)
+    log._depth += 1
+    rss0 = _process.memory_info().rss
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        rec.seconds = time.perf_counter() - t0
+        rss1 = _process.memory_info().rss
+        rec.rss_mb = rss1 / 2**20
+        rec.rss_delta_mb = (rss1 - rss0) / 2**20
+        log._depth -= 1
+
+
+def timed(name: str):
+    """
+    把整个函数当作一个阶段；关闭时直接调用原函数
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_log.get() is None:
+                return fn(*args, **kwargs)
+            with stage(name) as rec:
+                out = fn(*args, **kwargs)
+                shape = getattr(out, "shape", None)
+                if shape:
+                    rec.rows = shape[0]
+                return out
+        return wrapper
+    return deco
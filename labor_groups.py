@@ -0,0 +1,112 @@
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+# ======================
+# 劳务组注册表：组代码 -> 匹配 Operator 名称的正则（不区分大小写，按顺序第一个命中为准）
+# 可用环境变量 OEA_LABOR_GROUPS 覆盖，例如 '{"JOU": "^JOU", "RD": "^RD", "pr": "^pr", "XYZ": "^XY"}'
+# ======================
+DEFAULT_LABOR_GROUPS = {
+    "JOU": r"^JOU",
+    "RD": r"^RD",
+    "pr": r"^pr",
+}
+
+
+def load_labor_groups() -> dict:
+    raw = os.environ.get("OEA_LABOR_GROUPS")
+    if not raw:
+        return dict(DEFAULT_LABOR_GROUPS)
+    groups = json.loads(raw)
+    if not isinstance(groups, dict) or not groups:
+        raise ValueError("OEA_LABOR_GROUPS must be a non-empty JSON object of {group: pattern}")
+    for pattern in groups.values():
+        re.compile(pattern)
+    return groups
+
+
+def classify_operators(names: pd.Index, groups: dict) -> pd.Series:
+    """
+    每个 Operator 名称 -> 劳务组代码（category；不属于任何组为 NaN）
+    只在去重后的名称表上跑正则，一个数据集算一次
+    """
+    names = pd.Index(names).astype(str)
+    codes = np.full(len(names), -1, dtype=np.int64)
+    stripped = names.str.strip()
+    for i, pattern in enumerate(groups.values()):
+        hit = (codes < 0) & stripped.str.contains(pattern, flags=re.IGNORECASE, regex=True, na=False)
+        codes[hit] = i
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories=list(groups)),
+        index=names,
+        name="labor_group",
+    )
+
+
+# ======================
+# 全部劳务组的 Relative Efficiency：整张 Operator × time_bin 矩阵一次分组归约
+# ======================
+def group_relative_efficiency(pivot: pd.DataFrame, row_groups: pd.Series, eps: float = 1e-9) -> dict:
+    """
+    pivot：Operator × time_bin 计数表；row_groups：pivot 每行的劳务组代码（category）
+    返回 {组代码: {"emp": 员工表, "rel": Relative Efficiency 表, "sum": 图3汇总表}}
+    - 组内 hour_mean = 组内员工每小时均值（0 视为缺失）
+    - rel = 计数 / (hour_mean + eps)；residual = 计数 - hour_mean
+    - 汇总：Avg_Relative_Efficiency、DeTrended_Std（样本标准差）、DeTrended_CV
+    组数再多也只是对一块连续 float 数组做一遍按组 reduce
+    """
+    cats = row_groups.cat.categories
+    codes = row_groups.reindex(pivot.index).cat.codes.to_numpy()
+
+    # 按组代码稳定排序，组内保持 pivot 原顺序；不属于任何组（-1）的行排在最前面被切掉
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    first = np.searchsorted(sorted_codes, 0)
+    order, sorted_codes = order[first:], sorted_codes[first:]
+    x = np.ascontiguousarray(pivot.to_numpy(dtype=np.float64)[order])
+
+    counts = np.bincount(sorted_codes, minlength=len(cats))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sums = np.zeros((len(cats), x.shape[1]))
+    nonempty = counts > 0
+    if len(x):
+        sums[nonempty] = np.add.reduceat(x, starts[nonempty], axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        hour_mean = sums / counts[:, None]
+    hour_mean[hour_mean == 0] = np.nan
+
+    row_mean = hour_mean[sorted_codes]
+    rel = x / (row_mean + eps)
+    residual = x - row_mean
+
+    # 按行的 skipna 均值 / 样本标准差（NaN 列是组内该小时没量）
+    valid = ~np.isnan(row_mean)
+    n_valid = valid.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_rel = np.where(valid, rel, 0).sum(axis=1) / n_valid
+        res_mean = np.where(valid, residual, 0).sum(axis=1) / n_valid
+        sq = np.where(valid, (residual - res_mean[:, None]) ** 2, 0).sum(axis=1)
+        std = np.sqrt(sq / (n_valid - 1))
+    std[n_valid < 2] = np.nan
+    cv = std / np.where(avg_rel == 0, np.nan, avg_rel)
+
+    out = {}
+    for i, code in enumerate(cats):
+        sl = slice(starts[i], starts[i] + counts[i])
+        idx = pivot.index[order[sl]]
+        out[code] = {
+            "emp": pivot.iloc[order[sl]],
+            "rel": pd.DataFrame(rel[sl], index=idx, columns=pivot.columns),
+            "sum": pd.DataFrame(
+                {
+                    "Avg_Relative_Efficiency": avg_rel[sl],
+                    "DeTrended_Std": std[sl],
+                    "DeTrended_CV": cv[sl],
+                },
+                index=idx,
+            ),
+        }
+    return out
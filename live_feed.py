@@ -0,0 +1,288 @@
+"""
+实时模式：跟随一份不断增长的扫描日志（CSV / JSONL 文件，或本地 socket 上的 JSONL 流），
+只把新到的扫描折叠进当前 shift 的立方体；KPI / 图1 每次刷新只查这一个 shift，不回看全部历史
+
+    # 用一份导出模拟扫描枪：按时间顺序每秒写 50 条到 JSONL 文件（或 --serve 127.0.0.1:9009 走 socket）
+    python live_feed.py data/scanRecord_1766632272775.xlsx --to .cache/live/feed.jsonl --rate 50
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from instrument import timed
+from report_engine import CUBE_MODE, SHIFT_WINDOWS, day_to_date, file_md5, run_pipeline
+from scan_cube import ScanCube, shift_hours
+from scan_ingest import (
+    NEEDED_COLUMNS, NS_PER_DAY, NS_PER_HOUR, ScanDataset, parse_op_time, preprocess, read_export_cached,
+)
+
+# ======================
+# Config
+# ======================
+LIVE_FEED = os.environ.get("OEA_LIVE_FEED", ".cache/live/feed.jsonl")  # 实时数据源：文件路径或 tcp://host:port
+LIVE_REFRESH_SECONDS = float(os.environ.get("OEA_LIVE_REFRESH_SECONDS", "5"))  # 实时视图刷新间隔
+LIVE_BIN_MINUTES = int(os.environ.get("OEA_LIVE_BIN_MINUTES", "15"))  # 实时视图的时间段粒度
+LIVE_MAX_POLL_BYTES = 32 << 20  # 单次读取上限：首次接上一份很长的日志时分几次追上，内存有界
+
+
+# ======================
+# 数据源：只读新增的完整行
+# ======================
+class FeedTail:
+    """
+    跟随一个扫描数据源，每次 poll() 返回上次之后新增的完整记录（列 = NEEDED_COLUMNS）
+    - 文件：记住字节偏移；行没写完的尾巴留到下次；文件变短（轮转 / 截断）时从头读
+    - tcp://host:port：非阻塞读取 JSONL 行，断线后下次 poll 自动重连
+    CSV 以第一行为表头；.jsonl / .ndjson 文件和 socket 每行一个 JSON 对象
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.is_socket = source.startswith("tcp://")
+        self.is_jsonl = self.is_socket or source.lower().endswith((".jsonl", ".ndjson"))
+        self.offset = 0
+        self.header = None  # CSV 表头行（bytes）
+        self._sock = None
+        self._buf = b""
+
+    def poll(self) -> pd.DataFrame:
+        lines = self._read_socket() if self.is_socket else self._read_file()
+        if not lines:
+            return pd.DataFrame(columns=NEEDED_COLUMNS)
+        return self._parse(lines)
+
+    def _read_file(self) -> list:
+        path = Path(self.source)
+        if not path.exists():
+            return []
+        size = path.stat().st_size
+        if size < self.offset:  # 轮转 / 截断
+            self.offset, self.header = 0, None
+        if size == self.offset:
+            return []
+        with open(path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(LIVE_MAX_POLL_BYTES)
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+        lines = data[:end].splitlines()
+        if not self.is_jsonl and self.header is None and lines:
+            self.header, lines = lines[0], lines[1:]
+        return [line for line in lines if line.strip()]
+
+    def _read_socket(self) -> list:
+        if self._sock is None:
+            host, port = self.source[len("tcp://"):].rsplit(":", 1)
+            self._sock = socket.create_connection((host, int(port)), timeout=2)
+            self._sock.setblocking(False)
+        data = []
+        try:
+            while sum(map(len, data)) < LIVE_MAX_POLL_BYTES:
+                block = self._sock.recv(1 << 16)
+                if not block:  # 对端关闭
+                    self.close()
+                    break
+                data.append(block)
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.close()
+            raise
+        self._buf += b"".join(data)
+        end = self._buf.rfind(b"\n") + 1
+        lines, self._buf = self._buf[:end].splitlines(), self._buf[end:]
+        return [line for line in lines if line.strip()]
+
+    def _parse(self, lines: list) -> pd.DataFrame:
+        if self.is_jsonl:
+            df = pd.DataFrame.from_records([json.loads(line) for line in lines])
+        else:
+            df = pd.read_csv(io.BytesIO(b"\n".join([self.header] + lines)), dtype=str)
+        miss = set(NEEDED_COLUMNS) - set(df.columns)
+        if miss:
+            raise ValueError(f"Missing columns: {miss}")
+        return df[NEEDED_COLUMNS]
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock, self._buf = None, b""
+
+
+# ======================
+# 当前 shift 的增量聚合
+# ======================
+def shift_at(t_ns: int) -> tuple[str, int, int, int]:
+    """
+    某个时刻所在的 shift -> (shift, 归属日序号, 窗口开始 ns, 窗口结束 ns)
+    """
+    for label, (start, end) in SHIFT_WINDOWS.items():
+        # 距最近一次 shift 开始过了多久；不超过 shift 时长即在班内（跨午夜的 shift 归属开始那天）
+        shift_day, since = divmod(t_ns - start * NS_PER_HOUR, NS_PER_DAY)
+        length = shift_hours(start, end) * NS_PER_HOUR
+        if since < length:
+            lo = shift_day * NS_PER_DAY + start * NS_PER_HOUR
+            return label, int(shift_day), int(lo), int(lo + length)
+    raise ValueError(f"No shift covers hour {(t_ns // NS_PER_HOUR) % 24}")
+
+
+class LiveShift:
+    """
+    只保存当前 shift 的立方体：
+    - 新扫描 preprocess 后直接 add_frame（同一 cell 做集合并），不重建
+    - 窗口跟着最新一条扫描走：出现下一个 shift 的扫描时换一个空立方体
+    - 窗口之外的扫描（迟到的上一班数据等）丢弃并计数
+    """
+
+    def __init__(self, mode: str = CUBE_MODE):
+        self.mode = mode
+        self.cube = None
+        self.shift_label = None
+        self.shift_day = None
+        self.window = None  # (开始 ns, 结束 ns)
+        self.n_scans = 0
+        self.n_dropped = 0
+        self.version = 0  # 每次有新扫描进入立方体 +1，快照据此判断要不要重算
+
+    @timed("live_ingest")
+    def ingest(self, raw: pd.DataFrame) -> int:
+        df = preprocess(raw)
+        if df.empty:
+            return 0
+        t = df["op_time"].to_numpy().view(np.int64)
+        newest = int(t.max())
+        if self.window is None or newest >= self.window[1]:
+            self.shift_label, self.shift_day, lo, hi = shift_at(newest)
+            self.window = (lo, hi)
+            self.cube = ScanCube(mode=self.mode)
+            self.n_scans = self.n_dropped = 0
+        keep = (t >= self.window[0]) & (t < self.window[1])
+        self.n_dropped += int(len(df) - keep.sum())
+        if keep.any():
+            self.cube.add_frame(df[keep])
+            self.n_scans += int(keep.sum())
+            self.version += 1
+        return int(keep.sum())
+
+    def snapshot(self, bin_minutes: int = LIVE_BIN_MINUTES) -> dict:
+        """
+        当前 shift 的 pivot / 页眉统计（与批量页面同一条 run_pipeline）
+        """
+        d = day_to_date(self.shift_day)
+        ds = ScanDataset(f"live::{self.shift_day}:{self.shift_label}:{self.version}", self.cube)
+        res = run_pipeline(ds, d, d, self.shift_label, bin_minutes)
+        res.update(shift=self.shift_label, n_scans=self.n_scans, n_dropped=self.n_dropped)
+        return res
+
+
+class LiveFeed:
+    """
+    数据源 + 当前 shift 聚合；多个 session 共用一份（进程内一个数据源只跟随一次），内部加锁
+    """
+
+    def __init__(self, source: str, mode: str = CUBE_MODE, bin_minutes: int = LIVE_BIN_MINUTES):
+        self.tail = FeedTail(source)
+        self.shift = LiveShift(mode)
+        self.bin_minutes = bin_minutes
+        self.last_poll = 0.0
+        self._snapshot = (None, None)  # (version, snapshot)
+        self._lock = threading.Lock()
+
+    @timed("live_refresh")
+    def refresh(self, min_interval: float = 0.0) -> dict:
+        """
+        读新增记录 -> 折叠进当前 shift -> 返回快照（还没有任何扫描时为 None）
+        min_interval：距上次读取不到这么久就直接返回上一份快照（多个 session 同时刷新时只读一次）
+        """
+        with self._lock:
+            if time.monotonic() - self.last_poll >= min_interval:
+                self.last_poll = time.monotonic()
+                raw = self.tail.poll()
+                while len(raw):
+                    self.shift.ingest(raw)
+                    raw = self.tail.poll()  # 积压超过单次上限时继续追
+            if self.shift.cube is None:
+                return None
+            version, snap = self._snapshot
+            if version != self.shift.version:
+                snap = self.shift.snapshot(self.bin_minutes)
+                self._snapshot = (self.shift.version, snap)
+            return snap
+
+
+# ======================
+# 回放：用一份历史导出模拟扫描枪
+# ======================
+def iter_replay_records(export_path: str):
+    """
+    导出文件按扫描时间排序后逐条产出 {列名: 文本或 None}
+    """
+    raw = read_export_cached(export_path, file_md5(export_path))[NEEDED_COLUMNS]
+    raw = raw.iloc[np.argsort(parse_op_time(raw["Operation time"]).to_numpy(), kind="stable")]
+    raw = raw.astype(str).where(raw.notna(), None)  # 缺失值写成 null / 空单元格，而不是 "nan"
+    yield from raw.to_dict("records")
+
+
+def replay_to_file(records, path: Path, rate: float) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    jsonl = path.suffix.lower() in (".jsonl", ".ndjson")
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=NEEDED_COLUMNS, lineterminator="\n")
+        if not jsonl and f.tell() == 0:
+            writer.writeheader()
+        for rec in records:
+            if jsonl:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            else:
+                writer.writerow(rec)
+            f.flush()
+            time.sleep(1 / rate)
+
+
+def replay_to_socket(export_path: str, address: str, rate: float) -> None:
+    """
+    每个连上来的客户端都从头收到一遍回放（JSONL）
+    """
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                for rec in iter_replay_records(export_path):
+                    self.wfile.write((json.dumps(rec, ensure_ascii=False) + "\n").encode())
+                    time.sleep(1 / rate)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # 客户端断开
+
+    host, port = address.rsplit(":", 1)
+    with socketserver.ThreadingTCPServer((host, int(port)), Handler) as server:
+        server.daemon_threads = True
+        print(f"serving scans on tcp://{host}:{port}")
+        server.serve_forever()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Replay a scan export as a live feed")
+    ap.add_argument("export", help="scan export (.xlsx / .csv) to replay in time order")
+    target = ap.add_mutually_exclusive_group(required=True)
+    target.add_argument("--to", type=Path, help="append to this .csv / .jsonl file")
+    target.add_argument("--serve", metavar="HOST:PORT", help="serve JSONL over TCP")
+    ap.add_argument("--rate", type=float, default=50.0, help="scans per second")
+    args = ap.parse_args(argv)
+
+    if args.serve:
+        replay_to_socket(args.export, args.serve, args.rate)
+    else:
+        replay_to_file(iter_replay_records(args.export), args.to, args.rate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+可选的 Polars 后端（OEA_PIPELINE_BACKEND=polars，polars 见 requirements-optional.txt）：
+- preprocess_polars：清洗写成 lazy 表达式；dashboard / 批量报表经由 scan_ingest.preprocess 使用，
+  之后照常建立方体，选择仍由立方体回答
+- shift_counts：不建立方体，从原始导出直接得到一个 shift 的 pivot（清洗 -> 归属日 -> 过滤 -> 去重计数
+  一个 lazy 查询，投影 / 谓词下推、多线程 group-by）；只用于 report_engine.shift_pivot（一次性查询 / benchmark）
+
+输出与 pandas 路径逐位一致：waybill 仍用 pandas 的哈希、Operator 编码顺序相同、pivot 相同
+（一致性测试：python -m pytest benchmarks/test_parity_polars.py）
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from scan_cube import NS_PER_MINUTE
+from scan_ingest import NEEDED_COLUMNS, NS_PER_DAY, NS_PER_HOUR, parse_op_time, scan_frame
+
+TIME_FORMAT = "%H:%M:%S %d/%m/%Y"  # 导出的固定格式；解析失败的少数行交给 pandas 的 dayfirst 兜底
+CSV_NULL_VALUES = [  # 与 pd.read_csv 默认的缺失值写法一致（pandas 文档 na_values 一节）
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+
+# ======================
+# 数据源 -> LazyFrame
+# ======================
+def _series(s: pd.Series) -> pl.Series:
+    try:
+        return pl.from_pandas(s)
+    except Exception:
+        # Excel 混合类型的 object 列（数字 + 文本）：与 pandas 路径一样按文本处理
+        return pl.from_pandas(s.astype(str).where(s.notna(), None))
+
+
+def scan_source(source) -> pl.LazyFrame:
+    """
+    原始导出 -> 只含三列的 LazyFrame
+    - pandas DataFrame（read_export_cached / 流式块）
+    - .csv 路径：scan_csv 全部按文本读（同 pd.read_csv(dtype=str)）
+    - .arrow / .parquet 路径（列式缓存 / 归档外的 Parquet 导出）：scan_ipc / scan_parquet
+    """
+    if isinstance(source, pd.DataFrame):
+        return pl.DataFrame([_series(source[c]) for c in NEEDED_COLUMNS]).lazy()
+    path = Path(source)
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        lf = pl.scan_csv(path, infer_schema=False, null_values=CSV_NULL_VALUES)
+    elif suffix == ".arrow":
+        lf = pl.scan_ipc(path, memory_map=True)
+    elif suffix == ".parquet":
+        lf = pl.scan_parquet(path)
+    else:
+        raise ValueError(f"unsupported source for the polars backend: {path.name}")
+    return lf.select(NEEDED_COLUMNS)
+
+
+def _clean(lf: pl.LazyFrame, time_fixes: pd.Series = None) -> pl.LazyFrame:
+    """
+    清洗（与 preprocess 同一套规则）：
+    - op_time：固定格式解析；已经是时间类型的列直接用；time_fixes = pandas 兜底解析成功的行
+    - Operator：转文本去空白，缺失 / 空串 / "nan" 无效
+    - waybill：转文本（float 列先转整数，去掉 ".0"），缺失无效
+    输出 (Operator, waybill, t_ns, valid)
+    """
+    schema = lf.collect_schema()
+    raw_t = pl.col("Operation time")
+    if schema["Operation time"].is_temporal():
+        t = raw_t.cast(pl.Datetime("ns"))
+    else:
+        t = raw_t.cast(pl.String).str.strptime(pl.Datetime("ns"), TIME_FORMAT, strict=False)
+    t_ns = t.dt.epoch("ns")
+    if time_fixes is not None and len(time_fixes):
+        fix = pl.int_range(pl.len(), dtype=pl.Int64).replace_strict(
+            time_fixes.index.to_numpy(), time_fixes.to_numpy(), default=None, return_dtype=pl.Int64,
+        )
+        t_ns = t_ns.fill_null(fix)
+
+    wb = pl.col("Waybill No.")
+    if schema["Waybill No."].is_float():
+        wb = wb.cast(pl.Int64)
+    op = pl.col("Operator").cast(pl.String).str.strip_chars()
+
+    return lf.select(
+        op.alias("Operator"),
+        wb.cast(pl.String).alias("waybill"),
+        t_ns.alias("t_ns"),
+    ).with_columns(
+        valid=(
+            pl.col("Operator").is_not_null() & (pl.col("Operator") != "")
+            & (pl.col("Operator").str.to_lowercase() != "nan")
+            & pl.col("waybill").is_not_null() & pl.col("t_ns").is_not_null()
+        ),
+    )
+
+
+def time_fixes(lf: pl.LazyFrame) -> pd.Series:
+    """
+    固定格式解析失败、但 pandas dayfirst 兜底能解析的行：{行号: ns 时间}（通常为空，只扫时间这一列）
+    """
+    if lf.collect_schema()["Operation time"].is_temporal():
+        return pd.Series([], dtype=np.int64)
+    raw_t = pl.col("Operation time").cast(pl.String)
+    failed = (
+        lf.with_row_index("row")
+        .filter(raw_t.is_not_null() & raw_t.str.strptime(pl.Datetime("ns"), TIME_FORMAT, strict=False).is_null())
+        .select("row", raw_t)
+        .collect()
+    )
+    if failed.height == 0:
+        return pd.Series([], dtype=np.int64)
+    t = parse_op_time(pd.Series(failed["Operation time"].to_numpy(), dtype=object))
+    ok = t.notna().to_numpy()
+    return pd.Series(t.to_numpy()[ok].view(np.int64), index=failed["row"].to_numpy()[ok].astype(np.int64))
+
+
+# ======================
+# preprocess / shift pivot
+# ======================
+def preprocess_polars(raw: pd.DataFrame) -> pd.DataFrame:
+    """
+    与 scan_ingest.preprocess 输出完全相同（列、dtype、Operator 编码顺序、waybill_id）
+    """
+    lf = scan_source(raw)
+    clean = _clean(lf, time_fixes(lf))
+    # Operator 编码表：有效名称按第一次出现的顺序（含后来因时间 / 单号无效被丢掉的行，同 pandas）
+    valid_op = (pl.col("Operator").is_not_null() & (pl.col("Operator") != "")
+                & (pl.col("Operator").str.to_lowercase() != "nan"))
+    operators = clean.filter(valid_op).select(pl.col("Operator").unique(maintain_order=True))
+    rows = clean.filter("valid").select("Operator", "waybill", "t_ns")
+    operators, rows = pl.collect_all([operators, rows])
+
+    categories = operators["Operator"]
+    codes = rows["Operator"].cast(pl.Enum(categories)).to_physical().to_numpy().astype(np.int64)
+
+    # waybill 文本 -> 与 pandas 路径相同的 64 位哈希（只对去重后的单号算一次）
+    uniq = rows.select(pl.col("waybill").unique())
+    uniq = uniq.with_columns(waybill_id=pl.Series(
+        pd.util.hash_array(uniq["waybill"].to_numpy().astype(object)).view(np.int64),
+    ))
+    ids = rows.select("waybill").join(uniq, on="waybill", how="left", maintain_order="left")["waybill_id"]
+
+    ops = pd.Categorical.from_codes(codes, categories=pd.Index(categories.to_numpy().astype(object)))
+    return scan_frame(ops.remove_unused_categories(), ids.to_numpy(), rows["t_ns"].to_numpy())
+
+
+def shift_counts(source, day_lo: int, day_hi: int, start_hour: int, end_hour: int, bin_minutes: int) -> pd.DataFrame:
+    """
+    原始导出 -> 某个 shift 在 [day_lo, day_hi]（按 shift 归属日）内的 Operator × time_bin 去重单号数
+    一个 lazy 查询：清洗、归属日（跨午夜的 shift 午夜后归前一天）、过滤、按 (Operator, time_bin) n_unique
+    列是 time_bin 整数编码（与 ScanCube.query 的 pivot 相同），交给 finish_pivot 生成标签
+    """
+    lf = scan_source(source)
+    clean = _clean(lf, time_fixes(lf))
+
+    t_ns = pl.col("t_ns")
+    hour = (t_ns // NS_PER_HOUR) % 24
+    day = t_ns // NS_PER_DAY
+    if start_hour < end_hour:
+        in_shift = (hour >= start_hour) & (hour < end_hour)
+        shift_day = day
+    else:
+        in_shift = (hour >= start_hour) | (hour < end_hour)
+        shift_day = day - (hour < end_hour).cast(pl.Int64)
+
+    counts = (
+        clean
+        .filter(pl.col("valid") & in_shift & shift_day.is_between(day_lo, day_hi))
+        .group_by("Operator", (t_ns % NS_PER_DAY // (bin_minutes * NS_PER_MINUTE)).alias("time_bin"))
+        .agg(pl.col("waybill").n_unique().alias("n"))
+        .collect()
+    )
+    return (
+        pd.Series(
+            counts["n"].to_numpy(),
+            index=pd.MultiIndex.from_arrays(
+                [counts["Operator"].to_numpy().astype(object), counts["time_bin"].to_numpy().astype(np.int16)],
+                names=["Operator", "time_bin"],
+            ),
+        )
+        .unstack("time_bin", fill_value=0)
+    )
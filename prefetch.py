@@ -0,0 +1,157 @@
+"""
+后台预取：当前视图显示期间，用低优先级线程提前算好“下一次点击”最可能要的结果
+（同一日期范围的其他 shift、前后挪一天的日期范围），放进共享结果缓存，下一次点击直接命中
+
+- 只在前台空闲时运行：任何 session 正在 rerun 时，预取等它结束再开始下一步
+- 可取消：同一 session 的视图一变，旧的排队任务全部取消；正在跑的任务在两步之间发现后放弃
+- 预算：每次视图变化后最多花 PREFETCH_CPU_SECONDS 的 CPU 时间、最多新增 PREFETCH_MB 结果；
+  缓存那边只用空闲空间，不会为了预取挤掉前台结果
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from report_engine import SHIFT_OPTIONS
+
+# ======================
+# Config
+# ======================
+PREFETCH_WORKERS = int(os.environ.get("OEA_PREFETCH_WORKERS", "1"))  # 预取线程数；0 关闭预取
+PREFETCH_CPU_SECONDS = float(os.environ.get("OEA_PREFETCH_CPU_SECONDS", "2"))  # 每次视图变化后预取最多占用的 CPU 秒数
+PREFETCH_MB = float(os.environ.get("OEA_PREFETCH_MB", "64"))  # 每次视图变化后预取最多新增的结果大小
+PREFETCH_NICE = 10  # 预取线程的 nice 增量（Linux 上按线程生效），CPU 紧张时内核优先调度前台
+FOREGROUND_TIMEOUT = 30.0  # rerun 开始后多久还没结束就不再等它（st.stop / 异常退出的 rerun 不会通知结束）
+
+
+class PrefetchCancelled(Exception):
+    """任务被取消或超出预算：剩下的步骤不再执行"""
+
+
+def neighbour_selections(d0, d1, shift: str, min_d, max_d) -> list:
+    """
+    当前 (d0, d1, shift) 之后最可能被点到的选择，按优先级排列：
+    同一日期范围的其他 shift，然后同一 shift 的日期范围后移 / 前移一天（超出数据范围的跳过）
+    """
+    out = [(d0, d1, s) for s in SHIFT_OPTIONS if s != shift]
+    for step in (1, -1):
+        a, b = d0 + timedelta(days=step), d1 + timedelta(days=step)
+        if min_d <= a and b <= max_d:
+            out.append((a, b, shift))
+    return out
+
+
+def _lower_priority() -> None:
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), PREFETCH_NICE)
+    except (AttributeError, OSError):
+        pass  # 非 Linux / 没有权限：只靠前台空闲等待
+
+
+class PrefetchJob:
+    """
+    一个 session 一次视图变化排下的预取：共享取消标记和 CPU / 内存预算
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self.cpu_seconds = 0.0
+        self.nbytes = 0
+        self.futures = []
+
+    def cancel(self) -> int:
+        """
+        还在排队的任务直接取消（返回取消了几个）；正在跑的在下一步之前退出
+        """
+        self.cancelled = True
+        return sum(f.cancel() for f in self.futures)
+
+
+class Prefetcher:
+    """
+    cache 需要提供 get_or_compute(key, compute, prefetch=True)、getsizeof(value) 和 `key in cache`
+    （result_cache.ResultCache）
+    """
+
+    def __init__(self, cache, workers: int = PREFETCH_WORKERS, cpu_seconds: float = PREFETCH_CPU_SECONDS,
+                 max_bytes: float = PREFETCH_MB * 2**20):
+        self.cache = cache
+        self.cpu_seconds = cpu_seconds
+        self.max_bytes = max_bytes
+        self._pool = None
+        if workers > 0:
+            self._pool = ThreadPoolExecutor(workers, thread_name_prefix="oea-prefetch", initializer=_lower_priority)
+        self._jobs = {}  # session -> 当前的 PrefetchJob
+        self._busy = {}  # session -> 前台 rerun 的等待截止时间
+        self._idle = threading.Condition()
+        self.computed = 0
+        self.cancelled = 0
+        self.over_budget = 0
+
+    # ---------- 前台 ----------
+    def busy(self, session: str) -> None:
+        """
+        session 开始一次 rerun：预取在它结束（schedule / cancel）之前不开始新的步骤
+        """
+        with self._idle:
+            self._busy[session] = time.monotonic() + FOREGROUND_TIMEOUT
+
+    def schedule(self, session: str, tasks: list) -> None:
+        """
+        rerun 结束：替换 session 之前的预取，按顺序排下新任务
+        task(step) 通过 step(key, compute) 逐步取 / 算结果，两步之间可能抛出 PrefetchCancelled
+        """
+        self.cancel(session)
+        if self._pool is None or not tasks:
+            return
+        job = PrefetchJob()
+        with self._idle:
+            # 顺手丢掉已经跑完的 session（Streamlit 不通知 session 结束）
+            self._jobs = {s: j for s, j in self._jobs.items() if not all(f.done() for f in j.futures)}
+            self._jobs[session] = job
+        job.futures = [self._pool.submit(self._run, job, task) for task in tasks]
+
+    def cancel(self, session: str) -> None:
+        with self._idle:
+            job = self._jobs.pop(session, None)
+            self._busy.pop(session, None)
+            if job is not None:
+                self.cancelled += job.cancel()
+            self._idle.notify_all()
+
+    # ---------- 后台 ----------
+    def _wait_idle(self, job: PrefetchJob) -> None:
+        with self._idle:
+            while not job.cancelled:
+                now = time.monotonic()
+                self._busy = {s: t for s, t in self._busy.items() if t > now}
+                if not self._busy:
+                    return
+                self._idle.wait(timeout=min(self._busy.values()) - now)
+
+    def _run(self, job: PrefetchJob, task) -> None:
+        def step(key, compute):
+            self._wait_idle(job)
+            if job.cancelled:
+                self.cancelled += 1
+                raise PrefetchCancelled
+            if job.cpu_seconds >= self.cpu_seconds or job.nbytes >= self.max_bytes:
+                self.over_budget += 1
+                raise PrefetchCancelled
+            fresh = key not in self.cache
+            t0 = time.thread_time()
+            value = self.cache.get_or_compute(key, compute, prefetch=True)
+            job.cpu_seconds += time.thread_time() - t0
+            if fresh:
+                job.nbytes += self.cache.getsizeof(value)
+                self.computed += 1
+            return value
+
+        try:
+            task(step)
+        except PrefetchCancelled:
+            pass
+
+    def stats(self) -> dict:
+        return {"computed": self.computed, "cancelled": self.cancelled, "over_budget": self.over_budget}
@@ -0,0 +1,446 @@
+"""
+报表计算核心（不依赖 Streamlit）：pivot / KPI / shift 过滤 / 劳务组效率 / 批量报表
+Dashboard（streamlitv0.py）和批量 CLI（batch_report.py）共用这里的函数
+"""
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from instrument import timed
+from labor_groups import load_labor_groups, group_relative_efficiency
+from scan_cube import BASE_BIN_MINUTES, NS_PER_MINUTE, bin_codes, shift_windows, span_rows
+from scan_ingest import PIPELINE_BACKEND, ScanDataset, iter_preprocessed, preprocess, read_export_cached
+
+# ======================
+# Config
+# ======================
+DEFAULT_SORTER_NAME = "sorter"  # 仍保留 sorter 概念（图1需要）
+DEFAULT_SHIFT_WINDOWS = {  # shift -> (开始小时, 结束小时)；开始 > 结束表示跨午夜，归属开始那天
+    "Early (07-15)": (7, 15),
+    "Mid (15-23)": (15, 23),
+    "Night (23-07)": (23, 7),
+}
+
+
+def load_shift_windows() -> dict:
+    """
+    shift 定义，可用环境变量 OEA_SHIFT_WINDOWS 覆盖（按顺序显示），例如
+    '{"Day (06-18)": [6, 18], "Night (18-06)": [18, 6], "Weekend (00-24)": [0, 0]}'
+    开始 == 结束表示全天
+    """
+    raw = os.environ.get("OEA_SHIFT_WINDOWS")
+    if not raw:
+        return dict(DEFAULT_SHIFT_WINDOWS)
+    windows = json.loads(raw)
+    if not isinstance(windows, dict) or not windows:
+        raise ValueError("OEA_SHIFT_WINDOWS must be a non-empty JSON object of {shift: [start_hour, end_hour]}")
+    out = {}
+    for label, hours in windows.items():
+        if (not isinstance(hours, list) or len(hours) != 2
+                or not all(isinstance(h, int) and 0 <= h < 24 for h in hours)):
+            raise ValueError(f"OEA_SHIFT_WINDOWS[{label!r}] must be [start_hour, end_hour] with hours in 0-23")
+        out[label] = tuple(hours)
+    return out
+
+
+SHIFT_WINDOWS = load_shift_windows()
+SHIFT_OPTIONS = list(SHIFT_WINDOWS)
+CUBE_MODE = os.environ.get("OEA_CUBE_MODE", "exact")  # "exact" 精确去重；"hll" 稀疏 HyperLogLog 近似去重（更小、合并更快，计数误差 < 1%）
+LABOR_GROUPS = load_labor_groups()  # 劳务组代码 -> Operator 名称正则（见 labor_groups.py）
+TIME_BIN_OPTIONS = [m for m in (60, 30, 15, 5) if m % BASE_BIN_MINUTES == 0]  # 可选时间段粒度（分钟）
+DEFAULT_BIN_MINUTES = 60
+
+# ======================
+# Pipeline
+# ======================
+EPOCH = date(1970, 1, 1)
+
+def date_to_day(d: date) -> int:
+    return (d - EPOCH).days
+
+def day_to_date(day: int) -> date:
+    return EPOCH + timedelta(days=int(day))
+
+def time_bin_label(code: int, bin_minutes: int = 60) -> str:
+    """
+    time_bin 整数编码 -> 展示用标签：整点粒度 14 -> "14-15"；分钟粒度（15 分钟）57 -> "14:15-14:30"
+    """
+    if bin_minutes == 60:
+        return f"{int(code)}-{int(code) + 1}"
+    start = int(code) * bin_minutes
+    end = start + bin_minutes
+    return f"{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}"
+
+@timed("build_pivot")
+def build_pivot(df: pd.DataFrame, bin_minutes: int = DEFAULT_BIN_MINUTES) -> tuple[pd.DataFrame, list]:
+    tbin = pd.Series(bin_codes(df["op_time"].to_numpy().view(np.int64), bin_minutes), index=df.index, name="time_bin")
+    agg = df.groupby([df["Operator"], tbin], observed=True)["waybill_id"].nunique()
+    return finish_pivot(agg.unstack("time_bin", fill_value=0), bin_minutes)
+
+@timed("finish_pivot")
+def finish_pivot(pivot: pd.DataFrame, bin_minutes: int = DEFAULT_BIN_MINUTES) -> tuple[pd.DataFrame, list]:
+    """
+    Operator × time_bin 编码的计数表 -> 页面用的 pivot（排序、去全零行列、列名转标签）
+    先在下标上算好要保留的行列和顺序，最后一次取出，不逐步生成中间表
+    """
+    names = pivot.index.astype(str)
+    codes = pivot.columns.to_numpy()
+    values = pivot.to_numpy(dtype=float)
+    nonzero = values != 0
+    rows = np.flatnonzero(nonzero.any(axis=1))
+    cols = np.flatnonzero(nonzero.any(axis=0))
+    rows = rows[names[rows].argsort()]
+    cols = cols[np.argsort(codes[cols], kind="stable")]
+
+    time_bins = [time_bin_label(c, bin_minutes) for c in codes[cols]]
+    pivot = pd.DataFrame(
+        values[np.ix_(rows, cols)], index=names[rows], columns=pd.Index(time_bins, name="time_bin"),
+    )
+    return pivot, time_bins
+
+def compute_time_context(df: pd.DataFrame) -> str:
+    """
+    专业面板时间显示：
+    - 同日：YYYY-MM-DD | HH:MM–HH:MM
+    - 跨日：YYYY-MM-DD HH:MM → YYYY-MM-DD HH:MM
+    """
+    return format_time_context(df["op_time"].min(), df["op_time"].max())
+
+def format_time_context(t_start, t_end) -> str:
+    if pd.isna(t_start) or pd.isna(t_end):
+        return "-"
+
+    same_day = (t_start.date() == t_end.date())
+    if same_day:
+        return f'{t_start.strftime("%Y-%m-%d")} | {t_start.strftime("%H:%M")}–{t_end.strftime("%H:%M")}'
+    else:
+        return f'{t_start.strftime("%Y-%m-%d %H:%M")} → {t_end.strftime("%Y-%m-%d %H:%M")}'
+
+def kpi_summary(pivot: pd.DataFrame, time_bins: list, sorter_name: str):
+    if pivot.empty or len(time_bins) == 0:
+        total_series = pd.Series([], dtype=float)
+        sorter_series = pd.Series([], dtype=float)
+    else:
+        total_series = pivot.reindex(columns=time_bins).sum(axis=0)
+        sorter_series = (
+            pivot.loc[sorter_name].reindex(time_bins) if sorter_name in pivot.index
+            else pd.Series(0, index=time_bins)
+        ).fillna(0)
+
+    total_all = int(total_series.sum()) if len(total_series) else 0
+    sorter_all = int(sorter_series.sum()) if len(sorter_series) else 0
+    share = (sorter_all / total_all * 100) if total_all > 0 else 0.0
+
+    if len(total_series) > 0:
+        peak_tb = str(total_series.idxmax())
+        peak_val = int(total_series.max())
+    else:
+        peak_tb, peak_val = "-", 0
+
+    return total_all, sorter_all, share, peak_tb, peak_val
+
+# ===== 各组效率表 =====
+
+
+def build_employee_efficiency_df(
+    pivot: pd.DataFrame,
+    include_pattern: str = None,
+    exclude_pattern: str = None,
+    drop_all_zero: bool = True
+) -> pd.DataFrame:
+    """
+    从 pivot 表中，按正则筛选员工，返回 员工 × time_bin 的效率 DataFrame
+    （pivot 的列已由 finish_pivot 按时间段编码排好序，这里不再解析标签重排）
+    各条件先合成一个行掩码，只取一次选中的行；pivot 本身不复制、不修改
+    """
+    names = pivot.index.astype(str).str.strip()
+    keep = np.ones(len(names), dtype=bool)
+
+    if include_pattern:
+        keep &= np.asarray(names.str.contains(include_pattern, flags=re.IGNORECASE, regex=True, na=False))
+
+    if exclude_pattern:
+        keep &= ~np.asarray(names.str.contains(exclude_pattern, flags=re.IGNORECASE, regex=True, na=False))
+
+    if drop_all_zero:
+        keep &= (pivot.to_numpy() != 0).any(axis=1)
+
+    df = pivot.iloc[np.flatnonzero(keep)]
+    df.index = names[keep]  # 新取出的表，原地换成去空白的名称
+    return df
+
+
+
+def build_company_relative_efficiency_dfs(
+    pivot: pd.DataFrame,
+    employee_pattern: str,
+    drop_all_zero: bool = True,
+    eps: float = 1e-9,   # 防止除零
+):
+    """
+    公司内比较版本：
+    - hour_mean 用公司内部员工的每小时均值
+    - residual 也用公司内部 hour_mean 做去趋势
+    """
+    df_emp = build_employee_efficiency_df(pivot, employee_pattern, drop_all_zero=drop_all_zero)
+    return company_relative_efficiency(df_emp, eps)
+
+
+def company_relative_efficiency(df_emp: pd.DataFrame, eps: float = 1e-9):
+    """
+    已选好的一个劳务组（员工 × time_bin）-> (Relative Efficiency 表, 图3汇总表)
+    单组版本，实际计算走 group_relative_efficiency
+    """
+    one = pd.Series(pd.Categorical(np.zeros(len(df_emp), dtype=int), categories=[0]), index=df_emp.index)
+    res = group_relative_efficiency(df_emp, one, eps)[0]
+    return res["rel"], res["sum"]
+
+
+
+# ===== Shift 过滤（跨午夜的 shift 如 Night(23-07) 归属开始那天）=====
+@timed("filter_by_shift")
+def filter_by_shift(df_in: pd.DataFrame, start_date, end_date, shift_label: str,
+                    time_sorted: bool = False) -> pd.DataFrame:
+    """
+    preprocess 之后的扫描 -> 某个 shift 在 [start_date, end_date]（按 shift 归属日）内的行，附 shift_day 列
+    time_sorted：df_in 已按 op_time 排序（如 ScanDataset.rows）时，每个归属日二分出一段连续行，不做整表掩码
+    """
+    start, end = SHIFT_WINDOWS[shift_label]
+    day_lo, day_hi = date_to_day(start_date), date_to_day(end_date)
+
+    if time_sorted:
+        lo, hi = shift_windows(day_lo, day_hi, start, end)
+        t = df_in["op_time"].to_numpy().view(np.int64)
+        rows, owner = span_rows(np.searchsorted(t, lo * NS_PER_MINUTE), np.searchsorted(t, hi * NS_PER_MINUTE))
+        shift_day = day_lo + owner
+    else:
+        hr = df_in["hour"].to_numpy()
+        day = df_in["op_day"].to_numpy()
+        if start < end:
+            in_shift = (hr >= start) & (hr < end)
+            all_day = day
+        else:
+            # 跨午夜：开始小时之后归属当天，结束小时之前归属前一天
+            in_shift = (hr >= start) | (hr < end)
+            all_day = day - (hr < end)
+        rows = np.flatnonzero(in_shift & (all_day >= day_lo) & (all_day <= day_hi))
+        shift_day = all_day[rows]
+
+    out = df_in.take(rows)  # 只复制选中的行
+    out["shift_day"] = shift_day.astype(np.int32)
+    return out
+
+@timed("shift_pivot")
+def shift_pivot(source, d0, d1, shift_label: str, bin_minutes: int = DEFAULT_BIN_MINUTES,
+                backend: str = PIPELINE_BACKEND) -> tuple[pd.DataFrame, list]:
+    """
+    不经过立方体，由原始导出（DataFrame 或 .csv 路径）直接得到一个 (日期范围, shift) 的 pivot，
+    供一次性查询 / benchmark 使用（dashboard 与批量报表的选择由立方体回答，见 run_pipeline）：
+    - pandas：preprocess -> filter_by_shift -> build_pivot（逐步物化）
+    - polars：同样的清洗 / 归属日 / 过滤 / 去重计数写成一个 lazy 查询（polars_backend.shift_counts）
+    """
+    if backend == "polars":
+        from polars_backend import shift_counts  # 可选依赖：只在选用时导入
+        counts = shift_counts(source, date_to_day(d0), date_to_day(d1), *SHIFT_WINDOWS[shift_label], bin_minutes)
+        return finish_pivot(counts, bin_minutes)
+    raw = source if isinstance(source, pd.DataFrame) else pd.read_csv(source, dtype=str)
+    return build_pivot(filter_by_shift(preprocess(raw, backend), d0, d1, shift_label), bin_minutes)
+
+@timed("run_pipeline")
+def run_pipeline(ds: ScanDataset, d0, d1, shift_label: str, bin_minutes: int = DEFAULT_BIN_MINUTES) -> dict:
+    """
+    立方体合并 cell 得到 pivot -> KPI -> 各劳务组效率表，一次算完打包
+    bin_minutes：时间段粒度（立方体基础粒度的整数倍），cell 按整数编码合并，标签最后才生成
+    """
+    sel = ds.cube.query(date_to_day(d0), date_to_day(d1), *SHIFT_WINDOWS[shift_label], bin_minutes=bin_minutes)
+    pivot, time_bins = finish_pivot(sel["pivot"], bin_minutes)
+
+    # 劳务组按数据集预先算好的 Operator -> 组代码 取；各组效率表等 Deep Dive 展开时再算（run_group）
+    row_groups = ds.operator_groups(LABOR_GROUPS).reindex(pivot.index)
+
+    t_start, t_end = (pd.Timestamp(sel[k]) if sel[k] is not None else pd.NaT for k in ("t_min", "t_max"))
+    return {
+        "pivot": pivot,
+        "time_bins": time_bins,
+        "bin_minutes": bin_minutes,
+        "time_context": format_time_context(t_start, t_end),
+        "n_records": sel["n_records"],
+        "n_operators": sel["n_operators"],
+        "row_groups": row_groups,
+    }
+
+@timed("run_group")
+def run_group(res: dict, group_code: str) -> dict:
+    """
+    单个劳务组：员工 × time_bin 表 + Relative Efficiency 表 + 图3汇总表
+    """
+    df_emp = res["pivot"].loc[(res["row_groups"] == group_code).to_numpy()]
+    df_rel, df_sum = company_relative_efficiency(df_emp)
+    return {"emp": df_emp, "rel": df_rel, "sum": df_sum}
+
+# ===== 图下总结：团队平均产出 / 效率最低 3 人 =====
+
+def calc_team_avg_hourly_scan(df_emp: pd.DataFrame, bin_minutes: int = DEFAULT_BIN_MINUTES) -> float:
+    """
+    团队“平均每小时 Scan Count”：所有员工 × 所有 time-bin 的均值（= 一条横线的 y），
+    分钟粒度时换算回每小时
+    """
+    if df_emp is None or df_emp.empty:
+        return 0.0
+    return float(np.nanmean(df_emp.to_numpy())) * 60 / bin_minutes
+
+def pick_bottom_3_efficiency(df_sum: pd.DataFrame) -> list[str]:
+    """
+    从象限图来源 df_sum 中选效率最低 3 名员工：
+    以 Avg_Relative_Efficiency 越小越低
+    """
+    if df_sum is None or df_sum.empty or "Avg_Relative_Efficiency" not in df_sum.columns:
+        return []
+
+    s = df_sum["Avg_Relative_Efficiency"].replace([np.inf, -np.inf], np.nan).dropna()
+    if s.empty:
+        return []
+
+    return [str(x) for x in s.nsmallest(3).index.tolist()]
+
+
+# ======================
+# 批量报表：多天 × 多 shift × 多劳务组，进程池并行
+# ======================
+def file_md5(file_path) -> str:
+    h = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_exports(paths: list, mode: str = CUBE_MODE, streaming: bool = False) -> ScanDataset:
+    """
+    读取一份或多份扫描导出（xlsx / csv）-> ScanDataset；多份时合并成一个数据集
+    """
+    parts = []
+    for path in paths:
+        digest = file_md5(path)
+        if streaming:
+            parts.append(ScanDataset.from_stream(path, "file::" + digest, mode=mode))
+        else:
+            raw = read_export_cached(path, digest)
+            parts.append(ScanDataset.from_frame(preprocess(raw), "file::" + digest, mode=mode))
+    if len(parts) == 1:
+        return parts[0]
+    digests = sorted(p.dataset_id.split("::", 1)[1] for p in parts)
+    dataset_id = "multi::" + hashlib.md5("|".join(digests).encode()).hexdigest()
+    return ScanDataset.combine(parts, dataset_id, reread=lambda i: iter_preprocessed(paths[i]))
+
+_worker_dataset = None
+
+def _init_report_worker(ds: ScanDataset) -> None:
+    # 每个 worker 进程只接收一次数据集，之后的任务只传 (day, shift)
+    global _worker_dataset
+    _worker_dataset = ds
+
+def report_task(shift_day: int, shift_label: str, groups: tuple, bin_minutes: int = DEFAULT_BIN_MINUTES,
+                ds: ScanDataset = None) -> dict:
+    """
+    一个 (shift 日期, shift) 的报表：KPI 一行 + 各劳务组的员工汇总 + 各组效率最低 3 人
+    没有扫描记录时返回 None
+    """
+    ds = ds if ds is not None else _worker_dataset
+    d = day_to_date(shift_day)
+    res = run_pipeline(ds, d, d, shift_label, bin_minutes)
+    if res["n_records"] == 0:
+        return None
+
+    pivot, time_bins = res["pivot"], res["time_bins"]
+    total_all, sorter_all, share, peak_tb, peak_val = kpi_summary(pivot, time_bins, DEFAULT_SORTER_NAME)
+    key = {"shift_date": d, "shift": shift_label}
+    kpi = {
+        **key,
+        "n_records": res["n_records"],
+        "n_operators": res["n_operators"],
+        "total_volume": total_all,
+        "sorter_volume": sorter_all,
+        "sorter_share_pct": round(share, 2),
+        "peak_time_bin": peak_tb,
+        "peak_volume": peak_val,
+        "time_context": res["time_context"],
+    }
+
+    operators, bottom3 = [], []
+    for code in groups:
+        g = run_group(res, code)
+        if g["emp"].empty:
+            continue
+        summary = g["sum"].assign(avg_hourly_scan=g["emp"].mean(axis=1) * 60 / bin_minutes)
+        operators.append(summary.rename_axis("Operator").reset_index().assign(**key, group=code))
+        team_avg = calc_team_avg_hourly_scan(g["emp"], bin_minutes)
+        for rank, op in enumerate(pick_bottom_3_efficiency(g["sum"]), start=1):
+            bottom3.append({**key, "group": code, "rank": rank, "Operator": op, "team_avg_hourly_scan": team_avg})
+
+    return {"kpi": kpi, "operators": operators, "bottom3": bottom3}
+
+def run_batch_report(
+    ds: ScanDataset,
+    start_date: date = None,
+    end_date: date = None,
+    shifts: list = None,
+    groups: list = None,
+    workers: int = 1,
+    bin_minutes: int = DEFAULT_BIN_MINUTES,
+) -> dict:
+    """
+    对 [start_date, end_date] 的每一天 × 每个 shift 跑一遍 Dashboard 同款计算
+    返回 {"kpi": ..., "operators": ..., "bottom3": ...} 三张 DataFrame
+    """
+    min_day, max_day = ds.cube.day_range()
+    day_lo = date_to_day(start_date) if start_date else min_day
+    day_hi = date_to_day(end_date) if end_date else max_day
+    shifts = list(shifts or SHIFT_OPTIONS)
+    groups = tuple(groups or LABOR_GROUPS)
+
+    tasks = [(day, s) for day in range(day_lo, day_hi + 1) for s in shifts]
+    if workers <= 1 or len(tasks) <= 1:
+        results = [report_task(day, s, groups, bin_minutes, ds) for day, s in tasks]
+    else:
+        slim = ScanDataset(ds.dataset_id, ds.cube)  # 不把扫描明细行发给 worker
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(workers, initializer=_init_report_worker, initargs=(slim,)) as pool:
+            results = list(pool.map(
+                report_task, [t[0] for t in tasks], [t[1] for t in tasks], [groups] * len(tasks),
+                [bin_minutes] * len(tasks), chunksize=chunksize,
+            ))
+
+    results = [r for r in results if r is not None]
+    operators = [f for r in results for f in r["operators"]]
+    op_cols = ["shift_date", "shift", "group", "Operator", "avg_hourly_scan",
+               "Avg_Relative_Efficiency", "DeTrended_Std", "DeTrended_CV"]
+    return {
+        "kpi": pd.DataFrame([r["kpi"] for r in results]),
+        "operators": pd.concat(operators, ignore_index=True)[op_cols] if operators else pd.DataFrame(columns=op_cols),
+        "bottom3": pd.DataFrame([row for r in results for row in r["bottom3"]]),
+    }
+
+def write_report(tables: dict, out_dir, fmt: str = "parquet") -> list:
+    """
+    每张表写一个文件（kpi / operators / bottom3），fmt = "parquet" 或 "csv"
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for name, df in tables.items():
+        path = out_dir / f"{name}.{fmt}"
+        if fmt == "parquet":
+            df.to_parquet(path, index=False)
+        elif fmt == "csv":
+            df.to_csv(path, index=False)
+        else:
+            raise ValueError(f"unknown report format: {fmt}")
+        written.append(path)
+    return written
@@ -0,0 +1,108 @@
+"""
+进程内共享的计算结果缓存：(dataset_id, 日期范围, shift, ...) -> pivot / 各组效率表 / 图表
+按内存预算 LRU 淘汰，同一个 key 同时只算一次；后台预取（prefetch.py）只用空闲空间
+"""
+import os
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+
+RESULT_CACHE_MB = int(os.environ.get("OEA_RESULT_CACHE_MB", "256"))  # 计算结果缓存的内存预算
+
+
+def result_nbytes(result: dict) -> int:
+    """
+    估算一份计算结果占用的内存（只统计 DataFrame / Series，其余是小标量）
+    """
+    frames = [v for v in result.values() if isinstance(v, (pd.DataFrame, pd.Series))]
+    return int(sum(np.sum(f.memory_usage(deep=True)) for f in frames)) + 1024
+
+
+class ResultCache:
+    """
+    进程内共享的计算结果缓存：
+    - key = (dataset_id, d0, d1, shift)，dataset_id 是内容哈希，跨 session 共享是安全的
+    - 按内存预算 LRU 淘汰；缓存的 DataFrame 只读，调用方不要原地修改
+    - 同一个 key 同时只算一次：另一个 session / 后台预取正在算时，等它算完直接用
+    - prefetch=True（后台预取）：不计入命中 / 未命中，结果只放进空闲空间，不挤掉已有结果
+    """
+
+    def __init__(self, max_bytes: int, getsizeof=result_nbytes):
+        self._lru = LRUCache(maxsize=max_bytes, getsizeof=getsizeof)
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Future：正在计算的 key
+        self._prefetched = set()  # 预取放进来、前台还没用到的 key
+        self.hits = 0
+        self.misses = 0
+        self.prefetch_hits = 0
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._lru
+
+    def getsizeof(self, value) -> int:
+        return self._lru.getsizeof(value)
+
+    def get_or_compute(self, key, compute, prefetch: bool = False):
+        with self._lock:
+            if key in self._lru:
+                if not prefetch:
+                    self.hits += 1
+                    if key in self._prefetched:
+                        self._prefetched.discard(key)
+                        self.prefetch_hits += 1
+                return self._lru[key]
+            flight = self._inflight.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._inflight[key] = Future()
+                flight.prefetch = prefetch
+            if not prefetch:
+                if owner:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    if flight.prefetch:
+                        flight.prefetch = False  # 前台已经在等这份预取：算完后不再记作“未使用的预取”
+                        self.prefetch_hits += 1
+        if not owner:
+            try:
+                return flight.result()
+            except Exception:
+                return self.get_or_compute(key, compute, prefetch)  # 对方算失败了：自己再算一次
+
+        try:
+            value = compute()  # 计算不持锁，其他 session 不被阻塞
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            flight.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+            if not prefetch or self._lru.currsize + self.getsizeof(value) <= self._lru.maxsize:
+                try:
+                    self._lru[key] = value
+                except ValueError:
+                    pass  # 单份结果超过整个预算：不缓存
+                else:
+                    if flight.prefetch:
+                        self._prefetched.add(key)
+            if len(self._prefetched) > len(self._lru):
+                self._prefetched &= set(self._lru.keys())  # 已被淘汰的预取 key
+        flight.set_result(value)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._lru),
+                "mb": self._lru.currsize / 2**20,
+                "prefetched": len(self._prefetched & set(self._lru.keys())),
+                "prefetch_hits": self.prefetch_hits,
+            }
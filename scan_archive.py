@@ -0,0 +1,212 @@
+"""
+本地历史扫描归档：按日期分区的 zstd Parquet 文件
+    <OEA_ARCHIVE_DIR>/op_day=2025-12-13/part-<来源哈希>-<批次哈希>.parquet
+每份导出入库一次（分区内按 (Operator, waybill, 时间) 去重、按时间排序）；
+查询时由日期范围 + shift 算出要读的分区（跨午夜的 shift 如 Night 额外读 d1 次日 00–07），成本只与所选范围有关
+
+    python scan_archive.py data/scanRecord_*.xlsx      # 批量回填
+"""
+import argparse
+import hashlib
+import os
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from instrument import timed
+from report_engine import CUBE_MODE, SHIFT_WINDOWS, date_to_day, day_to_date, file_md5
+from scan_cube import shift_hours
+from scan_ingest import (
+    NS_PER_DAY, NS_PER_HOUR, ScanDataset, iter_preprocessed, row_fingerprints, scan_frame,
+)
+
+# ======================
+# Config
+# ======================
+ARCHIVE_DIR = Path(os.environ.get("OEA_ARCHIVE_DIR", ".cache/archive"))  # 归档根目录
+ARCHIVE_COLUMNS = ["Operator", "waybill_id", "op_time"]  # 只存这三列，其余由时间派生
+ARCHIVE_ROW_GROUP = 65_536  # 分区内按时间排序，小 row group 让时间过滤能跳过整块
+PARTITION_PREFIX = "op_day="
+
+
+def partition_dir(root: Path, day: int) -> Path:
+    return root / f"{PARTITION_PREFIX}{day_to_date(day).isoformat()}"
+
+
+def archive_days(root: Path = ARCHIVE_DIR) -> list[int]:
+    """
+    归档里已有的日期分区（日序号，升序）
+    """
+    if not root.exists():
+        return []
+    days = [
+        date_to_day(date.fromisoformat(p.name[len(PARTITION_PREFIX):]))
+        for p in root.iterdir() if p.is_dir() and p.name.startswith(PARTITION_PREFIX)
+    ]
+    return sorted(days)
+
+
+def _source_marker(root: Path, digest: str) -> Path:
+    return root / "_sources" / digest
+
+
+def is_archived(digest: str, root: Path = ARCHIVE_DIR) -> bool:
+    return _source_marker(root, digest).exists()
+
+
+def archive_version(root: Path = ARCHIVE_DIR) -> str:
+    """
+    归档内容版本：已入库来源的组合哈希，每多一份导出就变
+    """
+    sources = root / "_sources"
+    names = sorted(p.name for p in sources.iterdir()) if sources.exists() else []
+    return hashlib.md5("|".join(names).encode()).hexdigest()
+
+
+def _read_parts(files: list, filters=None) -> pa.Table:
+    return pq.read_table(files, columns=ARCHIVE_COLUMNS, filters=filters, partitioning=None)
+
+
+# ======================
+# 写入
+# ======================
+@timed("archive_write")
+def archive_frame(df: pd.DataFrame, digest: str, root: Path = ARCHIVE_DIR) -> tuple[int, int]:
+    """
+    preprocess 之后的一批扫描 -> 按 op_day 写进各日期分区
+    与分区里已有的扫描（以及本批内部）相同 (Operator, waybill, 时间) 的行跳过
+    返回 (写入行数, 跳过的重复行数)
+    """
+    if df.empty:
+        return 0, 0
+    order = np.lexsort((df["op_time"].to_numpy(), df["op_day"].to_numpy()))
+    df = df.iloc[order]
+    days = df["op_day"].to_numpy()
+    bounds = np.flatnonzero(np.r_[True, days[1:] != days[:-1], True])
+
+    added = skipped = 0
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        part = df.iloc[lo:hi]
+        out_dir = partition_dir(root, int(days[lo]))
+        keys = row_fingerprints(part)
+        _, first = np.unique(keys, return_index=True)
+        keep = np.zeros(len(part), dtype=bool)
+        keep[first] = True
+        existing = sorted(out_dir.glob("*.parquet"))
+        if existing:
+            old = _read_parts(existing).to_pandas()
+            keep &= ~np.isin(keys, row_fingerprints(old))
+        skipped += int(len(part) - keep.sum())
+        if not keep.any():
+            continue
+
+        new_keys = keys[keep]
+        name = f"part-{digest[:16]}-{hashlib.md5(new_keys.tobytes()).hexdigest()[:12]}.parquet"
+        table = pa.Table.from_pandas(part.loc[keep, ARCHIVE_COLUMNS], preserve_index=False)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        tmp = out_dir / f".{name}.{os.getpid()}.tmp"
+        pq.write_table(table, tmp, compression="zstd", row_group_size=ARCHIVE_ROW_GROUP)
+        os.replace(tmp, out_dir / name)  # 原子替换，读的一方不会看到半个文件
+        added += len(new_keys)
+    return added, skipped
+
+
+@timed("archive_export")
+def archive_export(source, digest: str, root: Path = ARCHIVE_DIR) -> tuple[int, int]:
+    """
+    一份导出逐块入库（内存只与块大小有关）；同一份内容只入库一次
+    """
+    if is_archived(digest, root):
+        return 0, 0
+    added = skipped = 0
+    for chunk in iter_preprocessed(source):
+        a, s = archive_frame(chunk, digest, root)
+        added, skipped = added + a, skipped + s
+    marker = _source_marker(root, digest)
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    marker.touch()
+    return added, skipped
+
+
+# ======================
+# 读取：分区裁剪
+# ======================
+def shift_bounds(d0: date, d1: date, shift_label: str) -> tuple[int, int]:
+    """
+    [d0, d1] 内某个 shift 覆盖的时间范围 (开始 ns, 结束 ns)；跨午夜的 shift 延伸到 d1 次日
+    """
+    start, end = SHIFT_WINDOWS[shift_label]
+    lo = date_to_day(d0) * NS_PER_DAY + start * NS_PER_HOUR
+    hi = date_to_day(d1) * NS_PER_DAY + (start + shift_hours(start, end)) * NS_PER_HOUR
+    return lo, hi
+
+
+def partitions_for(d0: date, d1: date, shift_label: str, root: Path = ARCHIVE_DIR) -> list[Path]:
+    """
+    要读的分区文件：只看时间范围覆盖到的日期（Night 含 d1 次日）
+    """
+    lo, hi = shift_bounds(d0, d1, shift_label)
+    files = []
+    for day in range(lo // NS_PER_DAY, (hi - 1) // NS_PER_DAY + 1):
+        files.extend(sorted(partition_dir(root, day).glob("*.parquet")))
+    return files
+
+
+@timed("archive_read")
+def read_archive(d0: date, d1: date, shift_label: str, root: Path = ARCHIVE_DIR) -> pd.DataFrame:
+    """
+    读出所选日期范围 + shift 的扫描（preprocess 格式）：
+    先裁剪分区，再用 op_time 范围跳过分区内用不到的 row group（如 Night 次日 07 点以后）
+    """
+    lo, hi = shift_bounds(d0, d1, shift_label)
+    return _read_range(partitions_for(d0, d1, shift_label, root), lo, hi)
+
+
+def read_days(day_lo: int, day_hi: int, root: Path = ARCHIVE_DIR) -> pd.DataFrame:
+    """
+    读出 [day_lo, day_hi] 这几个日期分区的全部扫描（preprocess 格式）
+    """
+    files = [p for day in range(day_lo, day_hi + 1) for p in sorted(partition_dir(root, day).glob("*.parquet"))]
+    return _read_range(files, day_lo * NS_PER_DAY, (day_hi + 1) * NS_PER_DAY)
+
+
+def _read_range(files: list, lo: int, hi: int) -> pd.DataFrame:
+    if not files:
+        return scan_frame(pd.Categorical([]), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    table = _read_parts(files, filters=[
+        ("op_time", ">=", pd.Timestamp(lo)), ("op_time", "<", pd.Timestamp(hi)),
+    ])
+    df = table.to_pandas()
+    operators = df["Operator"].astype("category")
+    return scan_frame(operators.array, df["waybill_id"].to_numpy(), df["op_time"].to_numpy().view(np.int64))
+
+
+def open_archive(d0: date, d1: date, shift_label: str, root: Path = ARCHIVE_DIR, mode: str = CUBE_MODE) -> ScanDataset:
+    """
+    所选范围的归档扫描 -> ScanDataset（dataset_id 由读到的分区文件决定，内容不变 id 就不变）
+    """
+    files = partitions_for(d0, d1, shift_label, root)
+    digest = hashlib.md5("|".join([shift_label] + [f"{p.parent.name}/{p.name}" for p in files]).encode()).hexdigest()
+    return ScanDataset.from_frame(read_archive(d0, d1, shift_label, root), "archive::" + digest, mode=mode)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Add scan exports to the date-partitioned archive")
+    ap.add_argument("exports", nargs="+", help="scan export files (.xlsx / .csv)")
+    ap.add_argument("--archive", type=Path, default=ARCHIVE_DIR, help="archive root directory")
+    args = ap.parse_args(argv)
+
+    for path in args.exports:
+        added, skipped = archive_export(path, file_md5(path), args.archive)
+        print(f"{path}: +{added:,} scans, {skipped:,} duplicates skipped")
+    days = archive_days(args.archive)
+    if days:
+        print(f"archive: {len(days)} days, {day_to_date(days[0])} … {day_to_date(days[-1])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrument import timed
+
+# ======================
+# (日期 × 时间段 × Operator) 预聚合立方体
+# ======================
+# 每个 cell 存一份可合并的去重结构：
+# - exact：该 cell 内去重后的 waybill_id（CSR 排好序的 int64 数组），合并 = 集合并
+# - hll  ：稀疏 HyperLogLog，只存非零寄存器 (寄存器下标, rank)（CSR），合并 = 同一寄存器取 max，近似去重
+#          一个 5 分钟 cell 通常只有几个 waybill，稠密的 2^p 个寄存器几乎全是 0；
+#          稀疏存储每个 waybill 最多 3 字节（exact 是 8 字节），且与 p 无关，所以默认 p 可以取大、误差更小
+# 任意日期范围 / shift 的 pivot 都由合并 cell 得到，不再回扫逐行扫描表。
+
+BASE_BIN_MINUTES = int(os.environ.get("OEA_BASE_BIN_MINUTES", "5"))  # 立方体最细时间粒度，查询可按其整数倍汇总
+HLL_P = int(os.environ.get("OEA_HLL_P", "14"))  # hll 模式寄存器数 = 2^p（4..16）；稀疏存储下内存不随 p 增长
+MINUTES_PER_DAY = 24 * 60
+NS_PER_MINUTE = 60 * 10**9
+NS_PER_DAY = MINUTES_PER_DAY * NS_PER_MINUTE
+
+_DAY_SHIFT = 40  # cell key = day << 40 | bin << 24 | op
+_BIN_SHIFT = 24
+_LOW_MASK = (1 << _BIN_SHIFT) - 1
+_BIN_MASK = (1 << (_DAY_SHIFT - _BIN_SHIFT)) - 1
+
+
+def bin_codes(t_ns: np.ndarray, bin_minutes: int) -> np.ndarray:
+    """
+    ns epoch 时间 -> 当天第几个时间段（整数编码，纯算术，不生成字符串）
+    """
+    return ((t_ns % NS_PER_DAY) // (bin_minutes * NS_PER_MINUTE)).astype(np.int16)
+
+
+def shift_hours(start_hour: int, end_hour: int) -> int:
+    """
+    shift 时长（小时）：开始 > 结束跨午夜；开始 == 结束表示全天 24 小时
+    """
+    return (end_hour - start_hour - 1) % 24 + 1
+
+
+def shift_windows(day_lo: int, day_hi: int, start_hour: int, end_hour: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    某个 shift 在 [day_lo, day_hi] 内每个归属日的时间窗 [开始, 结束)，以 epoch 分钟计，按归属日升序
+    跨午夜的 shift 归属开始那天，窗口伸进次日
+    """
+    lo = np.arange(day_lo, day_hi + 1, dtype=np.int64) * MINUTES_PER_DAY + start_hour * 60
+    return lo, lo + shift_hours(start_hour, end_hour) * 60
+
+
+def span_rows(starts: np.ndarray, stops: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    若干个下标区间 [start, stop) -> (拼接后的下标, 每个下标属于第几个区间)
+    只展开选中的区间，不对整表做布尔掩码
+    """
+    lengths = np.maximum(stops - starts, 0)
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    idx = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return idx, owner
+
+
+def cell_keys(day: np.ndarray, tbin: np.ndarray, op: np.ndarray) -> np.ndarray:
+    # 在一块 int64 数组上原地拼位，不为每个字段各生成一份中间数组
+    keys = day.astype(np.int64) << _DAY_SHIFT
+    keys |= tbin.astype(np.int64) << _BIN_SHIFT
+    keys |= op
+    return keys
+
+
+def split_keys(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    return (
+        (keys >> _DAY_SHIFT).astype(np.int32),
+        ((keys >> _BIN_SHIFT) & _BIN_MASK).astype(np.int32),
+        (keys & _LOW_MASK).astype(np.int32),
+    )
+
+
+def _run_starts(sorted_keys: np.ndarray) -> np.ndarray:
+    """
+    已排序数组中每一段相同值的起点
+    """
+    if len(sorted_keys) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+
+
+def _bit_length(v: np.ndarray) -> np.ndarray:
+    # uint64 的有效位数（向量化二分，避免 float log2 的舍入误差）
+    v = v.copy()
+    n = np.zeros(v.shape, dtype=np.int64)
+    for s in (32, 16, 8, 4, 2, 1):
+        big = v >= (np.uint64(1) << np.uint64(s))
+        v[big] >>= np.uint64(s)
+        n += big * s
+    return n + (v > 0)
+
+
+def _sparse_max(cell: np.ndarray, reg: np.ndarray, rank: np.ndarray, n_cells: int) -> tuple:
+    """
+    (cell, 寄存器下标, rank) 三元组 -> 每个 (cell, 寄存器) 只留最大 rank，按 (cell, 寄存器) 排序
+    返回 (CSR 偏移, 寄存器下标, rank)
+    """
+    pair = (cell.astype(np.int64) << 16) | reg
+    order = np.argsort(pair, kind="stable")
+    pair = pair[order]
+    starts = _run_starts(pair)
+    rank = np.maximum.reduceat(rank[order], starts) if len(starts) else rank[:0]
+    offsets = np.r_[0, np.cumsum(np.bincount(pair[starts] >> 16, minlength=n_cells))]
+    return offsets, (pair[starts] & 0xFFFF).astype(np.uint16), rank
+
+
+def hll_estimate(offsets: np.ndarray, ranks: np.ndarray, m: int) -> np.ndarray:
+    """
+    每一组稀疏寄存器（CSR：offsets 划分 ranks，未出现的寄存器为 0）-> 基数估计（标准 HLL + 小基数线性计数修正）
+    """
+    n = len(offsets) - 1
+    owner = np.repeat(np.arange(n), np.diff(offsets))
+    zeros = m - np.diff(offsets)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / (zeros + np.bincount(owner, weights=np.exp2(-ranks.astype(np.float64)), minlength=n))
+    with np.errstate(divide="ignore"):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+class ScanCube:
+    """
+    单个数据集的预聚合立方体，cell = (op_day, time_bin, Operator)
+
+    cell 上除了去重结构，还记录扫描行数和最早 / 最晚扫描时间，
+    这样页眉的 Records / 时间范围也不需要回到明细表。
+    """
+
+    def __init__(self, mode: str = "exact", hll_p: int = HLL_P, bin_minutes: int = BASE_BIN_MINUTES):
+        if mode not in ("exact", "hll"):
+            raise ValueError(f"Unknown cube mode: {mode}")
+        if not 4 <= hll_p <= 16:
+            raise ValueError(f"hll_p={hll_p} must be within [4, 16]")
+        if (24 * 60) % bin_minutes:
+            raise ValueError(f"bin_minutes={bin_minutes} does not divide a day")
+        self.mode = mode
+        self.hll_p = hll_p
+        self.bin_minutes = bin_minutes
+        self.operators = pd.Index([], dtype=object)
+
+        self.keys = np.zeros(0, dtype=np.int64)       # 排好序的 cell key
+        self.rows = np.zeros(0, dtype=np.int64)       # 每个 cell 的扫描行数
+        self.t_min = np.zeros(0, dtype=np.int64)      # ns epoch
+        self.t_max = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)    # 每个 cell 在 waybills / reg_idx + reg_rank 里的 CSR 偏移
+        self.waybills = np.zeros(0, dtype=np.int64)   # exact：每个 cell 内去重、排序的 waybill_id
+        self.reg_idx = np.zeros(0, dtype=np.uint16)   # hll：每个 cell 的非零寄存器下标（升序）
+        self.reg_rank = np.zeros(0, dtype=np.uint8)   # hll：对应寄存器的值
+        self._pending = []  # 尚未合并进来的增量批次
+        self._pending_cells = 0
+
+    # ---------- 构建 ----------
+    @classmethod
+    @timed("cube_build")
+    def from_frame(cls, df: pd.DataFrame, mode: str = "exact", hll_p: int = HLL_P,
+                   bin_minutes: int = BASE_BIN_MINUTES) -> "ScanCube":
+        """
+        由 preprocess 之后的扫描记录构建
+        """
+        cube = cls(mode=mode, hll_p=hll_p, bin_minutes=bin_minutes)
+        cube.add_frame(df)
+        return cube
+
+    def copy(self) -> "ScanCube":
+        """
+        浅拷贝：合并时总是生成新数组、从不原地修改，所以两份立方体可以安全共享底层数组
+        """
+        self.flush()
+        other = ScanCube(mode=self.mode, hll_p=self.hll_p, bin_minutes=self.bin_minutes)
+        other.operators = self.operators
+        for k, v in self._state().items():
+            setattr(other, k, v)
+        return other
+
+    def _remap_operators(self, names: pd.Index) -> np.ndarray:
+        """
+        一批 Operator 名称 -> 立方体全局编码表里的编码（新名字追加到末尾）
+        """
+        idx = self.operators.get_indexer(names)
+        new = idx < 0
+        if new.any():
+            idx[new] = len(self.operators) + np.arange(new.sum())
+            self.operators = self.operators.append(names[new])
+        return idx
+
+    def _op_codes(self, operators: pd.Series) -> np.ndarray:
+        remap = self._remap_operators(pd.Index(operators.cat.categories))
+        return remap[operators.cat.codes.to_numpy()]
+
+    def merge(self, other: "ScanCube") -> None:
+        """
+        合并另一份立方体（例如并行解析的另一个文件），两边的 Operator 编码表可以不同
+        """
+        if (other.mode, other.hll_p, other.bin_minutes) != (self.mode, self.hll_p, self.bin_minutes):
+            raise ValueError("Cannot merge cubes with different mode / hll_p / bin_minutes")
+        other.flush()
+        if len(other.keys) == 0:
+            return
+        day, tbin, op = split_keys(other.keys)
+        part = other._state()
+        part["keys"] = cell_keys(day, tbin, self._remap_operators(other.operators)[op])
+        self._pending.append(part)
+        self._pending_cells += len(part["keys"])
+        if self._pending_cells >= len(self.keys):
+            self.flush()
+
+    def add_frame(self, df: pd.DataFrame) -> None:
+        """
+        把一批扫描记录折叠进立方体（增量：已有 cell 做集合并 / 寄存器取 max）
+        """
+        if df.empty:
+            return
+        t = df["op_time"].to_numpy().view(np.int64)
+        keys = cell_keys(df["op_day"].to_numpy(), bin_codes(t, self.bin_minutes), self._op_codes(df["Operator"]))
+        wb = df["waybill_id"].to_numpy()
+
+        order = np.lexsort((wb, keys))
+        keys, wb, t = keys[order], wb[order], t[order]
+        starts = _run_starts(keys)
+
+        part = {
+            "keys": keys[starts],
+            "rows": np.diff(np.r_[starts, len(keys)]),
+            "t_min": np.minimum.reduceat(t, starts),
+            "t_max": np.maximum.reduceat(t, starts),
+        }
+        if self.mode == "exact":
+            uniq = np.r_[True, (keys[1:] != keys[:-1]) | (wb[1:] != wb[:-1])]
+            part["offsets"] = np.r_[0, np.cumsum(np.add.reduceat(uniq, starts, dtype=np.int64))]
+            part["waybills"] = wb[uniq]
+        else:
+            cell = np.repeat(np.arange(len(starts)), part["rows"])
+            part["offsets"], part["reg_idx"], part["reg_rank"] = _sparse_max(cell, *self._hll_hash(wb), len(starts))
+
+        # 分层合并：攒够与已有规模相当的增量再一次性合并，流式逐块追加时总代价是 O(n log n)
+        self._pending.append(part)
+        self._pending_cells += len(part["keys"])
+        if self._pending_cells >= len(self.keys):
+            self.flush()
+
+    def _hll_hash(self, wb: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        waybill_id（本身已是单号哈希）-> (寄存器下标, rank)：高 p 位选寄存器，其余位的前导零个数 + 1
+        """
+        p = self.hll_p
+        x = wb.view(np.uint64)
+        idx = (x >> np.uint64(64 - p)).astype(np.int64)
+        rest = x & ((np.uint64(1) << np.uint64(64 - p)) - np.uint64(1))
+        rho = ((64 - p) - _bit_length(rest) + 1).astype(np.uint8)
+        return idx, rho
+
+    def _state(self) -> dict:
+        state = {"keys": self.keys, "rows": self.rows, "t_min": self.t_min, "t_max": self.t_max,
+                 "offsets": self.offsets}
+        if self.mode == "exact":
+            state["waybills"] = self.waybills
+        else:
+            state.update(reg_idx=self.reg_idx, reg_rank=self.reg_rank)
+        return state
+
+    def flush(self) -> None:
+        """
+        把所有待合并批次并入立方体：同一个 cell 做集合并 / 寄存器取 max
+        """
+        if self._pending:
+            self._merge_pending()
+
+    @timed("cube_flush")
+    def _merge_pending(self) -> None:
+        parts = ([self._state()] if len(self.keys) else []) + self._pending
+        self._pending = []
+        self._pending_cells = 0
+        if len(parts) == 1 and np.all(parts[0]["keys"][1:] > parts[0]["keys"][:-1]):
+            # 空立方体上的第一批（add_frame 产出的 cell 已排序、不重复）：直接采用，不再拼接重排一遍
+            for k, v in parts[0].items():
+                setattr(self, k, v)
+            return
+
+        keys = np.concatenate([part["keys"] for part in parts])
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        starts = _run_starts(keys)
+
+        def combine(name, ufunc):
+            return ufunc.reduceat(np.concatenate([part[name] for part in parts])[order], starts)
+
+        self.rows = combine("rows", np.add)
+        self.t_min = combine("t_min", np.minimum)
+        self.t_max = combine("t_max", np.maximum)
+
+        # 展开成 (cell, waybill) / (cell, 寄存器) 对，合并后按 cell 重新去重 / 取 max
+        new_cell = np.empty(len(order), dtype=np.int64)  # 拼接位置 -> 合并后的 cell 编号
+        new_cell[order] = np.cumsum(np.r_[True, keys[1:] != keys[:-1]]) - 1
+        pair_cell = np.repeat(new_cell, np.concatenate([np.diff(part["offsets"]) for part in parts]))
+        if self.mode == "exact":
+            wb = np.concatenate([part["waybills"] for part in parts])
+            o = np.lexsort((wb, pair_cell))
+            pair_cell, wb = pair_cell[o], wb[o]
+            uniq = np.r_[True, (pair_cell[1:] != pair_cell[:-1]) | (wb[1:] != wb[:-1])]
+            self.waybills = wb[uniq]
+            self.offsets = np.r_[0, np.cumsum(np.bincount(pair_cell[uniq], minlength=len(starts)))]
+        else:
+            self.offsets, self.reg_idx, self.reg_rank = _sparse_max(
+                pair_cell,
+                np.concatenate([part["reg_idx"] for part in parts]),
+                np.concatenate([part["reg_rank"] for part in parts]),
+                len(starts),
+            )
+
+        self.keys = keys[starts]
+
+    # ---------- 查询 ----------
+    def select_cells(self, day_lo: int, day_hi: int, start_hour: int, end_hour: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        选出某个 shift 在 [day_lo, day_hi]（按 shift 归属日期）内的 cell：每个归属日二分查找一次，不扫全部 cell
+        跨午夜的 shift（start_hour > end_hour）：午夜后的部分归属前一天；cell 按开始时刻归属
+        返回 (cell 下标, cell 的 shift 归属日)
+        """
+        self.flush()
+        # keys 按 (day, bin, op) 排序即按时间排序：每个归属日的时间窗对应 keys 上一段连续区间
+        bins_per_day = MINUTES_PER_DAY // self.bin_minutes
+        bounds = [-(-m // self.bin_minutes) for m in shift_windows(day_lo, day_hi, start_hour, end_hour)]
+        starts, stops = (
+            np.searchsorted(self.keys, cell_keys(g // bins_per_day, g % bins_per_day, np.zeros_like(g)))
+            for g in bounds
+        )
+        cells, owner = span_rows(starts, stops)
+        return cells, (day_lo + owner).astype(np.int32)
+
+    def distinct_counts(self, cells: np.ndarray, group: np.ndarray, n_groups: int) -> np.ndarray:
+        """
+        把选中的 cell 按 group 合并后求去重 waybill 数（group 与 cells 一一对应）
+        """
+        if len(cells) == 0:
+            return np.zeros(n_groups, dtype=np.int64)
+        lengths = self.offsets[cells + 1] - self.offsets[cells]
+        pair_group = np.repeat(group, lengths)
+        # CSR gather：每个 cell 的 [offset, offset + length)
+        base = np.repeat(self.offsets[cells] - np.r_[0, np.cumsum(lengths)[:-1]], lengths)
+        pos = base + np.arange(lengths.sum())
+        if self.mode == "exact":
+            wb = self.waybills[pos]
+            o = np.lexsort((wb, pair_group))
+            pair_group, wb = pair_group[o], wb[o]
+            uniq = np.r_[True, (pair_group[1:] != pair_group[:-1]) | (wb[1:] != wb[:-1])]
+            return np.bincount(pair_group[uniq], minlength=n_groups)
+
+        offsets, _, ranks = _sparse_max(pair_group, self.reg_idx[pos], self.reg_rank[pos], n_groups)
+        return np.rint(hll_estimate(offsets, ranks, 1 << self.hll_p)).astype(np.int64)
+
+    @timed("cube_query")
+    def query(self, day_lo: int, day_hi: int, start_hour: int, end_hour: int, bin_minutes: int = None) -> dict:
+        """
+        一个 (日期范围, shift) 选择 -> Operator × time_bin 去重扫描量 + 页眉统计
+        pivot 的列是 time_bin 整数编码（按 bin_minutes 粒度，默认与立方体相同），行是 Operator 名称
+        """
+        bin_minutes = bin_minutes or self.bin_minutes
+        if bin_minutes % self.bin_minutes:
+            raise ValueError(f"bin_minutes={bin_minutes} is not a multiple of cube bins ({self.bin_minutes})")
+
+        cells, _ = self.select_cells(day_lo, day_hi, start_hour, end_hour)
+        _, tbin, op = split_keys(self.keys[cells])
+        tbin = tbin * self.bin_minutes // bin_minutes
+
+        n_bins = 24 * 60 // bin_minutes
+        group = op.astype(np.int64) * n_bins + tbin
+        uniq_groups, group_idx = np.unique(group, return_inverse=True)
+        counts = self.distinct_counts(cells, group_idx, len(uniq_groups))
+
+        pivot = pd.Series(
+            counts,
+            index=pd.MultiIndex.from_arrays(
+                [self.operators[uniq_groups // n_bins], uniq_groups % n_bins],
+                names=["Operator", "time_bin"],
+            ),
+            dtype=float,
+        ).unstack("time_bin", fill_value=0)
+
+        return {
+            "pivot": pivot,
+            "n_records": int(self.rows[cells].sum()),
+            "n_operators": int(len(np.unique(op))),
+            "t_min": int(self.t_min[cells].min()) if len(cells) else None,
+            "t_max": int(self.t_max[cells].max()) if len(cells) else None,
+        }
+
+    def day_range(self) -> tuple[int, int]:
+        self.flush()
+        if len(self.keys) == 0:
+            raise ValueError("Empty cube")
+        day, _, _ = split_keys(self.keys[[0, -1]])
+        return int(day[0]), int(day[1])
+
+    def nbytes(self) -> int:
+        self.flush()
+        arrays = [self.keys, self.rows, self.t_min, self.t_max, self.offsets, self.waybills, self.reg_idx, self.reg_rank]
+        return int(sum(a.nbytes for a in arrays))
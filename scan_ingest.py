@@ -0,0 +1,463 @@
+from operator import itemgetter
+
+import hashlib
+import io
+import multiprocessing as mp
+import os
+import sys
+import types
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from pandas.api.types import union_categoricals
+from openpyxl import load_workbook
+
+from instrument import timed
+from labor_groups import classify_operators
+from scan_cube import BASE_BIN_MINUTES, ScanCube, bin_codes
+
+# ======================
+# 扫描记录清洗 + 流式读取
+# ======================
+NEEDED_COLUMNS = ["Operation time", "Operator", "Waybill No."]
+NS_PER_HOUR = 3_600_000_000_000
+NS_PER_DAY = 24 * NS_PER_HOUR
+NO_KEYS = np.zeros(0, dtype=np.int64)  # 空的行指纹集合
+CHUNK_ROWS = 200_000  # 流式读取每块行数：峰值内存与它成正比，而不是与文件大小成正比
+INGEST_CACHE_DIR = Path(os.environ.get("OEA_INGEST_CACHE_DIR", ".cache/ingest"))  # 解析后的列式缓存
+PIPELINE_BACKEND = os.environ.get("OEA_PIPELINE_BACKEND", "pandas")  # "pandas" | "polars"（见 polars_backend.py）
+
+
+def parse_op_time(s: pd.Series) -> pd.Series:
+    """
+    先按导出固定格式 "%H:%M:%S %d/%m/%Y" 解析（快），失败的行再用 dayfirst 推断兜底
+    （兜底行格式不一，pandas 推断不出统一格式时每块都会警告一次，这里只屏蔽这一条）
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s if s.dtype == "datetime64[ns]" else s.astype("datetime64[ns]")
+    t = pd.to_datetime(s, format="%H:%M:%S %d/%m/%Y", errors="coerce")
+    retry = t.isna() & s.notna()
+    if retry.any():
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", message="Could not infer format", category=UserWarning)
+            t[retry] = pd.to_datetime(s[retry], dayfirst=True, errors="coerce")
+    return t if t.dtype == "datetime64[ns]" else t.astype("datetime64[ns]")
+
+
+def encode_operators(s: pd.Series) -> tuple[np.ndarray, pd.Index]:
+    """
+    Operator -> (整数编码, 名称表)；只在去重后的名称上做 strip / 空值判断
+    无效（缺失、空串、"nan"）编码为 -1
+    """
+    codes, uniques = pd.factorize(s)
+    names = pd.Index(uniques.astype(str)).str.strip()
+    valid = (names != "") & (names.str.lower() != "nan")
+    name_codes, categories = pd.factorize(names[valid])  # strip 之后可能重名，再合并一次
+    remap = np.full(len(names) + 1, -1, dtype=np.int64)  # 最后一格给 codes == -1
+    remap[:-1][valid] = name_codes
+    return remap[codes], pd.Index(categories)
+
+
+def encode_waybills(s: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Waybill No. -> 稳定的 int64 ID（对文本做 64 位哈希，跨文件一致，不需要共享字典）
+    返回 (ids, 是否有效)
+    """
+    codes, uniques = pd.factorize(s)
+    if pd.api.types.is_float_dtype(uniques):
+        uniques = uniques.astype("Int64")  # Excel 把纯数字单号读成 float 时，去掉 ".0"
+    ids = pd.util.hash_array(np.asarray(uniques.astype(str), dtype=object)).view(np.int64)
+    return ids[codes], codes >= 0
+
+
+@timed("preprocess")
+def preprocess(df: pd.DataFrame, backend: str = None) -> pd.DataFrame:
+    """
+    原始扫描表 -> 紧凑类型化的扫描记录：
+    - Operator: category
+    - waybill_id: int64（单号哈希）
+    - op_time: datetime64[ns]（底层即 int64 epoch）
+    - op_day: int32 日序号（1970-01-01 起的天数）
+    - hour: int8 小时；time_bin: int16 当天第几个 BASE_BIN_MINUTES 分钟段（展示时再转成标签）
+    backend：默认取 PIPELINE_BACKEND；"polars" 时走 polars_backend，输出相同
+    """
+    miss = set(NEEDED_COLUMNS) - set(df.columns)
+    if miss:
+        raise ValueError(f"Missing columns: {miss}")
+    if (backend or PIPELINE_BACKEND) == "polars":
+        from polars_backend import preprocess_polars  # 可选依赖：只在选用时导入
+        return preprocess_polars(df)
+
+    # 时间解析：如 "14:59:55 13/12/2025"
+    op_time = parse_op_time(df["Operation time"])
+
+    # Operator / Waybill 编码（去掉缺失、空 Operator 和时间解析失败的行）
+    op_codes, operators = encode_operators(df["Operator"])
+    waybill_ids, waybill_ok = encode_waybills(df["Waybill No."])
+    keep = (op_codes >= 0) & waybill_ok & op_time.notna().to_numpy()
+
+    t_ns = op_time.to_numpy()[keep].view(np.int64)
+    ops = pd.Categorical.from_codes(op_codes[keep], categories=operators).remove_unused_categories()
+    return scan_frame(ops, waybill_ids[keep], t_ns)
+
+
+def scan_frame(operators: pd.Categorical, waybill_ids: np.ndarray, t_ns: np.ndarray) -> pd.DataFrame:
+    """
+    (Operator, waybill_id, ns 时间) -> preprocess 的输出格式；op_day / hour / time_bin 都由时间算术派生
+    传入的数组直接作为列（copy=False），不再复制一份；下游只读、从不原地修改这些列
+    """
+    return pd.DataFrame({
+        "Operator": operators,
+        "waybill_id": waybill_ids,
+        "op_time": t_ns.view("datetime64[ns]"),
+        "op_day": (t_ns // NS_PER_DAY).astype(np.int32),
+        "hour": ((t_ns // NS_PER_HOUR) % 24).astype(np.int8),
+        "time_bin": bin_codes(t_ns, BASE_BIN_MINUTES),
+    }, copy=False)
+
+
+def is_csv(source) -> bool:
+    name = getattr(source, "name", source)
+    return str(name).lower().endswith(".csv")
+
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Excel 里的混合类型列（如 Waybill No. 同时有数字和文本）Arrow 写不进去，统一转成字符串
+    """
+    for col in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    df.columns = [str(c) for c in df.columns]
+    return df
+
+
+@timed("read_export")
+def read_export_cached(source, digest: str, cache_dir: Path = INGEST_CACHE_DIR) -> pd.DataFrame:
+    """
+    内容寻址的解析缓存：
+    - 第一次见到某个工作簿 / CSV：解析一次，写成未压缩 Arrow 文件（key = 内容哈希）
+    - 之后（跨 rerun / session / 重启）：直接 memory-map 列式文件，不再解析 Excel
+    """
+    path = cache_dir / f"{digest}.arrow"
+    if not path.exists():
+        df = _arrow_safe(pd.read_csv(source, dtype=str) if is_csv(source) else pd.read_excel(source))
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            feather.write_feather(df, tmp, compression="uncompressed")
+            os.replace(tmp, path)  # 原子替换，并发 session 不会读到半个文件
+        except OSError:
+            return df  # 缓存目录不可写时退化为直接解析
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+def is_cached(digest: str, cache_dir: Path = INGEST_CACHE_DIR) -> bool:
+    return (cache_dir / f"{digest}.arrow").exists()
+
+
+def named_buffer(data: bytes, name: str) -> io.BytesIO:
+    # 进程间只传 bytes；文件名用来区分 CSV / Excel
+    buf = io.BytesIO(data)
+    buf.name = name
+    return buf
+
+
+def iter_excel_chunks(source, chunk_rows: int = CHUNK_ROWS):
+    """
+    openpyxl 只读模式逐行迭代第一张 sheet，只保留需要的三列，每 chunk_rows 行产出一个 DataFrame
+    """
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = [None if h is None else str(h).strip() for h in next(rows, ())]
+        miss = set(NEEDED_COLUMNS) - set(header)
+        if miss:
+            raise ValueError(f"Missing columns: {miss}")
+        pick = itemgetter(*[header.index(c) for c in NEEDED_COLUMNS])
+
+        buf = []
+        for row in rows:
+            if len(row) < len(header):  # 只读模式下行尾空单元格可能被截掉
+                row = row + (None,) * (len(header) - len(row))
+            buf.append(pick(row))
+            if len(buf) >= chunk_rows:
+                yield pd.DataFrame.from_records(buf, columns=NEEDED_COLUMNS)
+                buf = []
+        if buf:
+            yield pd.DataFrame.from_records(buf, columns=NEEDED_COLUMNS)
+    finally:
+        wb.close()
+
+
+def iter_csv_chunks(source, chunk_rows: int = CHUNK_ROWS):
+    """
+    CSV 导出：按块读取，全部按文本读入（与 Excel 文本单号的哈希保持一致）
+    """
+    header = pd.read_csv(source, nrows=0).columns
+    miss = set(NEEDED_COLUMNS) - set(header)
+    if miss:
+        raise ValueError(f"Missing columns: {miss}")
+    if hasattr(source, "seek"):
+        source.seek(0)
+    yield from pd.read_csv(source, usecols=NEEDED_COLUMNS, dtype=str, chunksize=chunk_rows)
+
+
+def iter_scan_chunks(source, chunk_rows: int = CHUNK_ROWS):
+    if hasattr(source, "seek"):
+        source.seek(0)
+    if is_csv(source):
+        return iter_csv_chunks(source, chunk_rows)
+    return iter_excel_chunks(source, chunk_rows)
+
+
+def iter_preprocessed(source, chunk_rows: int = CHUNK_ROWS):
+    for chunk in iter_scan_chunks(source, chunk_rows):
+        yield preprocess(chunk)
+
+
+def row_fingerprints(df: pd.DataFrame) -> np.ndarray:
+    """
+    每行扫描的指纹 (Operator, waybill, 扫描时间) -> int64，用于追加时去重
+    （category 按取值哈希，不同批次编码表不同也一致）
+    """
+    cols = df[["Operator", "waybill_id", "op_time"]]
+    return pd.util.hash_pandas_object(cols, index=False).to_numpy().view(np.int64)
+
+
+def dedupe_rows(df: pd.DataFrame, seen: np.ndarray) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    去掉与 seen（排好序的行指纹）相同、以及 df 内部重复的行 -> (留下的行, 它们排好序的指纹)
+    没有重复时原样返回 df，不复制
+    """
+    uniq, first = np.unique(row_fingerprints(df), return_index=True)
+    new = ~np.isin(uniq, seen, assume_unique=True)
+    if len(uniq) == len(df) and new.all():
+        return df, uniq
+    return df.iloc[np.sort(first[new])], uniq[new]
+
+
+def time_order(t_ns: np.ndarray):
+    """
+    按时间稳定排序的下标；已经有序时返回 None（调用方直接沿用原数组）
+    """
+    if np.all(t_ns[1:] >= t_ns[:-1]):
+        return None
+    return np.argsort(t_ns, kind="stable")
+
+
+def concat_scans(frames: list, by_time: bool = False) -> pd.DataFrame:
+    """
+    拼接多批 preprocess 结果；Operator 用 union_categoricals 合并编码表，避免退化成 object
+    by_time：同时按 op_time 稳定排序。逐列拼接、立即重排，峰值只多一列临时数组，
+    不会先拼出一整张未排序的表再复制一遍
+    """
+    frames = [f for f in frames if len(f)]
+    if len(frames) == 1:
+        return sort_by_time(frames[0]) if by_time else frames[0]
+    order = None
+    if by_time:
+        order = time_order(np.concatenate([f["op_time"].to_numpy().view(np.int64) for f in frames]))
+    columns = {}
+    for c in frames[0].columns:
+        if c == "Operator":
+            col = union_categoricals([f[c] for f in frames])
+        else:
+            col = np.concatenate([f[c].to_numpy() for f in frames])
+        columns[c] = col if order is None else col.take(order)
+    return pd.DataFrame(columns, copy=False)
+
+
+@timed("sort_by_time")
+def sort_by_time(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    明细按 op_time 稳定排序（已有序时原样返回）：之后任意 (日期范围, shift) 都是几段连续行，二分即可定位
+    """
+    order = time_order(df["op_time"].to_numpy().view(np.int64))
+    if order is None:
+        return df
+    out = df.take(order)
+    out.index = pd.RangeIndex(len(out))  # 新对象上原地换索引；reset_index 会把整表再深拷贝一次
+    return out
+
+
+class ScanDataset:
+    """
+    一个可追加的数据集：明细扫描记录（按 op_time 排序；流式入库时为 None）+ 立方体 + 已见过的行指纹
+
+    同一 (Operator, waybill, 扫描时间) 的行只计一次，不论出现在同一份文件里、多份一起加载还是后来追加，
+    Records 总数与加载顺序无关
+    追加返回新的 ScanDataset，旧对象不变（缓存里的数据集可能被多个 session 共用）
+    """
+
+    def __init__(self, dataset_id: str, cube: ScanCube, rows: pd.DataFrame = None,
+                 row_keys: np.ndarray = None, sources: tuple = (), parent_id: str = None):
+        self.dataset_id = dataset_id
+        self.cube = cube
+        self.rows = rows
+        self._row_keys = row_keys
+        self.sources = sources
+        self.parent_id = parent_id
+        self.last_append = None  # (新增行数, 跳过的重复行数)
+        self.appended_days = np.zeros(0, dtype=np.int32)  # 上次追加的新行落在哪些 op_day（下游据此只刷新这些日期）
+        self._operator_groups = {}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, dataset_id: str, mode: str = "exact", sources: tuple = None) -> "ScanDataset":
+        sources = sources or (dataset_id.split("::", 1)[1],)
+        df, row_keys = dedupe_rows(df, NO_KEYS)
+        return cls(dataset_id, ScanCube.from_frame(df, mode=mode), rows=sort_by_time(df), row_keys=row_keys,
+                   sources=sources)
+
+    @classmethod
+    def combine(cls, parts: list, dataset_id: str, reread=None) -> "ScanDataset":
+        """
+        多份独立解析的数据集（如并行解析的多个文件）拼成一个：明细拼接、立方体合并
+        各份之间有重复行时，后面的份只折叠没见过的行；流式解析的份没有明细，
+        这时用 reread(i) 重新逐块读取第 i 份（preprocess 之后的块），没有 reread 则报错
+        """
+        cube = parts[0].cube.copy()
+        row_keys = parts[0].row_keys
+        keep_rows = all(p.rows is not None for p in parts)
+        frames = [parts[0].rows]
+        for i, part in enumerate(parts[1:], 1):
+            if not np.isin(part.row_keys, row_keys, assume_unique=True).any():
+                cube.merge(part.cube)
+                row_keys = np.union1d(row_keys, part.row_keys)
+                frames.append(part.rows)
+                continue
+            if part.rows is not None:
+                chunks = [part.rows]
+            elif reread is not None:
+                chunks = reread(i)
+            else:
+                raise ValueError(f"streamed export {part.dataset_id} overlaps earlier exports and cannot be re-read")
+            row_keys, fresh, *_ = cls._fold(cube, row_keys, chunks, keep_rows)
+            frames += fresh
+        cube.flush()
+        rows = concat_scans(frames, by_time=True) if keep_rows else None
+        sources = tuple(d for p in parts for d in p.sources)
+        return cls(dataset_id, cube, rows=rows, row_keys=row_keys, sources=sources)
+
+    @classmethod
+    @timed("stream_ingest")
+    def from_stream(cls, source, dataset_id: str, mode: str = "exact", chunk_rows: int = CHUNK_ROWS) -> "ScanDataset":
+        """
+        大文件流式入库：逐块读取 -> preprocess -> 折叠进立方体，全程不物化整张扫描表
+        （exact 模式内存 ~ 去重后的 (cell, waybill) 对 + 行指纹；hll 模式 ~ 去重后的 (cell, 非零寄存器) 对 + 行指纹）
+        """
+        cube = ScanCube(mode=mode)
+        row_keys, *_ = cls._fold(cube, NO_KEYS, iter_preprocessed(source, chunk_rows), keep_rows=False)
+        cube.flush()
+        digest = dataset_id.split("::", 1)[1]
+        return cls(dataset_id, cube, row_keys=row_keys, sources=(digest,))
+
+    @staticmethod
+    def _fold(cube: ScanCube, row_keys: np.ndarray, frames, keep_rows: bool) -> tuple:
+        """
+        逐批去重后折叠进 cube（不 flush）-> (更新后的行指纹, 留下的各批明细, 各批新行的 op_day, 新增行数, 跳过行数)
+        """
+        kept, days, added, skipped = [], [], 0, 0
+        for df in frames:
+            fresh, keys = dedupe_rows(df, row_keys)
+            cube.add_frame(fresh)
+            row_keys = np.union1d(row_keys, keys)
+            days.append(np.unique(fresh["op_day"].to_numpy()))
+            if keep_rows:
+                kept.append(fresh)
+            added += len(fresh)
+            skipped += len(df) - len(fresh)
+        return row_keys, kept, days, added, skipped
+
+    def operator_groups(self, groups: dict) -> pd.Series:
+        """
+        立方体里每个 Operator -> 劳务组代码（category），同一注册表每个数据集只算一次
+        """
+        key = tuple(groups.items())
+        if key not in self._operator_groups:
+            self._operator_groups[key] = classify_operators(self.cube.operators, groups)
+        return self._operator_groups[key]
+
+    def nbytes(self) -> int:
+        """
+        占用内存估算：立方体 + 明细（流式入库时没有）+ 行指纹
+        """
+        n = self.cube.nbytes()
+        if self.rows is not None:
+            n += int(self.rows.memory_usage(deep=True).sum())
+        if self._row_keys is not None:
+            n += self._row_keys.nbytes
+        return n
+
+    @property
+    def row_keys(self) -> np.ndarray:
+        # 排好序的行指纹；明细模式下第一次追加时才计算
+        if self._row_keys is None:
+            self._row_keys = np.unique(row_fingerprints(self.rows))
+        return self._row_keys
+
+    def appended(self, frames, digest: str) -> "ScanDataset":
+        """
+        追加一份新导出（preprocess 之后的一批或多批）：
+        - 与已有数据、以及本批内部相同 (Operator, waybill, 时间) 的行跳过
+        - 立方体只折叠新行；不重读、不重新清洗已有数据
+        """
+        cube = self.cube.copy()
+        row_keys, fresh_frames, fresh_days, added, skipped = self._fold(cube, self.row_keys, frames,
+                                                                        keep_rows=self.rows is not None)
+        cube.flush()
+
+        rows = None if self.rows is None else concat_scans([self.rows] + fresh_frames, by_time=True)
+        dataset_id = "append::" + hashlib.md5(f"{self.dataset_id}|{digest}".encode()).hexdigest()
+        out = ScanDataset(dataset_id, cube, rows=rows, row_keys=row_keys,
+                          sources=self.sources + (digest,), parent_id=self.dataset_id)
+        out.last_append = (added, skipped)
+        if fresh_days:
+            out.appended_days = np.unique(np.concatenate(fresh_days))
+        return out
+
+
+# ---------- 进程池 worker（参数 / 返回值都要可 pickle）----------
+def _wait_for_siblings(barrier) -> None:
+    barrier.wait()
+
+
+def make_process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    spawn 方式的进程池（不 fork 带着服务线程的进程）
+
+    spawn 子进程启动时会按 __main__.__file__ 重新执行主模块，而 Streamlit 把页面脚本装成了 __main__，
+    所以建池时临时换成空模块，并借助 barrier 一次性拉起全部 worker（之后 submit 不会再起新进程）
+    """
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(max_workers)
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        pool = ProcessPoolExecutor(max_workers, mp_context=ctx, initializer=_wait_for_siblings, initargs=(barrier,))
+        for f in [pool.submit(int) for _ in range(max_workers)]:
+            f.result()
+    finally:
+        sys.modules["__main__"] = main
+    return pool
+
+
+def parse_export(data: bytes, name: str, digest: str, mode: str = "exact") -> ScanDataset:
+    """
+    解析 + 清洗 + 建立方体一份导出（走列式缓存），在独立进程里跑，绕开 GIL
+    已有列式缓存时调用方可以传 data=None，省掉跨进程传输文件字节
+    """
+    source = None if data is None else named_buffer(data, name)
+    df = preprocess(read_export_cached(source, digest))
+    return ScanDataset.from_frame(df, "upload::" + digest, mode=mode)
+
+
+def stream_export(data: bytes, name: str, digest: str, mode: str = "exact") -> ScanDataset:
+    return ScanDataset.from_stream(named_buffer(data, name), "upload::" + digest, mode=mode)
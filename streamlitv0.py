@@ -1,10 +1,32 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import plotly.graph_objects as go
-import re
+import plotly.io as pio
+import os
 import hashlib
-from datetime import date
+import uuid
+
+from charts import (
+    LARGE_TEAM_THRESHOLD, LARGE_TEAM_TOP_N,
+    fig_sorter_vs_total, fig_labor_group_lines, make_employee_curve_fig, make_quadrant_fig, make_trend_fig,
+    make_idle_hist_fig,
+)
+from daily_rollup import TREND_METRICS, RollupRegistry, daily_trend, refresh_archive_rollup
+from dataset_store import DatasetStore
+from idle_gaps import IDLE_GAP_MINUTES, active_relative_efficiency, idle_histogram, scan_gaps
+from instrument import stage, timed, start_stage_log, stop_stage_log
+from live_feed import LIVE_FEED, LIVE_REFRESH_SECONDS, LiveFeed
+from prefetch import Prefetcher, neighbour_selections
+from result_cache import RESULT_CACHE_MB, ResultCache
+from scan_archive import archive_days, archive_export, archive_version, is_archived, open_archive
+from report_engine import (
+    DEFAULT_SORTER_NAME, SHIFT_OPTIONS, CUBE_MODE, LABOR_GROUPS, TIME_BIN_OPTIONS, DEFAULT_BIN_MINUTES,
+    date_to_day, day_to_date, filter_by_shift, kpi_summary, run_pipeline, run_group,
+    calc_team_avg_hourly_scan, pick_bottom_3_efficiency,
+)
+from scan_ingest import (
+    ScanDataset, preprocess, iter_preprocessed, read_export_cached, is_cached,
+    parse_export, stream_export, make_process_pool,
+)
 
 # ======================
 # Page config
@@ -43,535 +65,279 @@ div[data-testid="stMetric"]{
 # Config
 # ======================
 DEFAULT_FILE_PATH = "data/scanRecord_1766632272775.xlsx"
-DEFAULT_SORTER_NAME = "sorter"  # 仍保留 sorter 概念（图1需要）
-SHIFT_OPTIONS = ["Early (07-15)", "Mid (15-23)", "Night (23-07)"]
 SORTING_CENTER = "MIA.H"
+PARSE_WORKERS = int(os.environ.get("OEA_PARSE_WORKERS", min(4, os.cpu_count() or 1)))  # 多文件并行解析的进程数
+FIGURE_CACHE_MB = int(os.environ.get("OEA_FIGURE_CACHE_MB", "64"))  # 图表缓存的预算（按图表 JSON 大小计）
+DEEP_DIVE_DEFAULT = ("JOU", "RD")  # Deep Dive 默认展开的劳务组，其余组点开才计算
+STAGE_TIMINGS_DEFAULT = os.environ.get("OEA_STAGE_TIMINGS", "0") == "1"  # 侧栏阶段计时面板默认开关
+STAGE_LOG_JSON = os.environ.get("OEA_STAGE_LOG_JSON", "0") == "1"  # 每次 rerun 输出每个阶段一行 JSON 日志
 
 # ======================
 # Helpers
 # ======================
 
-def get_dataset_id(uploaded, default_path: str) -> str:
+@st.cache_data(show_spinner=False)
+def _hash_file(file_path: str, size: int, mtime_ns: int) -> str:
+    # size / mtime_ns 只参与缓存 key：文件没变就不重新读盘计算哈希
+    h = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def file_digest(file_path: str) -> str:
+    stat = os.stat(file_path)
+    return _hash_file(file_path, stat.st_size, stat.st_mtime_ns)
+
+def upload_digest(uploaded) -> str:
     """
-    用于判断当前数据集是否发生变化
+    上传文件的内容哈希；同一次上传（file_id 不变）只计算一次
     """
-    if uploaded is None:
-        return f"default::{default_path}"
-    b = uploaded.getvalue()
-    return "upload::" + hashlib.md5(b).hexdigest()
+    memo = st.session_state.setdefault("_upload_digests", {})
+    if uploaded.file_id not in memo:
+        memo[uploaded.file_id] = hashlib.md5(uploaded.getvalue()).hexdigest()
+    return memo[uploaded.file_id]
 
-def read_current_raw(uploaded, default_path: str) -> pd.DataFrame:
+def get_dataset_id(uploads: list, default_path: str) -> str:
     """
-    读取当前数据源：上传文件优先，否则默认文件
+    用于判断当前数据集是否发生变化（内容寻址：相同内容 => 相同 id）
+    多文件：与上传顺序无关，由所有文件的哈希组合而成
     """
-    if uploaded is None:
-        return load_raw(default_path)
-    return pd.read_excel(uploaded)
-
-
-
-def bin_start(tb: str) -> int:
-    return int(str(tb).split("-")[0])
-
-@st.cache_data
-def load_raw(file_path: str) -> pd.DataFrame:
-    return pd.read_excel(file_path)
-
-def preprocess(df: pd.DataFrame) -> pd.DataFrame:
-    needed = {"Operation time", "Operator", "Waybill No."}
-    miss = needed - set(df.columns)
-    if miss:
-        raise ValueError(f"Missing columns: {miss}")
-
-    df = df.copy()
-
-    # 时间解析：如 "14:59:55 13/12/2025"
-    df["op_time"] = pd.to_datetime(df["Operation time"], dayfirst=True, errors="coerce")
-
-    # Operator 清洗
-    df["Operator"] = df["Operator"].astype(str).str.strip()
-    df = df[
-        df["Operator"].notna()
-        & (df["Operator"] != "")
-        & (df["Operator"].str.lower() != "nan")
-    ].copy()
-
-    # 去掉时间解析失败
-    df = df[df["op_time"].notna()].copy()
-
-    # date / hour / time_bin
-    df["op_date"] = df["op_time"].dt.date
-    df["hour"] = df["op_time"].dt.hour
-    df["time_bin"] = df["hour"].astype(int).astype(str) + "-" + (df["hour"] + 1).astype(int).astype(str)
-
-    return df
-
-def build_pivot(df: pd.DataFrame) -> tuple[pd.DataFrame, list]:
-    agg = (
-        df.groupby(["Operator", "time_bin"])["Waybill No."]
-          .nunique()
-          .reset_index(name="scan_cnt")
-    )
-
-    time_bins = sorted(agg["time_bin"].unique(), key=bin_start)
-
-    pivot = (
-        agg.pivot_table(index="Operator", columns="time_bin", values="scan_cnt", fill_value=0)
-           .reindex(columns=time_bins)
-           .sort_index()
-    )
-
-    pivot = pivot.loc[:, (pivot != 0).any(axis=0)]
-    pivot = pivot.loc[(pivot != 0).any(axis=1), :]
-
-    time_bins = [c for c in time_bins if c in pivot.columns]
-    return pivot, time_bins
-
-def compute_time_context(df: pd.DataFrame) -> str:
+    if not uploads:
+        return "default::" + file_digest(default_path)
+    if len(uploads) == 1:
+        return "upload::" + upload_digest(uploads[0])
+    digests = sorted(upload_digest(u) for u in uploads)
+    return "multi::" + hashlib.md5("|".join(digests).encode()).hexdigest()
+
+@st.cache_resource(show_spinner=False)
+def get_parse_pool():
+    return make_process_pool(PARSE_WORKERS)
+
+@timed("parse_uploads")
+def parse_uploads(uploads: list, streaming: bool) -> list[ScanDataset]:
     """
-    专业面板时间显示：
-    - 同日：YYYY-MM-DD | HH:MM–HH:MM
-    - 跨日：YYYY-MM-DD HH:MM → YYYY-MM-DD HH:MM
+    每份上传各自 解析 + preprocess + 建立方体，多份时在进程池里并行（openpyxl 解析受 GIL 限制）
+    已有列式缓存的文件不再跨进程传输原始字节
     """
-    t_start = df["op_time"].min()
-    t_end = df["op_time"].max()
-
-    if pd.isna(t_start) or pd.isna(t_end):
-        return "-"
-
-    same_day = (t_start.date() == t_end.date())
-    if same_day:
-        return f'{t_start.strftime("%Y-%m-%d")} | {t_start.strftime("%H:%M")}–{t_end.strftime("%H:%M")}'
-    else:
-        return f'{t_start.strftime("%Y-%m-%d %H:%M")} → {t_end.strftime("%Y-%m-%d %H:%M")}'
-
-def kpi_summary(pivot: pd.DataFrame, time_bins: list, sorter_name: str):
-    if pivot.empty or len(time_bins) == 0:
-        total_series = pd.Series([], dtype=float)
-        sorter_series = pd.Series([], dtype=float)
-    else:
-        total_series = pivot.reindex(columns=time_bins).sum(axis=0)
-        sorter_series = (
-            pivot.loc[sorter_name].reindex(time_bins) if sorter_name in pivot.index
-            else pd.Series(0, index=time_bins)
-        ).fillna(0)
-
-    total_all = int(total_series.sum()) if len(total_series) else 0
-    sorter_all = int(sorter_series.sum()) if len(sorter_series) else 0
-    share = (sorter_all / total_all * 100) if total_all > 0 else 0.0
-
-    if len(total_series) > 0:
-        peak_tb = str(total_series.idxmax())
-        peak_val = int(total_series.max())
-    else:
-        peak_tb, peak_val = "-", 0
-
-    return total_all, sorter_all, share, peak_tb, peak_val
-
-def style_layout_common(fig, time_bins, y_title):
-    fig.update_layout(
-        height=520,
-        plot_bgcolor="white",
-        paper_bgcolor="white",
-        margin=dict(l=62, r=26, t=24, b=54),
-        legend=dict(
-            orientation="h",
-            yanchor="top",
-            y=1.14,
-            xanchor="left",
-            x=0,
-            font=dict(size=12),
-            title=""
-        ),
-        xaxis=dict(
-            title="Time Bin",
-            type="category",
-            categoryorder="array",
-            categoryarray=time_bins,
-            showline=True,
-            linecolor="rgba(0,0,0,0.55)",
-            linewidth=1,
-            ticks="outside",
-            tickfont=dict(size=12),
-            gridcolor="rgba(0,0,0,0.05)",
-        ),
-        yaxis=dict(
-            title=y_title,
-            showline=True,
-            linecolor="rgba(0,0,0,0.55)",
-            linewidth=1,
-            ticks="outside",
-            tickfont=dict(size=12),
-            gridcolor="rgba(0,0,0,0.07)",
-            zeroline=False,
-            rangemode="tozero"
-        ),
-        hovermode="x unified",
-    )
-    return fig
-# ************************ 各组数据可视化准备 **************************
-
-
-def build_employee_efficiency_df(
-    pivot: pd.DataFrame,
-    include_pattern: str = None,
-    exclude_pattern: str = None,
-    drop_all_zero: bool = True
-) -> pd.DataFrame:
+    worker = stream_export if streaming else parse_export
+    jobs = []
+    for u in uploads:
+        digest = upload_digest(u)
+        data = None if (not streaming and is_cached(digest)) else u.getvalue()
+        jobs.append((data, u.name, digest, CUBE_MODE))
+    if len(jobs) == 1 or PARSE_WORKERS <= 1:
+        return [worker(*job) for job in jobs]
+    return list(get_parse_pool().map(worker, *zip(*jobs)))
+
+@timed("load_dataset")
+def load_dataset(dataset_id: str, uploads: list, default_path: str, streaming: bool) -> ScanDataset:
     """
-    从 pivot 表中，按正则筛选员工，返回 员工 × time_bin 的效率 DataFrame
+    加载、清洗、建立方体（由 DatasetStore 保证每个 dataset_id 在进程内只加载一次、只存一份）
+    流式模式：逐块读取并折叠进立方体，不物化整张扫描表
     """
-
-    df = pivot.copy()
-    df.index = df.index.astype(str).str.strip()
-    df.columns = [str(c).strip() for c in df.columns]
-
-    # 自动按时间排序
-    def bin_start(tb: str) -> int:
-        return int(str(tb).split("-")[0])
-
-    time_bins = sorted(df.columns, key=bin_start)
-    df = df[time_bins]
-
-    if include_pattern:
-        mask = df.index.str.contains(include_pattern, flags=re.IGNORECASE, regex=True, na=False)
-        df = df.loc[mask]
-
-    if exclude_pattern:
-        mask = ~df.index.str.contains(exclude_pattern, flags=re.IGNORECASE, regex=True, na=False)
-        df = df.loc[mask]
-
-    if drop_all_zero:
-        df = df.loc[(df != 0).any(axis=1)]
-
-    return df
-
-
-
-def build_company_relative_efficiency_dfs(
-    pivot: pd.DataFrame,
-    employee_pattern: str,
-    drop_all_zero: bool = True,
-    eps: float = 1e-9,   # 防止除零
-):
+    if not uploads:
+        if streaming:
+            return ScanDataset.from_stream(default_path, dataset_id, mode=CUBE_MODE)
+        raw = read_export_cached(default_path, dataset_id.split("::", 1)[1])
+        return ScanDataset.from_frame(preprocess(raw), dataset_id, mode=CUBE_MODE)
+
+    parts = parse_uploads(uploads, streaming)
+    if len(parts) == 1:
+        return parts[0]
+    return ScanDataset.combine(parts, dataset_id, reread=lambda i: iter_preprocessed(uploads[i]))
+
+@timed("append_uploads")
+def append_uploads(ds: ScanDataset, uploads: list, streaming: bool) -> ScanDataset:
     """
-    公司内比较版本：
-    - hour_mean 用公司内部员工的每小时均值
-    - residual 也用公司内部 hour_mean 做去趋势
+    追加模式：只解析、清洗新上传的导出，合并进当前数据集（同一份文件不会重复追加）
     """
+    new = [u for u in uploads if upload_digest(u) not in ds.sources]
+    if streaming:
+        for u in new:  # 流式：逐份、逐块追加，保持内存有界
+            ds = ds.appended(iter_preprocessed(u), upload_digest(u))
+        return ds
+    for u, part in zip(new, parse_uploads(new, streaming) if new else []):
+        ds = ds.appended([part.rows], upload_digest(u))
+    return ds
 
-    df = pivot.copy()
-    df.index = df.index.astype(str).str.strip()
-    df.columns = [str(c).strip() for c in df.columns]
-
-    def bin_start(tb: str) -> int:
-        return int(str(tb).split("-")[0])
-
-    time_bins = sorted(df.columns, key=bin_start)
-    df = df[time_bins]
-
-    # 选公司员工
-    mask = df.index.str.contains(employee_pattern, flags=re.IGNORECASE, regex=True, na=False)
-    df_emp = df.loc[mask].copy()
-
-    if drop_all_zero:
-        df_emp = df_emp.loc[(df_emp != 0).any(axis=1)]
-
-    # ✅ 公司内部“货量基准”：每小时公司内部均值
-    hour_mean_in_company = df_emp.mean(axis=0).replace(0, np.nan)
-
-    # Relative Efficiency（公司内）
-    df_rel_eff = df_emp.div(hour_mean_in_company + eps, axis=1)
 
-    # De-trended residual（公司内）
-    residual = df_emp.sub(hour_mean_in_company, axis=1)
 
-    # 图3汇总指标
-    df_summary = pd.DataFrame(index=df_emp.index)
-    df_summary["Avg_Relative_Efficiency"] = df_rel_eff.mean(axis=1)
-    df_summary["DeTrended_Std"] = residual.std(axis=1)
-    df_summary["DeTrended_CV"] = df_summary["DeTrended_Std"] / df_summary["Avg_Relative_Efficiency"].replace(0, np.nan)
-
-    return df_rel_eff, df_summary
-
-
-
-# ===== Shift 过滤（重点：Night(23-07) 跨日但归属前一天）=====
-def filter_by_shift(df_in: pd.DataFrame, start_date, end_date, shift_label: str) -> pd.DataFrame:
-    df2 = df_in.copy()
-    hr = df2["op_time"].dt.hour
-
-    if shift_label == "Early (07-15)":
-        df2["shift_date"] = df2["op_time"].dt.date
-        cond_shift = (hr >= 7) & (hr < 15)
-
-    elif shift_label == "Mid (15-23)":
-        df2["shift_date"] = df2["op_time"].dt.date
-        cond_shift = (hr >= 15) & (hr < 23)
-
-    else:  # Night (23-07)
-        # 23:00-23:59 => shift_date = 当天
-        # 00:00-06:59 => shift_date = 前一天
-        shift_date = df2["op_time"].dt.date
-        shift_date = np.where(hr < 7, (df2["op_time"] - pd.Timedelta(days=1)).dt.date, shift_date)
-        df2["shift_date"] = shift_date
-        cond_shift = (hr >= 23) | (hr < 7)
-
-    cond_date = (df2["shift_date"] >= start_date) & (df2["shift_date"] <= end_date)
-    return df2[cond_shift & cond_date].copy()
-
-# ===== 图1：柱顶 total + sorter% =====
-def fig_sorter_vs_total(pivot: pd.DataFrame, time_bins: list, sorter_name: str):
-    p = pivot.reindex(columns=time_bins).apply(pd.to_numeric, errors="coerce").fillna(0)
-
-    total_series = p.sum(axis=0)
-    sorter_series = p.loc[sorter_name] if sorter_name in p.index else pd.Series(0, index=time_bins)
-    sorter_series = sorter_series.reindex(time_bins).fillna(0)
-    others_series = total_series - sorter_series
-
-    total_safe = total_series.replace(0, np.nan)
-    share_pct = (sorter_series / total_safe * 100).round(1)
-    share_text = ["" if pd.isna(v) else f"{v:.1f}%" for v in share_pct.values]
-
-    fig = go.Figure()
-
-    fig.add_bar(
-        x=time_bins,
-        y=others_series.values,
-        name="Others (All non-sorter)",
-        hovertemplate="Time Bin: %{x}<br>Others: %{y}<extra></extra>",
-        marker=dict(opacity=0.85),
-    )
-
-    fig.add_bar(
-        x=time_bins,
-        y=sorter_series.values,
-        name="Sorter",
-        hovertemplate=(
-            "Time Bin: %{x}<br>"
-            "Sorter: %{y}<br>"
-            "Sorter Share: %{customdata}%<extra></extra>"
-        ),
-        customdata=share_pct.values,
-        marker=dict(opacity=0.95),
-    )
-
-    fig.add_scatter(
-        x=time_bins,
-        y=total_series.values,
-        mode="text",
-        text=[f"{int(v)}" for v in total_series.values],
-        textposition="top center",
-        textfont=dict(size=14),
-        showlegend=False,
-        hoverinfo="skip",
-    )
-
-    y_mid = (others_series + sorter_series / 2).values
-    fig.add_scatter(
-        x=time_bins,
-        y=y_mid,
-        mode="text",
-        text=share_text,
-        textposition="middle center",
-        textfont=dict(size=14),
-        showlegend=False,
-        hoverinfo="skip",
-    )
-
-    fig.update_layout(barmode="stack", bargap=0.28)
-    fig = style_layout_common(fig, time_bins, y_title="Scan Count")
-    return fig
+# ===== 历史归档：上传即入库，查询只读所选日期 / shift 覆盖的分区 =====
+@timed("archive_uploads")
+def archive_uploads(uploads: list, default_path: str) -> None:
+    """
+    把本次上传（没有上传时为默认文件）逐块写进归档；已入库的内容直接跳过
+    """
+    sources = [(u, upload_digest(u)) for u in uploads] if uploads else [(default_path, file_digest(default_path))]
+    for source, digest in sources:
+        if not is_archived(digest):
+            archive_export(source, digest)
 
-# ===== 图2：每个点显示数值 =====
-def fig_labor_group_lines(pivot: pd.DataFrame, time_bins: list):
-    p = pivot.reindex(columns=time_bins).apply(pd.to_numeric, errors="coerce").fillna(0)
-
-    jou_sum = p.loc[p.index.str.startswith("JOU"), time_bins].sum(axis=0)
-    rd_sum  = p.loc[p.index.str.startswith("RD"),  time_bins].sum(axis=0)
-    pr_sum  = p.loc[p.index.str.startswith("pr"),  time_bins].sum(axis=0)
-
-    def add_line(fig, name, y):
-        fig.add_scatter(
-            x=time_bins,
-            y=y.values,
-            mode="lines+markers+text",
-            name=name,
-            text=[int(v) for v in y.values],
-            textposition="top center",
-            textfont=dict(size=12),
-            hovertemplate=f"Time Bin: %{{x}}<br>{name}: %{{y}}<extra></extra>",
-        )
+# ===== 数据集仓库：所有 session 共用一份数据集，session 只记 dataset_id + 筛选状态 =====
+@st.cache_resource
+def get_dataset_store() -> DatasetStore:
+    return DatasetStore()
 
-    fig = go.Figure()
-    add_line(fig, "JOU", jou_sum)
-    add_line(fig, "RD", rd_sum)
-    add_line(fig, "pr", pr_sum)
+def session_key() -> str:
+    return st.session_state.setdefault("_session_key", uuid.uuid4().hex)
 
-    fig = style_layout_common(fig, time_bins, y_title="Total Volume")
+def acquire_dataset(dataset_id: str, load, message: str = "Loading scan exports…") -> ScanDataset:
+    """
+    本 session 租用 dataset_id；仓库里还没有时加载一次（其他 session 同时打开会等这一次加载）
+    """
+    def load_with_spinner():
+        with st.spinner(message):
+            return load()
+    return get_dataset_store().acquire(session_key(), dataset_id, load_with_spinner)
+
+def load_archive_range(version: str, d0, d1, shift: str) -> ScanDataset:
+    # version 进 key：归档新增导出后重新读取
+    key = f"archive-range::{version}:{d0}:{d1}:{shift}"
+    return acquire_dataset(key, lambda: open_archive(d0, d1, shift, mode=CUBE_MODE), "Reading archive partitions…")
+
+# ===== 计算结果缓存：(dataset, 日期范围, shift) -> pivot / 各组效率表 =====
+@st.cache_resource
+def get_result_cache() -> ResultCache:
+    return ResultCache(RESULT_CACHE_MB * 2**20)
+
+@st.cache_resource
+def get_prefetcher() -> Prefetcher:
+    return Prefetcher(get_result_cache())
+
+# ===== 每日汇总：(shift_date, shift, Operator) 物化表，趋势视图只读它 =====
+@st.cache_resource
+def get_rollup_registry() -> RollupRegistry:
+    return RollupRegistry()
+
+@st.cache_resource(max_entries=2, show_spinner="Updating daily rollups…")
+def load_archive_rollups(version: str) -> pd.DataFrame:
+    # version 进 key：归档新增导出后只补算分区变化了的日期
+    return refresh_archive_rollup()[0]
+
+# ===== 图表缓存：(图表名, 输入哈希) -> (Figure, JSON 字节数) =====
+def inputs_digest(*inputs) -> str:
+    """
+    图表输入的内容哈希：DataFrame / Series 按值 + 行列标签哈希，其余参数用 repr
+    """
+    h = hashlib.md5()
+    for obj in inputs:
+        if isinstance(obj, (pd.DataFrame, pd.Series)):
+            h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+            if isinstance(obj, pd.DataFrame):
+                h.update(repr(list(obj.columns)).encode())
+        else:
+            h.update(repr(obj).encode())
+        h.update(b"|")
+    return h.hexdigest()
+
+@st.cache_resource
+def get_figure_cache() -> ResultCache:
+    return ResultCache(FIGURE_CACHE_MB * 2**20, getsizeof=lambda v: v[1])
+
+def cached_figure(name: str, build, *inputs):
+    """
+    输入不变就直接复用上次建好的 Figure；顺便记录每张图发给浏览器的 JSON 字节数
+    """
+    def compute():
+        with stage(f"build_figure[{name}]"):
+            fig = build(*inputs)
+        with stage(f"to_json[{name}]"):
+            return fig, len(pio.to_json(fig, validate=False))
+
+    fig, nbytes = get_figure_cache().get_or_compute((name, inputs_digest(*inputs)), compute)
+    st.session_state.setdefault("_chart_payloads", {})[name] = nbytes
     return fig
 
-# ***************************** 各组数据可视化 *******************************************
-
+def show_chart(fig, name: str):
+    with stage(f"plotly_chart[{name}]"):
+        st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False, "responsive": True})
 
-def make_employee_curve_fig(df_emp: pd.DataFrame, title: str):
-    plot_df = df_emp.copy()
-
-    # time_bins：确保按列顺序显示
-    time_bins = [str(c).strip() for c in plot_df.columns]
-    n_emp = plot_df.shape[0]
-
-    fig = go.Figure()
-
-    # 1) 员工曲线
-    for emp in plot_df.index:
-        y = plot_df.loc[emp].values
-        fig.add_scatter(
-            x=time_bins,
-            y=y,
-            mode="lines+markers",
-            name=str(emp),
-            hovertemplate=f"Time Bin: %{{x}}<br>{emp}: %{{y}}<extra></extra>",
+def render_stage_panel(log):
+    """
+    侧栏调试面板：本次 rerun 各阶段耗时 / 行数 / RSS 变化（缩进表示嵌套）
+    """
+    with st.sidebar.expander(f"Stage timings · {log.total_seconds() * 1000:,.0f} ms", expanded=True):
+        st.dataframe(
+            pd.DataFrame({
+                "stage": ["\u2003" * r.depth + r.name for r in log.records],
+                "ms": [round(r.seconds * 1000, 1) for r in log.records],
+                "rows": [r.rows for r in log.records],
+                "ΔRSS MB": [round(r.rss_delta_mb, 1) for r in log.records],
+            }),
+            hide_index=True,
+            use_container_width=True,
         )
 
-    # 2) 全局平均值（所有员工 × 所有 time-bin）
-    if not plot_df.empty:
-        global_avg = float(np.nanmean(plot_df.to_numpy()))
-    else:
-        global_avg = 0.0
-
-    benchmark = 600  # 写死
-
-    # 3) benchmark 横线（细线 + 无文字）
-    fig.add_hline(
-        y=benchmark,
-        line_width=1,
-        line_dash="solid",
-        line_color="rgba(0,0,0,0.55)"
-    )
-
-    # 4) 全局平均横线（细虚线 + 有文字）
-    fig.add_hline(
-        y=global_avg,
-        line_width=1,
-        line_dash="dash",
-        line_color="rgba(0,0,0,0.55)",
-        annotation_text=f"Overall Avg = {global_avg:.1f}",
-        annotation_position="bottom right",
-    )
-
-    # 5) legend 位置保持不变
-    fig.update_layout(
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=1.14,
-            xanchor="left",
-            x=0.02,
-        ),
+def finish_stage_log(log):
+    """
+    本次 rerun 结束：阶段计时面板 / JSON 日志（fragment 单独重跑时不计时）
+    """
+    if log is None:
+        return
+    if st.session_state.get("stage_timings"):
+        render_stage_panel(log)
+    if STAGE_LOG_JSON:
+        log.emit_json()
+    stop_stage_log()
+
+def render_kpi_row(pivot: pd.DataFrame, time_bins: list):
+    total_all, sorter_all, share, peak_tb, peak_val = kpi_summary(pivot, time_bins, DEFAULT_SORTER_NAME)
+    k1, k2, k3, k4 = st.columns(4)
+    k1.metric("Total Volume", f"{total_all:,}")
+    k2.metric("Sorter Volume", f"{sorter_all:,}")
+    k3.metric("Sorter Share", f"{share:.1f}%")
+    k4.metric("Peak Time Bin", f"{peak_tb}", f"{peak_val:,}")
+
+# ===== 实时模式：进程内每个数据源只跟随一份，所有 session 共用 =====
+@st.cache_resource(show_spinner=False)
+def get_live_feed(source: str) -> LiveFeed:
+    return LiveFeed(source, mode=CUBE_MODE)
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def render_live_view(source: str):
+    """
+    每 LIVE_REFRESH_SECONDS 秒只重跑这一块：读新增扫描 -> 折叠进当前 shift -> KPI + 图1
+    """
+    try:
+        snap = get_live_feed(source).refresh(min_interval=LIVE_REFRESH_SECONDS / 2)
+    except (OSError, ValueError) as e:
+        st.error(f"Live feed error: {e}")
+        return
+    if snap is None:
+        st.info(f"Waiting for scans from {source} …")
+        return
+
+    pivot, time_bins = snap["pivot"], snap["time_bins"]
+    st.markdown(
+        f'<div class="small-note">🔴 Live · {snap["time_context"]} · Shift: <b>{snap["shift"]}</b> · '
+        f'Records: {snap["n_records"]:,} · Operators: {snap["n_operators"]:,} · '
+        f'Outside shift (dropped): {snap["n_dropped"]:,}</div>',
+        unsafe_allow_html=True
     )
+    st.markdown('<hr class="soft"/>', unsafe_allow_html=True)
+    render_kpi_row(pivot, time_bins)
+    st.write("")
 
-    # 6) 统一风格
-    fig = style_layout_common(fig, time_bins, y_title="Scan Count")
-    return fig
-
-
-
-
-
-def make_quadrant_fig(df_summary: pd.DataFrame, title: str, y_ref: str = "median"):
-    dfp = (
-        df_summary.replace([np.inf, -np.inf], np.nan)
-                  .dropna(subset=["Avg_Relative_Efficiency", "DeTrended_CV"])
-                  .copy()
-    )
-    n_emp = dfp.shape[0]
-
-    x_ref = 1.0
-    y_ref_val = dfp["DeTrended_CV"].median() if y_ref == "median" else dfp["DeTrended_CV"].mean()
-
-    x_min, x_max = float(dfp["Avg_Relative_Efficiency"].min()), float(dfp["Avg_Relative_Efficiency"].max())
-    y_min, y_max = float(dfp["DeTrended_CV"].min()), float(dfp["DeTrended_CV"].max())
-
-    x_pad = (x_max - x_min) * 0.08 if x_max > x_min else 0.2
-    y_pad = (y_max - y_min) * 0.10 if y_max > y_min else 0.2
-    x_min -= x_pad; x_max += x_pad
-    y_min = max(0, y_min - y_pad); y_max += y_pad
-
-    fig = go.Figure()
-
-    fig.add_trace(go.Scatter(
-        x=dfp["Avg_Relative_Efficiency"],
-        y=dfp["DeTrended_CV"],
-        mode="markers+text",
-        text=[str(i) for i in dfp.index],
-        textposition="top center",
-        hovertemplate="Employee=%{text}<br>AvgRel=%{x:.2f}<br>DeTrendedCV=%{y:.2f}<extra></extra>",
-        showlegend=False,
-    ))
-
-    # 四象限背景
-    fig.add_shape(type="rect", x0=x_min, x1=x_ref, y0=y_min, y1=y_ref_val, layer="below",
-                  line_width=0, fillcolor="rgba(0,0,0,0.03)")
-    fig.add_shape(type="rect", x0=x_ref, x1=x_max, y0=y_min, y1=y_ref_val, layer="below",
-                  line_width=0, fillcolor="rgba(0,0,0,0.03)")
-    fig.add_shape(type="rect", x0=x_min, x1=x_ref, y0=y_ref_val, y1=y_max, layer="below",
-                  line_width=0, fillcolor="rgba(220, 53, 69, 0.18)")
-    fig.add_shape(type="rect", x0=x_ref, x1=x_max, y0=y_ref_val, y1=y_max, layer="below",
-                  line_width=0, fillcolor="rgba(0,0,0,0.03)")
-
-    fig.add_vline(x=x_ref, line_width=1, line_dash="dash")
-    fig.add_hline(y=y_ref_val, line_width=1, line_dash="dash")
-
-    # 象限标签
-    x_left  = x_min + 0.5 * (x_ref - x_min)
-    x_right = x_ref + 0.5 * (x_max - x_ref)
-    y_low   = y_min + 0.5 * (y_ref_val - y_min)
-    y_high  = y_ref_val + 0.5 * (y_max - y_ref_val)
-    label_style = dict(showarrow=False, align="center",
-                       bordercolor="rgba(0,0,0,0.15)", borderwidth=1,
-                       bgcolor="rgba(255,255,255,0.9)", font=dict(size=12))
-    fig.add_annotation(x=x_left,  y=y_high, text="Low & Unstable",  **label_style)
-    fig.add_annotation(x=x_right, y=y_high, text="High & Unstable", **label_style)
-    fig.add_annotation(x=x_left,  y=y_low,  text="Low & Stable",    **label_style)
-    fig.add_annotation(x=x_right, y=y_low,  text="High & Stable",   **label_style)
-
-    fig.update_layout(
-        #title=dict(text=f"{title} (n={n_emp})", x=0.02, xanchor="left"),
-        height=520,
-        plot_bgcolor="white",
-        paper_bgcolor="white",
-        margin=dict(l=60, r=40, t=70, b=60),
-    )
-    fig.update_xaxes(
-        title="Avg Relative Efficiency (within company)",
-        range=[x_min, x_max],
-        showline=True, linecolor="rgba(0,0,0,0.55)", linewidth=1,
-        ticks="outside",
-        gridcolor="rgba(0,0,0,0.07)",
-        zeroline=False,
-    )
-    fig.update_yaxes(
-        title="De-trended CV (within company)",
-        range=[y_min, y_max],
-        showline=True, linecolor="rgba(0,0,0,0.55)", linewidth=1,
-        ticks="outside",
-        gridcolor="rgba(0,0,0,0.07)",
-        zeroline=False,
-    )
-    return fig
+    st.markdown('<div class="card">', unsafe_allow_html=True)
+    st.subheader("Sorter vs Total Volume")
+    st.caption(f"Active shift so far, {snap['bin_minutes']}-minute bins; refreshes every {LIVE_REFRESH_SECONDS:g}s")
+    fig = cached_figure("Live Sorter vs Total", fig_sorter_vs_total, pivot, time_bins, DEFAULT_SORTER_NAME)
+    show_chart(fig, "Live Sorter vs Total")
+    st.markdown('</div>', unsafe_allow_html=True)
 
 # ======================
-# Load & process (raw)
+# 阶段计时：开关打开时本次 rerun 的各阶段记录到 stage_log，关闭时 stage() 几乎零开销
 # ======================
-try:
-    raw_default = load_raw(DEFAULT_FILE_PATH)
-    df0 = preprocess(raw_default)
-except Exception as e:
-    st.error(f"Failed to load default file: {e}")
-    st.stop()
+if st.session_state.get("stage_timings", STAGE_TIMINGS_DEFAULT) or STAGE_LOG_JSON:
+    st.session_state["_rerun_no"] = st.session_state.get("_rerun_no", 0) + 1
+    stage_log = start_stage_log(run_label=f"rerun-{st.session_state['_rerun_no']}")
+else:
+    stage_log = None
+    stop_stage_log()
 
-min_d, max_d = df0["op_date"].min(), df0["op_date"].max()
+# 本 session 正在 rerun：后台预取先让路，rerun 结束时（schedule / cancel）再继续
+get_prefetcher().busy(session_key())
 
 # ======================
 # Sidebar (精简版：只保留 3 个控件)
@@ -580,21 +346,85 @@ min_d, max_d = df0["op_date"].min(), df0["op_date"].max()
 # Sidebar: 先上传文件
 # ======================
 st.sidebar.header("Controls")
-uploaded = st.sidebar.file_uploader("Upload Excel", type=["xlsx"], key="uploader")
+uploads = st.sidebar.file_uploader(
+    "Upload Excel / CSV", type=["xlsx", "csv"], accept_multiple_files=True, key="uploader",
+    help="Several exports (e.g. a week of daily files) are parsed in parallel and combined into one dataset.",
+)
+streaming = st.sidebar.toggle(
+    "Streaming ingest (large exports)",
+    key="streaming",
+    help="Read the export in chunks straight into hourly aggregates; the full scan table is never held in memory.",
+)
+append_mode = st.sidebar.toggle(
+    "Append uploads to current dataset",
+    key="append_mode",
+    help="Merge each new export into the loaded dataset; scans already seen (same operator, waybill and time) are skipped.",
+)
+st.sidebar.toggle(
+    "Stage timings (debug)",
+    value=STAGE_TIMINGS_DEFAULT,
+    key="stage_timings",
+    help="Time each pipeline stage of this rerun (rows, memory delta) and show it at the bottom of the sidebar.",
+)
+archive_mode = st.sidebar.toggle(
+    "Scan archive",
+    key="archive_mode",
+    help="Keep every upload in a local date-partitioned archive and analyze any date range from it; "
+         "only the partitions for the selected shift dates are read.",
+)
+live_mode = st.sidebar.toggle(
+    "Live feed (active shift)",
+    key="live_mode",
+    help="Follow a growing CSV / JSONL scan log or a tcp://host:port feed instead of an uploaded export.",
+)
+
+# ======================
+# 实时模式：只显示当前 shift 的 KPI + 图1，其余批量页面不渲染
+# ======================
+if live_mode:
+    live_source = st.sidebar.text_input("Feed source", value=LIVE_FEED, key="live_source")
+    st.title("📦 Operational Excellence Analytics")
+    get_dataset_store().release(session_key())  # 实时视图不用批量数据集，不占着共享仓库
+    get_prefetcher().cancel(session_key())
+    render_live_view(live_source)
+    finish_stage_log(stage_log)
+    st.stop()
 
 # ======================
 # 先确定数据源，再 preprocess 得到全量 df_all（未过滤）
+# 流式模式：不物化 df_all，直接得到立方体
 # ======================
+store = get_dataset_store()
 try:
-    dataset_id = get_dataset_id(uploaded, DEFAULT_FILE_PATH)
-    raw = read_current_raw(uploaded, DEFAULT_FILE_PATH)
-    df_all = preprocess(raw)
+    current = store.get(st.session_state.get("dataset_id"))
+    if archive_mode:
+        # 归档模式：数据集随日期范围 / shift 变化，选好之后再读分区（见“应用筛选”）
+        archive_uploads(uploads, DEFAULT_FILE_PATH)
+        days = archive_days()
+        if not days:
+            raise ValueError("the scan archive is empty")
+        ds, dataset_id = None, "archive::" + archive_version()
+        min_day, max_day = days[0], days[-1]
+    else:
+        if append_mode and current is not None:
+            ds = store.put(session_key(), append_uploads(current, uploads, streaming))
+        else:
+            dataset_id = get_dataset_id(uploads, DEFAULT_FILE_PATH)
+            ds = acquire_dataset(dataset_id, lambda: load_dataset(dataset_id, uploads, DEFAULT_FILE_PATH, streaming))
+        dataset_id = ds.dataset_id
+        min_day, max_day = ds.cube.day_range()
 except Exception as e:
+    get_prefetcher().cancel(session_key())
     st.error(f"Failed to load/parse file: {e}")
     st.stop()
 
-min_d = df_all["op_date"].min()
-max_d = df_all["op_date"].max()
+if ds is None:
+    st.sidebar.caption(f"Scan archive: {len(days)} days · {day_to_date(days[0])} … {day_to_date(days[-1])}")
+elif len(ds.sources) > 1:
+    added, skipped = ds.last_append or (0, 0)
+    st.sidebar.caption(f"{len(ds.sources)} exports merged · last append: +{added:,} scans, {skipped:,} duplicates skipped")
+
+min_d, max_d = day_to_date(min_day), day_to_date(max_day)
 
 # ======================
 # 数据集变化时：重置控件状态（关键）
@@ -603,8 +433,15 @@ if "dataset_id" not in st.session_state:
     st.session_state["dataset_id"] = dataset_id
 
 if dataset_id != st.session_state["dataset_id"]:
-    st.session_state["date_range"] = (min_d, max_d)
-    st.session_state["shift"] = SHIFT_OPTIONS[0]
+    prev_id = st.session_state["dataset_id"]
+    extended = ds.parent_id == prev_id if ds is not None else prev_id.startswith("archive::")
+    if extended and "date_range" in st.session_state:
+        # 追加 / 归档新增导出：保留 shift 和起始日期，只把结束日期延伸到新数据
+        d_start = st.session_state["date_range"][0]
+        st.session_state["date_range"] = (min(max(d_start, min_d), max_d), max_d)
+    else:
+        st.session_state["date_range"] = (min_d, max_d)
+        st.session_state["shift"] = SHIFT_OPTIONS[0]
     st.session_state["dataset_id"] = dataset_id
     st.rerun()
 
@@ -632,6 +469,24 @@ shift = st.sidebar.radio(
     key="shift"
 )
 
+bin_minutes = st.sidebar.radio(
+    "Time bin",
+    options=TIME_BIN_OPTIONS,
+    index=TIME_BIN_OPTIONS.index(DEFAULT_BIN_MINUTES),
+    format_func=lambda m: "1 h" if m == 60 else f"{m} min",
+    horizontal=True,
+    key="bin_minutes",
+    help="Finer bins (e.g. 5 min) make short belt stoppages visible.",
+)
+
+efficiency_basis = st.sidebar.radio(
+    "Efficiency basis",
+    options=["Clock hours", "Active minutes"],
+    horizontal=True,
+    key="efficiency_basis",
+    help=f"Active minutes count only gaps of up to {IDLE_GAP_MINUTES:g} min between an operator's consecutive scans.",
+)
+
 
 # ======================
 # 应用筛选
@@ -641,24 +496,51 @@ if isinstance(date_range, tuple) and len(date_range) == 2:
 else:
     d0, d1 = min_d, max_d
 
-df = filter_by_shift(df_all, d0, d1, shift)
+result_cache = get_result_cache()
+
+def selected_dataset() -> ScanDataset:
+    # 归档模式：只读所选日期范围 + shift 覆盖的分区
+    return ds if ds is not None else load_archive_range(dataset_id, d0, d1, shift)
+
+res = result_cache.get_or_compute(
+    (dataset_id, d0, d1, shift, bin_minutes), lambda: run_pipeline(selected_dataset(), d0, d1, shift, bin_minutes)
+)
+
+def selection_gaps() -> dict:
+    """
+    所选 (日期范围, shift) 的扫描间隔统计（与时间段粒度无关）；流式入库的数据集没有明细，返回 {}
+    """
+    def compute():
+        sel = selected_dataset()
+        if sel.rows is None:
+            return {}
+        return scan_gaps(filter_by_shift(sel.rows, d0, d1, shift, time_sorted=True))
+    return get_result_cache().get_or_compute((dataset_id, d0, d1, shift, "gaps"), compute)
+
+cache_stats = result_cache.stats()
+prefetch_stats = get_prefetcher().stats()
+store_stats = store.stats()
+st.sidebar.caption(
+    f"Result cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · "
+    f"{cache_stats['entries']} entries · {cache_stats['mb']:.1f} MB"
+)
+st.sidebar.caption(
+    f"Prefetch: {cache_stats['prefetched']} ready · {cache_stats['prefetch_hits']} used · "
+    f"{prefetch_stats['computed']} computed · {prefetch_stats['cancelled']} cancelled · "
+    f"{prefetch_stats['over_budget']} over budget"
+)
+st.sidebar.caption(
+    f"Shared datasets: {store_stats['datasets']} in memory · {store_stats['mb']:.1f} MB · "
+    f"{store_stats['sessions']} sessions"
+)
 
 
 # ======================
 # Build pivot + KPI + header context
 # ======================
-pivot, time_bins = build_pivot(df)
+pivot, time_bins = res["pivot"], res["time_bins"]
 
-time_context = compute_time_context(df)
-total_all, sorter_all, share, peak_tb, peak_val = kpi_summary(pivot, time_bins, DEFAULT_SORTER_NAME)
-
-df_jou = build_employee_efficiency_df(pivot, include_pattern=r"^JOU")
-df_rd  = build_employee_efficiency_df(pivot, include_pattern=r"^RD")
-df_pr  = build_employee_efficiency_df(pivot, include_pattern=r"^pr")
-
-df_jou_rel, df_jou_sum = build_company_relative_efficiency_dfs(pivot, r"^JOU")
-df_rd_rel,  df_rd_sum  = build_company_relative_efficiency_dfs(pivot, r"^RD")
-df_pr_rel,  df_pr_sum  = build_company_relative_efficiency_dfs(pivot, r"^pr")
+time_context = res["time_context"]
 
 # ======================
 # Header
@@ -667,7 +549,7 @@ left, right = st.columns([0.72, 0.28], vertical_alignment="bottom")
 with left:
     st.title("📦 Operational Excellence Analytics")
     st.markdown(
-        f'<div class="small-note">{time_context} · Shift: <b>{shift}</b> · Records: {len(df):,} · Operators: {df["Operator"].nunique():,}</div>',
+        f'<div class="small-note">{time_context} · Shift: <b>{shift}</b> · Records: {res["n_records"]:,} · Operators: {res["n_operators"]:,}</div>',
         unsafe_allow_html=True
     )
 with right:
@@ -680,19 +562,15 @@ with right:
 st.markdown('<hr class="soft"/>', unsafe_allow_html=True)
 
 # KPI row
-k1, k2, k3, k4 = st.columns(4)
-k1.metric("Total Volume", f"{total_all:,}")
-k2.metric("Sorter Volume", f"{sorter_all:,}")
-k3.metric("Sorter Share", f"{share:.1f}%")
-k4.metric("Peak Time Bin", f"{peak_tb}", f"{peak_val:,}")
+render_kpi_row(pivot, time_bins)
 
 st.write("")
 
 # ======================
 # Figures
 # ======================
-fig1 = fig_sorter_vs_total(pivot, time_bins, DEFAULT_SORTER_NAME)
-fig2 = fig_labor_group_lines(pivot, time_bins)
+fig1 = cached_figure("Sorter vs Total", fig_sorter_vs_total, pivot, time_bins, DEFAULT_SORTER_NAME)
+fig2 = cached_figure("Labor Group Volume", fig_labor_group_lines, pivot, time_bins, res["row_groups"])
 
 # ======================
 # Two cards side-by-side
@@ -704,7 +582,7 @@ with col1:
     st.subheader("Sorter vs Total Volume")
     st.caption("Stacked hourly volume; top label = Total, inner label = Sorter share")
     st.markdown("<div style='height:6px'></div>", unsafe_allow_html=True)
-    st.plotly_chart(fig1, use_container_width=True, config={"displayModeBar": False, "responsive": True})
+    show_chart(fig1, "Sorter vs Total")
     st.markdown('</div>', unsafe_allow_html=True)
 
 with col2:
@@ -712,7 +590,7 @@ with col2:
     st.subheader("Total Sorting Volume by Labor Group")
     st.caption("Hourly throughput split by labor provider; each node shows volume")
     st.markdown("<div style='height:6px'></div>", unsafe_allow_html=True)
-    st.plotly_chart(fig2, use_container_width=True, config={"displayModeBar": False, "responsive": True})
+    show_chart(fig2, "Labor Group Volume")
     st.markdown('</div>', unsafe_allow_html=True)
 
 st.write("")
@@ -730,56 +608,51 @@ st.markdown(
 )
 
 
-################### 图下总结 ########################
-
-def calc_team_avg_hourly_scan(df_emp: pd.DataFrame) -> float:
-    """
-    团队“平均每小时 Scan Count”：所有员工 × 所有 time-bin 的均值（= 一条横线的 y）
-    """
-    if df_emp is None or df_emp.empty:
-        return 0.0
-    return float(np.nanmean(df_emp.to_numpy()))
-
-def pick_bottom_3_efficiency(df_sum: pd.DataFrame) -> list[str]:
-    """
-    从象限图来源 df_sum 中选效率最低 3 名员工：
-    以 Avg_Relative_Efficiency 越小越低
-    """
-    if df_sum is None or df_sum.empty or "Avg_Relative_Efficiency" not in df_sum.columns:
-        return []
-
-    s = df_sum["Avg_Relative_Efficiency"].replace([np.inf, -np.inf], np.nan).dropna()
-    if s.empty:
-        return []
-
-    return [str(x) for x in s.nsmallest(3).index.tolist()]
-
-
-
 # ---- 2) 一个小 helper：每个劳务组渲染一行（两图并排）
-def render_group_row(group_code: str, df_emp: pd.DataFrame, df_sum: pd.DataFrame):
+def render_group_row(group_code: str, df_emp: pd.DataFrame, df_sum: pd.DataFrame, gaps: dict):
+    active_basis = efficiency_basis == "Active minutes" and bool(gaps)
+    if active_basis:
+        df_sum = active_relative_efficiency(df_emp, df_sum, gaps["operators"])
+
     c1, c2 = st.columns(2, gap="large")
 
     with c1:
         st.markdown('<div class="card">', unsafe_allow_html=True)
         st.subheader(f"{group_code} Employee Efficiency Curves")
-        st.caption("Lines per employee; all employees included.")
-
-        fig_emp = make_employee_curve_fig(df_emp, f"{group_code} Employees Efficiency Curve")
-        st.plotly_chart(fig_emp, use_container_width=True, config={"displayModeBar": False, "responsive": True})
+        if len(df_emp) > LARGE_TEAM_THRESHOLD:
+            st.caption(
+                f"{len(df_emp)} employees: median with P25–P75 / P10–P90 bands; "
+                f"top/bottom {LARGE_TEAM_TOP_N} drawn individually, all others in grey."
+            )
+        else:
+            st.caption("Lines per employee; all employees included.")
+
+        fig_emp = cached_figure(
+            f"{group_code} Curves", make_employee_curve_fig, df_emp, f"{group_code} Employees Efficiency Curve",
+            bin_minutes,
+        )
+        show_chart(fig_emp, f"{group_code} Curves")
         st.markdown('</div>', unsafe_allow_html=True)
 
     with c2:
         st.markdown('<div class="card">', unsafe_allow_html=True)
         st.subheader(f"{group_code} Relative Efficiency Quadrant")
-        st.caption("Avg relative efficiency vs de-trended CV (within the same company).")
-
-        fig_q = make_quadrant_fig(df_sum, f"{group_code} – Avg Relative Efficiency vs De-trended CV", y_ref="median")
-        st.plotly_chart(fig_q, use_container_width=True, config={"displayModeBar": False, "responsive": True})
+        if active_basis:
+            st.caption(
+                "Scans per active hour relative to the group mean vs de-trended CV on the same active-time basis "
+                "(within the same company)."
+            )
+        else:
+            st.caption("Avg relative efficiency vs de-trended CV (within the same company).")
+
+        fig_q = cached_figure(
+            f"{group_code} Quadrant", make_quadrant_fig, df_sum, f"{group_code} – Avg Relative Efficiency vs De-trended CV"
+        )
+        show_chart(fig_q, f"{group_code} Quadrant")
         st.markdown('</div>', unsafe_allow_html=True)
 
     # ✅ 图下总结（新增）
-    team_avg = calc_team_avg_hourly_scan(df_emp)
+    team_avg = calc_team_avg_hourly_scan(df_emp, bin_minutes)
     bottom3 = pick_bottom_3_efficiency(df_sum)
 
     # bottom3 不足 3 人时的兜底显示
@@ -807,10 +680,128 @@ def render_group_row(group_code: str, df_emp: pd.DataFrame, df_sum: pd.DataFrame
     unsafe_allow_html=True
 )
 
+    render_idle_row(group_code, df_emp, gaps)
+    st.write("")
+
+
+def render_idle_row(group_code: str, df_emp: pd.DataFrame, gaps: dict):
+    """
+    空闲间隔：组内扫描间隔超过阈值的时长分布 + 停顿最长的员工
+    """
+    if not gaps:
+        st.caption("Idle-gap analysis needs the scan rows, which streaming mode does not keep.")
+        return
+    ops = gaps["operators"].reindex(df_emp.index).dropna(how="all")
+    c1, c2 = st.columns(2, gap="large")
+
+    with c1:
+        st.markdown('<div class="card">', unsafe_allow_html=True)
+        st.subheader(f"{group_code} Idle Gaps")
+        st.caption(f"Gaps longer than {IDLE_GAP_MINUTES:g} min between an employee's consecutive scans in this shift.")
+        fig_idle = cached_figure(
+            f"{group_code} Idle Gaps", make_idle_hist_fig, idle_histogram(gaps["idle"], ops.index, IDLE_GAP_MINUTES)
+        )
+        show_chart(fig_idle, f"{group_code} Idle Gaps")
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    with c2:
+        st.markdown('<div class="card">', unsafe_allow_html=True)
+        st.subheader(f"{group_code} Longest Pauses")
+        st.caption(f"Active minutes {ops['active_minutes'].sum():,.0f} · idle minutes {ops['idle_minutes'].sum():,.0f}")
+        st.dataframe(
+            ops.sort_values("longest_gap_minutes", ascending=False)
+               .head(10)[["longest_gap_minutes", "idle_gaps", "idle_minutes", "active_minutes", "scans"]]
+               .round(1),
+            use_container_width=True,
+        )
+        st.markdown('</div>', unsafe_allow_html=True)
+
+
+# ---- 3) 每个劳务组一个独立 fragment：展开才计算，切换某一组只重跑这一组
+@st.fragment
+def render_group_section(group_code: str, res: dict, result_key: tuple):
+    shown = st.toggle(
+        f"{group_code} ({int((res['row_groups'] == group_code).sum())} employees)",
+        value=group_code in DEEP_DIVE_DEFAULT,
+        key=f"deep_dive_{group_code}",
+    )
+    if not shown:
+        return
+    g = get_result_cache().get_or_compute(result_key + (group_code,), lambda: run_group(res, group_code))
+    render_group_row(group_code, g["emp"], g["sum"], selection_gaps())
+
+for group_code in LABOR_GROUPS:
+    render_group_section(group_code, res, (dataset_id, d0, d1, shift, bin_minutes))
+
+# ---- 4) 每日趋势：逐日的组内效率 / 产出，只读每日汇总（缺的日期按需由立方体补算一次）
+@st.fragment
+def render_trend_section(d0, d1, shift: str):
     st.write("")
+    st.markdown(
+        """
+        <div style="
+            font-size: 28px;
+            font-weight: 400;
+            margin-bottom: 6px;
+        ">
+            📈 Daily Trend
+        </div>
+        """,
+        unsafe_allow_html=True
+    )
+    if not st.toggle("Show day-over-day trend", key="trend_shown"):
+        return
+    c1, c2 = st.columns(2, gap="large")
+    group_code = c1.selectbox("Labor group", list(LABOR_GROUPS), key="trend_group")
+    metric = c2.selectbox("Metric", list(TREND_METRICS), format_func=TREND_METRICS.get, key="trend_metric")
+
+    day_lo, day_hi = date_to_day(d0), date_to_day(d1)
+    with stage("daily_rollup"):
+        if ds is None:
+            table = load_archive_rollups(dataset_id)
+        else:
+            table = get_rollup_registry().for_dataset(ds).ensure(ds, day_lo, day_hi, [shift]).table
+    trend = daily_trend(table, day_lo, day_hi, shift, group_code, metric)
+
+    st.markdown('<div class="card">', unsafe_allow_html=True)
+    st.subheader(f"{group_code} {TREND_METRICS[metric]} by Shift Date")
+    st.caption(
+        f"{trend.shape[0]} employees × {trend.shape[1]} shift dates ({shift}); "
+        f"team median with P25–P75 band, top/bottom {LARGE_TEAM_TOP_N} by period average."
+    )
+    fig = cached_figure(f"{group_code} Trend", make_trend_fig, trend, f"{group_code} daily trend", TREND_METRICS[metric])
+    show_chart(fig, f"{group_code} Trend")
+    st.markdown('</div>', unsafe_allow_html=True)
+
+render_trend_section(d0, d1, shift)
+
+# ---- 5) 每张图发给浏览器的 JSON 大小（跟踪 payload 用）
+with st.sidebar.expander("Chart payloads"):
+    for name, nbytes in st.session_state.get("_chart_payloads", {}).items():
+        st.caption(f"{name}: {nbytes / 1024:.1f} KB")
 
+# ---- 6) 后台预取：页面已经画完，趁用户看图时算好其他 shift / 前后一天的结果
+def prefetch_task(sel: ScanDataset, d0, d1, shift: str, groups: list):
+    """
+    一个相邻选择：主结果 -> 已展开劳务组的效率表 -> 扫描间隔；key 与前台完全相同，下一次点击直接命中
+    """
+    def task(step):
+        key = (dataset_id, d0, d1, shift, bin_minutes)
+        res = step(key, lambda: run_pipeline(sel, d0, d1, shift, bin_minutes))
+        for code in groups:
+            step(key + (code,), lambda: run_group(res, code))
+        if sel.rows is not None:
+            step((dataset_id, d0, d1, shift, "gaps"),
+                 lambda: scan_gaps(filter_by_shift(sel.rows, d0, d1, shift, time_sorted=True)))
+    return task
+
+if ds is None:
+    get_prefetcher().cancel(session_key())  # 归档模式每个选择都要读分区，不预取
+else:
+    shown_groups = [g for g in LABOR_GROUPS if st.session_state.get(f"deep_dive_{g}", g in DEEP_DIVE_DEFAULT)]
+    get_prefetcher().schedule(session_key(), [
+        prefetch_task(ds, a, b, s, shown_groups) for a, b, s in neighbour_selections(d0, d1, shift, min_d, max_d)
+    ])
 
-# ---- 3) 依次渲染三行（每行一个劳务组）
-render_group_row("JOU", df_jou, df_jou_sum)
-render_group_row("RD",  df_rd,  df_rd_sum)
-#render_group_row("pr",  df_pr,  df_pr_sum)
+# ---- 7) 阶段计时面板 / JSON 日志
+finish_stage_log(stage_log)
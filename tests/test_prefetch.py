@@ -0,0 +1,109 @@
+"""
+后台预取（prefetch.py）与结果缓存（result_cache.py）之间的约定：
+- 预取结果只放进空闲空间，不挤掉前台结果
+- 前台请求一个正在预取的 key 时等它算完直接用，不重复计算，记作一次预取命中
+- 任何 session 正在 rerun 时预取不开始新的步骤
+
+    python -m pytest tests -q
+"""
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from prefetch import Prefetcher  # noqa: E402
+from result_cache import ResultCache  # noqa: E402
+
+
+def wait_until(cond, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def cache() -> ResultCache:
+    return ResultCache(100, getsizeof=len)  # 值是 bytes，大小就是长度
+
+
+def prefetch_task(key, value: bytes, gate: threading.Event = None):
+    def compute():
+        if gate is not None:
+            gate.wait(5)
+        return value
+
+    return lambda step: step(key, compute)
+
+
+def test_prefetch_uses_only_free_space(cache):
+    for key in ("a", "b"):
+        cache.get_or_compute(key, lambda: b"x" * 40)
+    prefetcher = Prefetcher(cache, workers=1)
+    prefetcher.schedule("s", [prefetch_task("c", b"y" * 40), prefetch_task("d", b"y" * 10)])
+    wait_until(lambda: prefetcher.computed == 2)
+
+    assert "a" in cache and "b" in cache  # 前台结果都还在
+    assert "c" not in cache  # 放不下：不为它淘汰前台结果
+    assert "d" in cache  # 空闲空间够：放进去
+    assert cache.stats()["prefetched"] == 1
+
+
+def test_foreground_hit_on_prefetched_result(cache):
+    prefetcher = Prefetcher(cache, workers=1)
+    prefetcher.schedule("s", [prefetch_task("k", b"v")])
+    wait_until(lambda: prefetcher.computed == 1)
+
+    assert cache.get_or_compute("k", lambda: pytest.fail("prefetched value recomputed")) == b"v"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["prefetch_hits"], stats["prefetched"]) == (1, 0, 1, 0)
+
+
+def test_foreground_waits_for_inflight_prefetch(cache):
+    gate = threading.Event()
+    prefetcher = Prefetcher(cache, workers=1)
+    prefetcher.schedule("s", [prefetch_task("k", b"v", gate)])
+    wait_until(lambda: cache._inflight)  # 预取已经开始算 k
+
+    results = []
+    fg = threading.Thread(
+        target=lambda: results.append(cache.get_or_compute("k", lambda: pytest.fail("in-flight value recomputed")))
+    )
+    fg.start()
+    wait_until(lambda: cache.stats()["hits"] == 1)  # 前台已经挂在正在算的 key 上
+    gate.set()
+    fg.join(5)
+
+    assert results == [b"v"]
+    stats = cache.stats()
+    assert (stats["misses"], stats["prefetch_hits"], stats["prefetched"]) == (0, 1, 0)
+
+
+def test_prefetch_waits_while_a_session_reruns(cache):
+    prefetcher = Prefetcher(cache, workers=1)
+    prefetcher.busy("other")
+    prefetcher.schedule("s", [prefetch_task("k", b"v")])
+    time.sleep(0.2)
+    assert prefetcher.computed == 0 and "k" not in cache
+
+    prefetcher.cancel("other")  # other 的 rerun 结束
+    wait_until(lambda: prefetcher.computed == 1)
+    assert "k" in cache
+
+
+def test_new_schedule_cancels_queued_steps(cache):
+    gate = threading.Event()
+    prefetcher = Prefetcher(cache, workers=1)
+    prefetcher.schedule("s", [prefetch_task("a", b"1", gate), prefetch_task("b", b"2")])
+    wait_until(lambda: cache._inflight)
+    prefetcher.schedule("s", [prefetch_task("c", b"3")])  # 视图变了
+    gate.set()
+    wait_until(lambda: "c" in cache)
+
+    assert "b" not in cache
+    assert prefetcher.cancelled >= 1
@@ -0,0 +1,86 @@
+"""
+ResultCache（result_cache.py）：内存预算 LRU、命中 / 未命中计数、同一个 key 同时只算一次
+
+    python -m pytest tests -q
+"""
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from result_cache import ResultCache  # noqa: E402
+
+
+def wait_until(cond, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def make_cache(max_bytes: int = 100) -> ResultCache:
+    return ResultCache(max_bytes, getsizeof=len)  # 值是 bytes，大小就是长度
+
+
+def test_hits_and_misses():
+    cache = make_cache()
+    assert cache.get_or_compute("a", lambda: b"x" * 10) == b"x" * 10
+    assert cache.get_or_compute("a", lambda: pytest.fail("cached value recomputed")) == b"x" * 10
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_evicts_least_recently_used_within_budget():
+    cache = make_cache(100)
+    for key in "abc":
+        cache.get_or_compute(key, lambda: b"x" * 40)
+    assert "a" not in cache and "b" in cache and "c" in cache
+    assert cache.stats()["mb"] * 2**20 <= 100
+
+
+def test_value_larger_than_budget_is_returned_but_not_cached():
+    cache = make_cache(100)
+    assert len(cache.get_or_compute("big", lambda: b"x" * 200)) == 200
+    assert "big" not in cache
+
+
+def test_concurrent_requests_compute_once():
+    cache = make_cache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return b"v"
+
+    results = []
+    owner = threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+    owner.start()
+    started.wait(5)
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+    waiter.start()
+    wait_until(lambda: cache.stats()["hits"] == 1)  # 等的一方已经挂在正在算的 key 上
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+    assert results == [b"v", b"v"] and len(calls) == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_failed_computation_is_not_cached():
+    cache = make_cache()
+
+    def boom():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("k", boom)
+    assert "k" not in cache
+    assert cache.get_or_compute("k", lambda: b"ok") == b"ok"